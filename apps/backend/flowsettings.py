@@ -44,6 +44,10 @@ KH_USER_DATA_DIR.mkdir(parents=True, exist_ok=True)
 KH_MARKDOWN_OUTPUT_DIR = KH_APP_DATA_DIR / "markdown_cache_dir"
 KH_MARKDOWN_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# page thumbnails directory
+KH_THUMBNAIL_OUTPUT_DIR = KH_APP_DATA_DIR / "thumbnails_cache_dir"
+KH_THUMBNAIL_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
 # chunks output directory
 KH_CHUNKS_OUTPUT_DIR = KH_APP_DATA_DIR / "chunks_cache_dir"
 KH_CHUNKS_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -94,10 +98,54 @@ KH_DOCSTORE = {
     # "__type__": "kotaemon.storages.SimpleFileDocumentStore",
     "__type__": "kotaemon.storages.LanceDBDocumentStore",
     "path": str(KH_USER_DATA_DIR / "docstore"),
+    # rebuild the full-text index once writes settle instead of on every batch
+    "fts_refresh_delay": config(
+        "KH_DOCSTORE_FTS_REFRESH_DELAY", default=5.0, cast=float
+    ),
+}
+# in-memory LRU for query embeddings, plus an on-disk SQLite tier (same default
+# as main.py), disabled by setting KH_QUERY_EMBEDDING_CACHE_PATH to ""
+KH_QUERY_EMBEDDING_CACHE = {
+    "maxsize": config("KH_QUERY_EMBEDDING_CACHE_SIZE", default=4096, cast=int),
+    "ttl": config("KH_QUERY_EMBEDDING_CACHE_TTL", default=0, cast=float) or None,
+    "path": config(
+        "KH_QUERY_EMBEDDING_CACHE_PATH",
+        default=str(KH_APP_DATA_DIR / "cache" / "query_embeddings.db"),
+    ),
+}
+# multi-file uploads: processes loading/splitting files, threads embedding them.
+# Each process loads a whole file (PDFs are not streamed page by page), so the
+# parallel path is opt-in
+KH_INGESTION_WORKERS = config("KH_INGESTION_WORKERS", default=1, cast=int)
+KH_INGESTION_EMBEDDING_WORKERS = config(
+    "KH_INGESTION_EMBEDDING_WORKERS", default=4, cast=int
+)
+KH_INGESTION_MAX_FILES_IN_FLIGHT = config(
+    "KH_INGESTION_MAX_FILES_IN_FLIGHT", default=16, cast=int
+)
+# on-disk cache of chunk embeddings, so re-indexing only embeds changed chunks
+KH_CHUNK_EMBEDDING_CACHE = {
+    "path": config(
+        "KH_CHUNK_EMBEDDING_CACHE_PATH",
+        default=str(KH_APP_DATA_DIR / "cache" / "chunk_embeddings.db"),
+    ),
+    "ttl": config("KH_CHUNK_EMBEDDING_CACHE_TTL", default=0, cast=float) or None,
+}
+# number of first-round candidates sent to the reranking model, 0 for all
+KH_RERANK_MAX_CANDIDATES = config("KH_RERANK_MAX_CANDIDATES", default=50, cast=int)
+# reranking scores by (model, query, chunk), in memory and in a SQLite file
+KH_RERANK_SCORE_CACHE = {
+    "maxsize": config("KH_RERANK_SCORE_CACHE_SIZE", default=65536, cast=int),
+    "ttl": config("KH_RERANK_SCORE_CACHE_TTL", default=0, cast=float) or None,
+    "path": config(
+        "KH_RERANK_SCORE_CACHE_PATH",
+        default=str(KH_APP_DATA_DIR / "cache" / "rerank_scores.db"),
+    ),
 }
 KH_VECTORSTORE = {
     # "__type__": "kotaemon.storages.LanceDBVectorStore",
     "__type__": "kotaemon.storages.ChromaVectorStore",
+    # "__type__": "kotaemon.storages.MemmapVectorStore",
     # "__type__": "kotaemon.storages.MilvusVectorStore",
     # "__type__": "kotaemon.storages.QdrantVectorStore",
     "path": str(KH_USER_DATA_DIR / "vectorstore"),
@@ -315,6 +363,14 @@ KH_RERANKINGS["cohere"] = {
     },
     "default": True,
 }
+# cross-encoder run in-process on CPU, without network once the model is cached
+KH_RERANKINGS["fast_embed"] = {
+    "spec": {
+        "__type__": "kotaemon.rerankings.FastEmbedReranking",
+        "model_name": "Xenova/ms-marco-MiniLM-L-6-v2",
+    },
+    "default": False,
+}
 
 KH_REASONINGS = [
     "ktem.reasoning.simple.FullQAPipeline",
@@ -356,6 +412,14 @@ SETTINGS_REASONING = {
 USE_GLOBAL_GRAPHRAG = config("USE_GLOBAL_GRAPHRAG", default=True, cast=bool)
 USE_NANO_GRAPHRAG = config("USE_NANO_GRAPHRAG", default=False, cast=bool)
 USE_LIGHTRAG = config("USE_LIGHTRAG", default=True, cast=bool)
+# LightRAG indexing: batches extracted concurrently, and the initial LLM request
+# budget, which is halved on rate limit errors (0 to start unlimited)
+KH_LIGHTRAG_MAX_CONCURRENT_INSERTS = config(
+    "KH_LIGHTRAG_MAX_CONCURRENT_INSERTS", default=4, cast=int
+)
+KH_LIGHTRAG_LLM_REQUESTS_PER_MINUTE = config(
+    "KH_LIGHTRAG_LLM_REQUESTS_PER_MINUTE", default=0, cast=float
+)
 USE_MS_GRAPHRAG = config("USE_MS_GRAPHRAG", default=True, cast=bool)
 
 GRAPHRAG_INDEX_TYPES = []
@@ -0,0 +1,107 @@
+"""Benchmark citation span matching against chunk length
+
+Compares `find_text` with the previous implementation, which ran
+`difflib.SequenceMatcher` over the whole quote and chunk, and checks that both
+return the same spans.
+
+Usage:
+    python benchmarks/bench_citation_matching.py --lengths 1000 5000 20000
+"""
+import argparse
+import random
+import time
+from difflib import SequenceMatcher
+
+from kotaemon.indices.qa.utils import find_text
+
+WORDS = (
+    "agreement party contract clause liability termination notice payment "
+    "obligation warranty breach remedy jurisdiction court damages indemnity "
+    "confidential license term renewal assignment dispute arbitration law "
+    "the of and to in shall be any such by this for with"
+).split()
+
+
+def find_text_difflib(search_span, context, min_length=5):
+    """The previous `find_text`, kept as the reference"""
+    search_span, context = search_span.lower(), context.lower()
+
+    sentence_list = search_span.split("\n")
+    context = context.replace("\n", " ")
+
+    matches_span = []
+    if len(search_span) > min_length:
+        for sentence in sentence_list:
+            match_results = SequenceMatcher(
+                None,
+                sentence,
+                context,
+                autojunk=False,
+            ).get_matching_blocks()
+
+            matched_blocks = []
+            for _, start, length in match_results:
+                if length > max(len(sentence) * 0.25, min_length):
+                    matched_blocks.append((start, start + length))
+
+            if matched_blocks:
+                start_index = min(start for start, _ in matched_blocks)
+                end_index = max(end for _, end in matched_blocks)
+                length = end_index - start_index
+
+                if length > max(len(sentence) * 0.35, min_length):
+                    matches_span.append((start_index, end_index))
+
+    if matches_span:
+        final_span = min(start for start, _ in matches_span), max(
+            end for _, end in matches_span
+        )
+        matches_span = [final_span]
+
+    return matches_span
+
+
+def make_case(length: int, rng: random.Random) -> tuple[str, str]:
+    words: list[str] = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(WORDS))
+    context = " ".join(words)
+
+    # quote a passage with a few paraphrased words, as LLMs tend to do
+    start = rng.randrange(max(len(words) - 40, 1))
+    quote = words[start : start + 30]
+    for _ in range(3):
+        quote[rng.randrange(len(quote))] = rng.choice(WORDS)
+    return " ".join(quote), context
+
+
+def timeit(func, cases) -> tuple[float, list]:
+    start = time.perf_counter()
+    results = [func(quote, context) for quote, context in cases]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--cases", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'chars':>8} {'difflib (ms)':>13} {'matcher (ms)':>13} {'speedup':>8}")
+    for length in args.lengths:
+        cases = [make_case(length, rng) for _ in range(args.cases)]
+        reference, expected = timeit(find_text_difflib, cases)
+        current, results = timeit(find_text, cases)
+        assert results == expected, "spans differ from the difflib implementation"
+
+        reference_ms = reference * 1000 / len(cases)
+        current_ms = current * 1000 / len(cases)
+        print(
+            f"{length:>8} {reference_ms:>13.2f} {current_ms:>13.2f} "
+            f"{reference / current:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark ingest time of LanceDBDocumentStore against corpus size
+
+Compares rebuilding the full-text index on every batch (the default) with the
+deferred mode, where the index is rebuilt once after ingestion.
+
+Usage:
+    python benchmarks/bench_docstore_fts.py --sizes 1000 5000 20000
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from kotaemon.base import Document
+from kotaemon.storages import LanceDBDocumentStore
+
+WORDS = (
+    "agreement party contract clause liability termination notice payment "
+    "obligation warranty breach remedy jurisdiction court damages indemnity "
+    "confidential license term renewal assignment dispute arbitration law"
+).split()
+
+
+def make_docs(n: int, seed: int = 0) -> list[Document]:
+    rng = random.Random(seed)
+    return [
+        Document(
+            text=" ".join(rng.choices(WORDS, k=120)),
+            id_=f"chunk_{idx}",
+            metadata={"file_id": f"file_{idx // 200}"},
+        )
+        for idx in range(n)
+    ]
+
+
+def ingest(docs: list[Document], batch_size: int, deferred: bool) -> float:
+    with tempfile.TemporaryDirectory() as path:
+        store = LanceDBDocumentStore(
+            path=path,
+            collection_name="bench",
+            fts_refresh_delay=3600.0 if deferred else None,
+        )
+        start = time.perf_counter()
+        for idx in range(0, len(docs), batch_size):
+            store.add(docs[idx : idx + batch_size])
+        store.refresh_indices()
+        elapsed = time.perf_counter() - start
+
+        # sanity check that the index answers queries
+        assert store.query("indemnity", top_k=1)
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--batch-size", type=int, default=800)
+    args = parser.parse_args()
+
+    print(f"{'chunks':>8} {'per-batch (s)':>14} {'deferred (s)':>13} {'speedup':>8}")
+    for size in args.sizes:
+        docs = make_docs(size)
+        eager = ingest(docs, args.batch_size, deferred=False)
+        deferred = ingest(docs, args.batch_size, deferred=True)
+        print(f"{size:>8} {eager:>14.2f} {deferred:>13.2f} {eager / deferred:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
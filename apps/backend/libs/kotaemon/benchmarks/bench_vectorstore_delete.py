@@ -0,0 +1,90 @@
+"""Benchmark deleting and re-indexing a file in the vector stores
+
+For each store, a file of `--chunks` chunks is indexed, then timed with:
+    - per-id: one `delete` call per chunk, as the stores used to do internally
+    - bulk: one `delete` call with all the ids
+    - reindex: `upsert` of the same ids with new vectors
+
+Usage:
+    python benchmarks/bench_vectorstore_delete.py --chunks 10000
+    python benchmarks/bench_vectorstore_delete.py --stores chroma lancedb
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from kotaemon.base import Document, EmbeddingBatch
+from kotaemon.storages import (
+    ChromaVectorStore,
+    InMemoryVectorStore,
+    LanceDBVectorStore,
+    MemmapVectorStore,
+    SimpleFileVectorStore,
+)
+
+STORES = {
+    "chroma": lambda path: ChromaVectorStore(path=path, collection_name="bench"),
+    "lancedb": lambda path: LanceDBVectorStore(path=path, collection_name="bench"),
+    "in_memory": lambda path: InMemoryVectorStore(),
+    "simple_file": lambda path: SimpleFileVectorStore(
+        path=path, collection_name="bench"
+    ),
+    "memmap": lambda path: MemmapVectorStore(path=path, collection_name="bench"),
+}
+
+
+def make_batch(n: int, dim: int, seed: int) -> EmbeddingBatch:
+    rng = np.random.default_rng(seed)
+    docs = [
+        Document(text="", id_=f"chunk_{idx}", metadata={"file_id": "file_0"})
+        for idx in range(n)
+    ]
+    return EmbeddingBatch(docs, rng.standard_normal((n, dim), dtype=np.float32))
+
+
+def timed(store_name: str, batch: EmbeddingBatch, action) -> float:
+    with tempfile.TemporaryDirectory() as path:
+        store = STORES[store_name](path)
+        store.add(batch)
+        start = time.perf_counter()
+        action(store)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--stores", nargs="+", default=list(STORES), choices=STORES)
+    parser.add_argument(
+        "--per-id-limit",
+        type=int,
+        default=200,
+        help="time per-id deletes on this many chunks and extrapolate",
+    )
+    args = parser.parse_args()
+
+    batch = make_batch(args.chunks, args.dim, seed=0)
+    ids = [doc.doc_id for doc in batch.documents]
+    new_batch = make_batch(args.chunks, args.dim, seed=1)
+    sample = ids[: min(args.per_id_limit, len(ids))]
+
+    print(f"{'store':>12} {'per-id (s)':>11} {'bulk (s)':>9} {'reindex (s)':>12}")
+    for name in args.stores:
+
+        def per_id(store):
+            for id_ in sample:
+                store.delete([id_])
+
+        per_id_time = timed(name, batch, per_id) * len(ids) / len(sample)
+        bulk_time = timed(name, batch, lambda store: store.delete(ids))
+        reindex_time = timed(name, batch, lambda store: store.upsert(new_batch))
+        print(
+            f"{name:>12} {per_id_time:>11.2f} {bulk_time:>9.2f} {reindex_time:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
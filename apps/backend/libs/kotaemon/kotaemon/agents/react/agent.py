@@ -3,12 +3,11 @@ import re
 from functools import partial
 from typing import Optional
 
-import tiktoken
-
 from kotaemon.agents.base import BaseAgent, BaseLLM
 from kotaemon.agents.io import AgentAction, AgentFinish, AgentOutput, AgentType
 from kotaemon.agents.tools import BaseTool
 from kotaemon.base import Document, Param
+from kotaemon.base.tokens import get_encoding
 from kotaemon.indices.splitters import TokenSplitter
 from kotaemon.llms import PromptTemplate
 
@@ -156,7 +155,7 @@ class ReactAgent(BaseAgent):
                 chunk_overlap=0,
                 separator=" ",
                 tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
+                    get_encoding("gpt-3.5-turbo").encode,
                     allowed_special=set(),
                     disallowed_special="all",
                 ),
@@ -4,13 +4,12 @@ from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from typing import Any
 
-import tiktoken
-
 from kotaemon.agents.base import BaseAgent
 from kotaemon.agents.io import AgentOutput, AgentType, BaseScratchPad
 from kotaemon.agents.tools import BaseTool
 from kotaemon.agents.utils import get_plugin_response_content
 from kotaemon.base import Document, Node, Param
+from kotaemon.base.tokens import get_encoding
 from kotaemon.indices.qa.citation import CitationPipeline
 from kotaemon.indices.splitters import TokenSplitter
 from kotaemon.llms import BaseLLM, PromptTemplate
@@ -251,7 +250,7 @@ class RewooAgent(BaseAgent):
                 chunk_overlap=0,
                 separator=" ",
                 tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
+                    get_encoding("gpt-3.5-turbo").encode,
                     allowed_special=set(),
                     disallowed_special="all",
                 ),
@@ -4,6 +4,7 @@ from .schema import (
     BaseMessage,
     Document,
     DocumentWithEmbedding,
+    EmbeddingBatch,
     ExtractorOutput,
     HumanMessage,
     LLMInterface,
@@ -16,6 +17,7 @@ __all__ = [
     "BaseComponent",
     "Document",
     "DocumentWithEmbedding",
+    "EmbeddingBatch",
     "BaseMessage",
     "SystemMessage",
     "AIMessage",
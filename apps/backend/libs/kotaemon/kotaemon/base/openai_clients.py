@@ -0,0 +1,86 @@
+"""Process-wide registry of OpenAI clients
+
+Each `openai` client owns an httpx connection pool, so building a client per
+request pays for a new connection and TLS handshake every time. Components
+with the same client settings share one client instead. Async clients are also
+keyed by event loop, as an httpx async pool cannot be used from another loop.
+"""
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Any
+
+from decouple import config
+
+MAX_CONNECTIONS = config("KH_OPENAI_MAX_CONNECTIONS", default=100, cast=int)
+MAX_KEEPALIVE_CONNECTIONS = config(
+    "KH_OPENAI_MAX_KEEPALIVE_CONNECTIONS", default=20, cast=int
+)
+KEEPALIVE_EXPIRY = config("KH_OPENAI_KEEPALIVE_EXPIRY", default=30.0, cast=float)
+# HTTP/2 is negotiated with the endpoint and needs the `h2` package, otherwise
+# requests go over HTTP/1.1
+HTTP2 = (
+    config("KH_OPENAI_HTTP2", default=True, cast=bool)
+    and importlib.util.find_spec("h2") is not None
+)
+
+_clients: dict[tuple, Any] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def make_http_client(async_version: bool = False):
+    """An httpx client with the pool limits and protocol of the registry"""
+    import httpx
+    from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    client_cls = DefaultAsyncHttpxClient if async_version else DefaultHttpxClient
+    return client_cls(limits=limits, http2=HTTP2)
+
+
+def get_openai_client(client_cls: type, async_version: bool = False, **params):
+    """Get the shared `client_cls(**params)` client
+
+    Args:
+        client_cls: the openai client class, e.g. `openai.OpenAI`
+        async_version: whether `client_cls` is an async client
+        **params: the client parameters, e.g. api_key, base_url, timeout
+    """
+    key = (client_cls, tuple(sorted(params.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return client_cls(http_client=make_http_client(async_version), **params)
+
+    if async_version:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no loop to share the client on
+            return client_cls(http_client=make_http_client(True), **params)
+        with _lock:
+            clients = _async_clients.setdefault(loop, {})
+    else:
+        clients = _clients
+
+    with _lock:
+        client = clients.get(key)
+        if client is None:
+            client = client_cls(http_client=make_http_client(async_version), **params)
+            clients[key] = client
+    return client
+
+
+def clear_openai_clients():
+    """Drop the shared clients, e.g. after their settings were changed"""
+    with _lock:
+        _clients.clear()
+        _async_clients.clear()
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Literal, Optional, TypeVar
+from typing import TYPE_CHECKING, Any, Iterator, Literal, Optional, TypeVar, overload
 
+import numpy as np
 from langchain.schema.messages import AIMessage as LCAIMessage
 from langchain.schema.messages import HumanMessage as LCHumanMessage
 from langchain.schema.messages import SystemMessage as LCSystemMessage
@@ -95,6 +96,49 @@ class DocumentWithEmbedding(Document):
         super().__init__(*args, **kwargs)
 
 
+class EmbeddingBatch:
+    """Embeddings of a batch of documents, kept in one contiguous float32 array
+
+    Indexing and iterating give `DocumentWithEmbedding` objects, built on access,
+    so the batch can be used where a list of them is expected. Vector stores and
+    caches read `vectors` directly, without a Python float per value.
+
+    Args:
+        documents: the embedded documents
+        vectors: the embeddings, of shape (len(documents), dimension)
+    """
+
+    def __init__(self, documents: list[Document], vectors: np.ndarray):
+        self.documents = documents
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(self.documents) != len(self.vectors):
+            raise ValueError(
+                f"Got {len(self.documents)} documents for {len(self.vectors)} vectors"
+            )
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @overload
+    def __getitem__(self, idx: int) -> DocumentWithEmbedding:
+        ...
+
+    @overload
+    def __getitem__(self, idx: slice) -> list[DocumentWithEmbedding]:
+        ...
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return DocumentWithEmbedding(
+            embedding=self.vectors[idx].tolist(), content=self.documents[idx]
+        )
+
+    def __iter__(self) -> Iterator[DocumentWithEmbedding]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+
 class BaseMessage(Document):
     def __add__(self, other: Any):
         raise NotImplementedError
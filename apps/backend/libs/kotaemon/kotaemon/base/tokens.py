@@ -0,0 +1,132 @@
+"""Process-wide token counting
+
+Encoders are loaded once per model, and token counts are memoized by a hash
+of the text, so the chunks of a file, the evidence of repeated questions or
+the inputs of an embedding request are tokenized once. Texts are encoded as
+ordinary text: special tokens such as `<|endoftext|>` found in documents are
+counted like any other text instead of raising.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Sequence
+
+import tiktoken
+from decouple import config
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+COUNT_CACHE_SIZE = config("KH_TOKEN_COUNT_CACHE_SIZE", default=65536, cast=int)
+ENCODE_CACHE_SIZE = config("KH_TOKEN_ENCODE_CACHE_SIZE", default=32, cast=int)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = DEFAULT_MODEL) -> tiktoken.Encoding:
+    """The tiktoken encoding of `model`, which can also be an encoding name"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(model)
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(
+        text.encode("utf-8", "surrogatepass"), digest_size=16
+    ).digest()
+
+
+class TokenCounter:
+    """Count and trim tokens with a shared encoder and memoized results
+
+    Args:
+        model: the model or encoding name
+        maxsize: maximum number of memoized counts
+        encode_maxsize: maximum number of memoized encodings, used by `trim`
+    """
+
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        maxsize: int = COUNT_CACHE_SIZE,
+        encode_maxsize: int = ENCODE_CACHE_SIZE,
+    ):
+        self.model = model
+        self.encoding = get_encoding(model)
+        self.maxsize = maxsize
+        self.encode_maxsize = encode_maxsize
+        self._counts: OrderedDict[bytes, int] = OrderedDict()
+        self._encoded: OrderedDict[bytes, list[int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, text: str) -> list[int]:
+        key = text_key(text)
+        with self._lock:
+            if key in self._encoded:
+                self._encoded.move_to_end(key)
+                return self._encoded[key]
+
+        tokens = self.encoding.encode_ordinary(text)
+        with self._lock:
+            self._encoded[key] = tokens
+            while len(self._encoded) > self.encode_maxsize:
+                self._encoded.popitem(last=False)
+            self._remember({key: len(tokens)})
+        return tokens
+
+    def _remember(self, counts: dict[bytes, int]):
+        """Memoize `counts`, the lock must be held"""
+        for key, count in counts.items():
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+        while len(self._counts) > self.maxsize:
+            self._counts.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def count_many(self, texts: Sequence[str]) -> list[int]:
+        """Number of tokens of each text, encoding the new ones in one batch"""
+        keys = [text_key(text) for text in texts]
+        found: dict[bytes, int] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._counts:
+                    self._counts.move_to_end(key)
+                    found[key] = self._counts[key]
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            encoded = self.encoding.encode_ordinary_batch(list(missing.values()))
+            new_counts = {
+                key: len(tokens) for key, tokens in zip(missing.keys(), encoded)
+            }
+            with self._lock:
+                self._remember(new_counts)
+            found.update(new_counts)
+
+        return [found[key] for key in keys]
+
+    def trim(self, text: str, max_tokens: int, separator: str = " ") -> str:
+        """Keep the beginning of `text` that fits in `max_tokens` tokens
+
+        The text is cut at the last `separator` that fits, as `TokenSplitter`
+        does for its first chunk.
+        """
+        # a token covers at least one byte, shorter texts always fit
+        if len(text.encode("utf-8", "surrogatepass")) <= max_tokens:
+            return text
+
+        tokens = self.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+
+        trimmed = self.encoding.decode(tokens[:max_tokens])
+        if separator and separator in trimmed:
+            trimmed = trimmed[: trimmed.rindex(separator)]
+        return trimmed
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model: str = DEFAULT_MODEL) -> TokenCounter:
+    """The shared `TokenCounter` of `model`"""
+    return TokenCounter(model)
@@ -1,4 +1,10 @@
 from .base import BaseEmbeddings
+from .cache import (
+    BaseEmbeddingCache,
+    CachedEmbeddings,
+    InMemoryEmbeddingCache,
+    SQLiteEmbeddingCache,
+)
 from .endpoint_based import EndpointEmbeddings
 from .fastembed import FastEmbedEmbeddings
 from .langchain_based import (
@@ -10,11 +16,17 @@ from .langchain_based import (
     LCOpenAIEmbeddings,
 )
 from .openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+from .scheduler import EmbeddingScheduler
 from .tei_endpoint_embed import TeiEndpointEmbeddings
 from .voyageai import VoyageAIEmbeddings
 
 __all__ = [
     "BaseEmbeddings",
+    "BaseEmbeddingCache",
+    "CachedEmbeddings",
+    "InMemoryEmbeddingCache",
+    "SQLiteEmbeddingCache",
+    "EmbeddingScheduler",
     "EndpointEmbeddings",
     "TeiEndpointEmbeddings",
     "LCOpenAIEmbeddings",
@@ -1,6 +1,11 @@
 from __future__ import annotations
 
-from kotaemon.base import BaseComponent, Document, DocumentWithEmbedding
+import asyncio
+from typing import Optional
+
+import numpy as np
+
+from kotaemon.base import BaseComponent, Document, DocumentWithEmbedding, EmbeddingBatch
 
 
 class BaseEmbeddings(BaseComponent):
@@ -17,7 +22,42 @@ class BaseEmbeddings(BaseComponent):
     async def ainvoke(
         self, text: str | list[str] | Document | list[Document], *args, **kwargs
     ) -> list[DocumentWithEmbedding]:
-        raise NotImplementedError
+        """Async version of `invoke`
+
+        Embeddings without a native async client run `run` in a worker thread.
+        """
+        return await asyncio.to_thread(self.run, text, *args, **kwargs)
+
+    def embed_batch(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingBatch:
+        """Embed the input into a float32 `EmbeddingBatch`
+
+        Embeddings that can decode their response into an array override this,
+        the others convert the output of `invoke`.
+        """
+        input_docs = self.prepare_input(text)
+        output = self.invoke(input_docs, *args, **kwargs)
+        return EmbeddingBatch(input_docs, to_vectors(output))
+
+    async def aembed_batch(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingBatch:
+        """Async version of `embed_batch`"""
+        input_docs = self.prepare_input(text)
+        output = await self.ainvoke(input_docs, *args, **kwargs)
+        return EmbeddingBatch(input_docs, to_vectors(output))
+
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        """Number of tokens of each text, used to pack requests
+
+        Models without a known tokenizer estimate 4 characters per token.
+        """
+        return [len(text) // 4 + 1 for text in texts]
+
+    def batch_limits(self) -> tuple[Optional[int], Optional[int]]:
+        """Maximum number of inputs and of tokens per request, None if unbounded"""
+        return None, None
 
     def prepare_input(
         self, text: str | list[str] | Document | list[Document]
@@ -27,3 +67,12 @@ class BaseEmbeddings(BaseComponent):
         elif isinstance(text, list):
             return [Document(content=_) for _ in text]
         return text
+
+
+def to_vectors(output: list[DocumentWithEmbedding]) -> np.ndarray:
+    """Stack the embeddings of `output` into a float32 array"""
+    if isinstance(output, EmbeddingBatch):
+        return output.vectors
+    if not output:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.asarray([doc.embedding for doc in output], dtype=np.float32)
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+from kotaemon.base import EmbeddingBatch, Param
+from kotaemon.rerankings.cache import lookup_tiers
+
+from .base import BaseEmbeddings, Document, DocumentWithEmbedding
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so that trivially different strings share an entry"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def embedding_model_id(embedding: BaseEmbeddings) -> str:
+    """Identify the model behind an embedding component, for cache keys"""
+    if isinstance(embedding, CachedEmbeddings):
+        return embedding.model_id
+
+    name = f"{embedding.__class__.__module__}.{embedding.__class__.__qualname__}"
+    for attr in ("model", "model_name", "endpoint_url", "deployment"):
+        value = getattr(embedding, attr, None)
+        if isinstance(value, str) and value:
+            name += f":{value}"
+            break
+    dimensions = getattr(embedding, "dimensions", None)
+    if isinstance(dimensions, int):
+        name += f":{dimensions}"
+    return name
+
+
+class BaseEmbeddingCache:
+    """Store embeddings by key
+
+    Subclasses implement `get_many` and `set_many`. Hits and misses are
+    counted by `lookup`. `set_many` takes lists of floats or numpy rows.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, list[float]]:
+        raise NotImplementedError
+
+    def set_many(self, items: dict[str, list[float]]):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def lookup(self, keys: Sequence[str]) -> dict[str, list[float]]:
+        found = self.get_many(keys)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def cache_info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class InMemoryEmbeddingCache(BaseEmbeddingCache):
+    """LRU cache in process memory
+
+    Args:
+        maxsize: maximum number of embeddings to keep
+        ttl: seconds after which an entry expires, None to never expire
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: Optional[float] = None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._store: OrderedDict[str, tuple[float, tuple[float, ...]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, list[float]]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._store.get(key)
+                if item is None:
+                    continue
+                expires_at, embedding = item
+                if expires_at < now:
+                    del self._store[key]
+                    continue
+                self._store.move_to_end(key)
+                found[key] = list(embedding)
+        return found
+
+    def set_many(self, items: dict[str, list[float]]):
+        expires_at = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            for key, embedding in items.items():
+                if isinstance(embedding, np.ndarray):
+                    embedding = embedding.tolist()
+                self._store[key] = (expires_at, tuple(embedding))
+                self._store.move_to_end(key)
+            while len(self._store) > self.maxsize:
+                self._store.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+
+    def cache_info(self) -> dict:
+        return {**super().cache_info(), "size": len(self._store)}
+
+
+class SQLiteEmbeddingCache(BaseEmbeddingCache):
+    """Persistent cache in a SQLite file, shared across processes and restarts
+
+    Args:
+        path: path to the SQLite database file
+        ttl: seconds after which an entry expires, None to never expire
+        typecode: `array` typecode of the stored values, "d" (float64) or "f"
+            (float32, half the size and what most vector stores keep anyway)
+    """
+
+    def __init__(
+        self, path: str | Path, ttl: Optional[float] = None, typecode: str = "d"
+    ):
+        super().__init__()
+        self.path = str(path)
+        self.ttl = ttl
+        self.typecode = typecode
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, list[float]]:
+        if not keys:
+            return {}
+        min_created_at = time.time() - self.ttl if self.ttl else 0.0
+        found = {}
+        with self._lock:
+            # stay below SQLite's limit on the number of bound parameters
+            for start in range(0, len(keys), 500):
+                batch = list(keys[start : start + 500])
+                rows = self._conn.execute(
+                    "SELECT key, embedding FROM embeddings "
+                    f"WHERE key IN ({', '.join('?' * len(batch))}) "
+                    "AND created_at >= ?",
+                    [*batch, min_created_at],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array(self.typecode, blob).tolist()
+        return found
+
+    def set_many(self, items: dict[str, list[float]]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, embedding, created_at) "
+                "VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(embedding, dtype=self.typecode).tobytes(), now)
+                    for key, embedding in items.items()
+                ],
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embeddings")
+
+
+class CachedEmbeddings(BaseEmbeddings):
+    """Wrap an embedding model with a tiered cache
+
+    Entries are keyed on (model id, normalized text). The tiers are looked up in
+    order; a hit in a lower tier is copied to the tiers above it, and misses are
+    embedded in one call to the wrapped model and written to every tier.
+
+    Args:
+        embedding: the embedding model to wrap
+        caches: the cache tiers, fastest first
+        model_id: overrides the model identifier used in the cache keys
+    """
+
+    embedding: BaseEmbeddings
+    caches: list = Param(
+        default_callback=lambda _: [InMemoryEmbeddingCache()],
+        help="The cache tiers, fastest first",
+    )
+    model_id: str = Param(
+        default_callback=lambda obj: embedding_model_id(obj.embedding),
+        help="Identify the wrapped model in the cache keys",
+    )
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(
+            f"{self.model_id}\0{normalize_text(text)}".encode()
+        ).hexdigest()
+
+    def cache_info(self) -> list[dict]:
+        return [
+            {"tier": cache.__class__.__name__, **cache.cache_info()}
+            for cache in self.caches
+        ]
+
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        return self.embedding.count_tokens(texts)
+
+    def batch_limits(self) -> tuple[Optional[int], Optional[int]]:
+        return self.embedding.batch_limits()
+
+    def _store(self, items: dict[str, list[float]]):
+        for cache in self.caches:
+            cache.set_many(items)
+
+    def _split(
+        self, text: str | list[str] | Document | list[Document]
+    ) -> tuple[list[Document], list[str], dict[str, list[float]], list[Document]]:
+        input_docs = self.prepare_input(text)
+        keys = [self.cache_key(doc.text) for doc in input_docs]
+        found = lookup_tiers(self.caches, keys)
+
+        to_embed: dict[str, Document] = {}
+        for key, doc in zip(keys, input_docs):
+            if key not in found and key not in to_embed:
+                to_embed[key] = doc
+        return input_docs, keys, found, list(to_embed.values())
+
+    def _merge(
+        self,
+        input_docs: list[Document],
+        keys: list[str],
+        found: dict[str, list[float]],
+        to_embed: list[Document],
+        embedded: list[DocumentWithEmbedding],
+    ) -> list[DocumentWithEmbedding]:
+        new_items = {
+            self.cache_key(doc.text): out.embedding
+            for doc, out in zip(to_embed, embedded)
+        }
+        if new_items:
+            self._store(new_items)
+        found = {**found, **new_items}
+
+        return [
+            DocumentWithEmbedding(embedding=found[key], content=doc)
+            for key, doc in zip(keys, input_docs)
+        ]
+
+    def invoke(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> list[DocumentWithEmbedding]:
+        input_docs, keys, found, to_embed = self._split(text)
+        embedded = self.embedding(to_embed, *args, **kwargs) if to_embed else []
+        return self._merge(input_docs, keys, found, to_embed, embedded)
+
+    async def ainvoke(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> list[DocumentWithEmbedding]:
+        input_docs, keys, found, to_embed = self._split(text)
+        embedded = (
+            await self.embedding.ainvoke(to_embed, *args, **kwargs) if to_embed else []
+        )
+        return self._merge(input_docs, keys, found, to_embed, embedded)
+
+    def _merge_batch(
+        self,
+        input_docs: list[Document],
+        keys: list[str],
+        found: dict[str, list[float]],
+        to_embed: list[Document],
+        embedded: Optional[EmbeddingBatch],
+    ) -> EmbeddingBatch:
+        rows: dict[str, np.ndarray] = {}
+        if embedded is not None:
+            rows = {
+                self.cache_key(doc.text): vector
+                for doc, vector in zip(to_embed, embedded.vectors)
+            }
+            self._store(rows)
+
+        sample = next(iter(rows.values())) if rows else next(iter(found.values()))
+        vectors = np.empty((len(input_docs), len(sample)), dtype=np.float32)
+        for idx, key in enumerate(keys):
+            vectors[idx] = rows[key] if key in rows else found[key]
+        return EmbeddingBatch(input_docs, vectors)
+
+    def embed_batch(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingBatch:
+        input_docs, keys, found, to_embed = self._split(text)
+        if not input_docs:
+            return EmbeddingBatch([], np.empty((0, 0), dtype=np.float32))
+        embedded = (
+            self.embedding.embed_batch(to_embed, *args, **kwargs) if to_embed else None
+        )
+        return self._merge_batch(input_docs, keys, found, to_embed, embedded)
+
+    async def aembed_batch(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingBatch:
+        input_docs, keys, found, to_embed = self._split(text)
+        if not input_docs:
+            return EmbeddingBatch([], np.empty((0, 0), dtype=np.float32))
+        embedded = (
+            await self.embedding.aembed_batch(to_embed, *args, **kwargs)
+            if to_embed
+            else None
+        )
+        return self._merge_batch(input_docs, keys, found, to_embed, embedded)
@@ -1,3 +1,4 @@
+import asyncio
 from typing import TYPE_CHECKING, Optional
 
 from kotaemon.base import Document, DocumentWithEmbedding, Param
@@ -68,5 +69,5 @@ class FastEmbedEmbeddings(BaseEmbeddings):
     async def ainvoke(
         self, text: str | list[str] | Document | list[Document], *args, **kwargs
     ) -> list[DocumentWithEmbedding]:
-        """Fastembed does not support async API."""
-        return self.invoke(text, *args, **kwargs)
+        """Fastembed does not support async API, run it in a worker thread."""
+        return await asyncio.to_thread(self.invoke, text, *args, **kwargs)
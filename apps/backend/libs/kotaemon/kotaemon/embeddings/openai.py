@@ -1,10 +1,11 @@
+import base64
 from itertools import islice
 from typing import Optional
 
 import numpy as np
 import openai
-import tiktoken
 from tenacity import (
+    RetryError,
     retry,
     retry_if_not_exception_type,
     stop_after_attempt,
@@ -12,7 +13,9 @@ from tenacity import (
 )
 from theflow.utils.modules import import_dotted_string
 
-from kotaemon.base import Param
+from kotaemon.base import EmbeddingBatch, Param
+from kotaemon.base.openai_clients import get_openai_client
+from kotaemon.base.tokens import get_encoding, get_token_counter
 
 from .base import BaseEmbeddings, Document, DocumentWithEmbedding
 
@@ -27,7 +30,7 @@ def split_text_by_chunk_size(text: str, chunk_size: int) -> list[list[int]]:
     Returns:
         list of chunks (as tokens)
     """
-    encoding = tiktoken.get_encoding("cl100k_base")
+    encoding = get_encoding("cl100k_base")
     tokens = iter(encoding.encode(text))
     result = []
     while chunk := list(islice(tokens, chunk_size)):
@@ -63,6 +66,19 @@ class BaseOpenAIEmbeddings(BaseEmbeddings):
     context_length: Optional[int] = Param(
         None, help="The maximum context length of the embedding model"
     )
+    max_batch_size: int = Param(2048, help="Maximum number of inputs per request")
+    max_batch_tokens: int = Param(
+        300_000, help="Maximum number of tokens summed over the inputs of a request"
+    )
+    use_base64_encoding: bool = Param(
+        True,
+        help=(
+            "Request the embeddings base64-encoded, which is smaller and faster to "
+            "decode than lists of floats. Requests rejected for `encoding_format` are "
+            "sent again without it; disable it for OpenAI-compatible servers that "
+            "do not support it, to save the failed request"
+        ),
+    )
 
     @Param.auto(depends_on=["max_retries"])
     def max_retries_(self):
@@ -80,16 +96,29 @@ class BaseOpenAIEmbeddings(BaseEmbeddings):
         """
         raise NotImplementedError
 
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        return get_token_counter("cl100k_base").count_many(texts)
+
+    def batch_limits(self) -> tuple[Optional[int], Optional[int]]:
+        return self.max_batch_size, self.max_batch_tokens
+
     def openai_response(self, client, **kwargs):
         """Get the openai response"""
         raise NotImplementedError
 
-    def invoke(
-        self, text: str | list[str] | Document | list[Document], *args, **kwargs
-    ) -> list[DocumentWithEmbedding]:
-        input_doc = self.prepare_input(text)
-        client = self.prepare_client(async_version=False)
+    async def aopenai_response(self, client, **kwargs):
+        """Get the openai response"""
+        raise NotImplementedError
 
+    def prepare_request(
+        self, input_doc: list[Document]
+    ) -> tuple[list[str | list[int]], dict[int, tuple[int, int]]]:
+        """Prepare the embedding request input
+
+        Returns:
+            the request input, and for each input document the (start, end) range
+            of its chunks in the request input
+        """
         input_: list[str | list[int]] = []
         splitted_indices = {}
         for idx, text in enumerate(input_doc):
@@ -101,42 +130,115 @@ class BaseOpenAIEmbeddings(BaseEmbeddings):
                 splitted_indices[idx] = (len(input_), len(input_) + 1)
                 input_.append(text.text)
 
-        resp = self.openai_response(client, input=input_, **kwargs).dict()
-        output_ = list(sorted(resp["data"], key=lambda x: x["index"]))
-
-        output = []
-        for idx, doc in enumerate(input_doc):
-            embs = output_[splitted_indices[idx][0] : splitted_indices[idx][1]]
-            if len(embs) == 1:
-                output.append(
-                    DocumentWithEmbedding(embedding=embs[0]["embedding"], content=doc)
-                )
+        return input_, splitted_indices
+
+    def encoding_kwargs(self) -> dict:
+        return {"encoding_format": "base64"} if self.use_base64_encoding else {}
+
+    def is_encoding_rejected(self, error: Exception) -> bool:
+        """Whether the endpoint rejected `encoding_format`, in which case the
+        request is sent again without it"""
+        if isinstance(error, RetryError):
+            error = error.last_attempt.exception()
+        if not (
+            self.use_base64_encoding
+            and isinstance(error, openai.APIStatusError)
+            and error.status_code == 400
+        ):
+            return False
+        return "encoding_format" in f"{error.param} {error.body} {error.message}"
+
+    def decode_response(self, resp) -> np.ndarray:
+        """Read the embeddings of the OpenAI response into a float32 array
+
+        Embeddings are requested base64-encoded and decoded straight into the
+        array. Endpoints that ignore or reject `encoding_format` return lists of
+        floats, which are copied in as well.
+        """
+        data = sorted(resp.data, key=lambda x: x.index)
+        if not data:
+            return np.empty((0, 0), dtype=np.float32)
+
+        rows = [
+            np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32)
+            if isinstance(item.embedding, str)
+            else item.embedding
+            for item in data
+        ]
+        vectors = np.empty((len(rows), len(rows[0])), dtype=np.float32)
+        for idx, row in enumerate(rows):
+            vectors[idx] = row
+        return vectors
+
+    def prepare_output(
+        self,
+        input_doc: list[Document],
+        input_: list[str | list[int]],
+        splitted_indices: dict[int, tuple[int, int]],
+        resp,
+    ) -> EmbeddingBatch:
+        """Convert the OpenAI response into an EmbeddingBatch"""
+        vectors = self.decode_response(resp)
+        if len(vectors) == len(input_doc):
+            # no document was split into several chunks
+            return EmbeddingBatch(input_doc, vectors)
+
+        output = np.empty((len(input_doc), vectors.shape[1]), dtype=np.float32)
+        for idx in range(len(input_doc)):
+            start, end = splitted_indices[idx]
+            if end - start == 1:
+                output[idx] = vectors[start]
                 continue
 
-            chunk_lens = [
-                len(_)
-                for _ in input_[splitted_indices[idx][0] : splitted_indices[idx][1]]
-            ]
-            vs: list[list[float]] = [_["embedding"] for _ in embs]
-            emb = np.average(vs, axis=0, weights=chunk_lens)
-            emb = emb / np.linalg.norm(emb)
-            output.append(DocumentWithEmbedding(embedding=emb.tolist(), content=doc))
+            chunk_lens = [len(_) for _ in input_[start:end]]
+            emb = np.average(vectors[start:end], axis=0, weights=chunk_lens)
+            output[idx] = emb / np.linalg.norm(emb)
+
+        return EmbeddingBatch(input_doc, output)
+
+    def embed_batch(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingBatch:
+        input_doc = self.prepare_input(text)
+        client = self.prepare_client(async_version=False)
+
+        input_, splitted_indices = self.prepare_request(input_doc)
+        try:
+            resp = self.openai_response(
+                client, input=input_, **self.encoding_kwargs(), **kwargs
+            )
+        except Exception as e:
+            if not self.is_encoding_rejected(e):
+                raise
+            resp = self.openai_response(client, input=input_, **kwargs)
+        return self.prepare_output(input_doc, input_, splitted_indices, resp)
+
+    async def aembed_batch(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingBatch:
+        input_doc = self.prepare_input(text)
+        client = self.prepare_client(async_version=True)
+
+        input_, splitted_indices = self.prepare_request(input_doc)
+        try:
+            resp = await self.aopenai_response(
+                client, input=input_, **self.encoding_kwargs(), **kwargs
+            )
+        except Exception as e:
+            if not self.is_encoding_rejected(e):
+                raise
+            resp = await self.aopenai_response(client, input=input_, **kwargs)
+        return self.prepare_output(input_doc, input_, splitted_indices, resp)
 
-        return output
+    def invoke(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> list[DocumentWithEmbedding]:
+        return list(self.embed_batch(text, *args, **kwargs))
 
     async def ainvoke(
         self, text: str | list[str] | Document | list[Document], *args, **kwargs
     ) -> list[DocumentWithEmbedding]:
-        input_ = self.prepare_input(text)
-        client = self.prepare_client(async_version=True)
-        resp = await self.openai_response(
-            client, input=[_.text if _.text else " " for _ in input_], **kwargs
-        ).dict()
-        output_ = sorted(resp["data"], key=lambda x: x["index"])
-        return [
-            DocumentWithEmbedding(embedding=o["embedding"], content=i)
-            for i, o in zip(input_, output_)
-        ]
+        return list(await self.aembed_batch(text, *args, **kwargs))
 
 
 class OpenAIEmbeddings(BaseOpenAIEmbeddings):
@@ -169,11 +271,11 @@ class OpenAIEmbeddings(BaseOpenAIEmbeddings):
         if async_version:
             from openai import AsyncOpenAI
 
-            return AsyncOpenAI(**params)
+            return get_openai_client(AsyncOpenAI, async_version=True, **params)
 
         from openai import OpenAI
 
-        return OpenAI(**params)
+        return get_openai_client(OpenAI, **params)
 
     @retry(
         retry=retry_if_not_exception_type(
@@ -193,6 +295,24 @@ class OpenAIEmbeddings(BaseOpenAIEmbeddings):
 
         return client.embeddings.create(**params)
 
+    @retry(
+        retry=retry_if_not_exception_type(
+            (openai.NotFoundError, openai.BadRequestError)
+        ),
+        wait=wait_random_exponential(min=1, max=40),
+        stop=stop_after_attempt(6),
+    )
+    async def aopenai_response(self, client, **kwargs):
+        """Get the openai response"""
+        params: dict = {
+            "model": self.model,
+        }
+        if self.dimensions:
+            params["dimensions"] = self.dimensions
+        params.update(kwargs)
+
+        return await client.embeddings.create(**params)
+
 
 class AzureOpenAIEmbeddings(BaseOpenAIEmbeddings):
     azure_endpoint: str = Param(
@@ -232,11 +352,11 @@ class AzureOpenAIEmbeddings(BaseOpenAIEmbeddings):
         if async_version:
             from openai import AsyncAzureOpenAI
 
-            return AsyncAzureOpenAI(**params)
+            return get_openai_client(AsyncAzureOpenAI, async_version=True, **params)
 
         from openai import AzureOpenAI
 
-        return AzureOpenAI(**params)
+        return get_openai_client(AzureOpenAI, **params)
 
     @retry(
         retry=retry_if_not_exception_type(
@@ -255,3 +375,21 @@ class AzureOpenAIEmbeddings(BaseOpenAIEmbeddings):
         params.update(kwargs)
 
         return client.embeddings.create(**params)
+
+    @retry(
+        retry=retry_if_not_exception_type(
+            (openai.NotFoundError, openai.BadRequestError)
+        ),
+        wait=wait_random_exponential(min=1, max=40),
+        stop=stop_after_attempt(6),
+    )
+    async def aopenai_response(self, client, **kwargs):
+        """Get the openai response"""
+        params: dict = {
+            "model": self.azure_deployment,
+        }
+        if self.dimensions:
+            params["dimensions"] = self.dimensions
+        params.update(kwargs)
+
+        return await client.embeddings.create(**params)
@@ -0,0 +1,157 @@
+"""Embed large document sets in token-packed, concurrent batches
+
+Indexing used to send fixed-size groups of chunks to the embedding model one
+after the other. `EmbeddingScheduler` instead packs consecutive documents into
+batches that fit the request limits of the model, keeps several requests in
+flight, and yields the results in input order, so the caller can write a batch
+to the vector store while the next ones are being embedded.
+"""
+from __future__ import annotations
+
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+from decouple import config
+from tenacity import RetryError
+
+from kotaemon.base import Document, EmbeddingBatch
+
+from .base import BaseEmbeddings
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_REQUESTS = config("KH_EMBEDDING_MAX_CONCURRENCY", default=4, cast=int)
+
+# words of the 400 responses about the request input, e.g. "maximum context
+# length is 8192 tokens" or "'$.input' is invalid"
+BATCH_ERROR_HINTS = ("token", "input", "context length", "too large", "too long")
+
+
+def is_batch_error(error: BaseException) -> bool:
+    """Whether the request may succeed with fewer documents
+
+    That is a 413, or a 400 about the input or its size. Errors that do not
+    depend on the batch (authentication, rate limits, network) are not.
+    """
+    if isinstance(error, RetryError):
+        error = error.last_attempt.exception()
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+
+    if status_code == 413:
+        return True
+    if status_code != 400:
+        return False
+    message = str(error).lower()
+    return any(hint in message for hint in BATCH_ERROR_HINTS)
+
+
+class EmbeddingScheduler:
+    """Embed documents in batches packed by token count, with requests overlapped
+
+    Batches hold consecutive documents, up to the number of inputs and tokens
+    the model accepts per request (see `BaseEmbeddings.batch_limits`). When the
+    model rejects the input of a batch (see `is_batch_error`), the batch is
+    split in two and only the failing halves are sent again, down to the single
+    document that cannot be embedded. Other errors are raised as is.
+
+    Args:
+        embedding: the embedding model
+        max_concurrency: number of requests in flight
+        max_batch_size: overrides the maximum number of documents per batch
+        max_batch_tokens: overrides the maximum number of tokens per batch
+    """
+
+    def __init__(
+        self,
+        embedding: BaseEmbeddings,
+        max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+        max_batch_size: Optional[int] = None,
+        max_batch_tokens: Optional[int] = None,
+    ):
+        self.embedding = embedding
+        self.max_concurrency = max(1, max_concurrency)
+        default_size, default_tokens = embedding.batch_limits()
+        self.max_batch_size = max_batch_size or default_size
+        self.max_batch_tokens = max_batch_tokens or default_tokens
+
+    def pack(self, docs: Iterable[Document]) -> Iterator[list[Document]]:
+        """Group consecutive documents into batches within the request limits
+
+        Tokens are counted a group at a time as batches are taken, so counting
+        overlaps with the requests already sent.
+        """
+        if self.max_batch_tokens is None and self.max_batch_size is None:
+            docs = list(docs)
+            if docs:
+                yield docs
+            return
+
+        batch: list[Document] = []
+        batch_tokens = 0
+        pending = iter(docs)
+        while group := [doc for _, doc in zip(range(256), pending)]:
+            n_tokens = self.embedding.count_tokens([doc.text for doc in group])
+            for doc, doc_tokens in zip(group, n_tokens):
+                if batch and (
+                    (self.max_batch_size and len(batch) >= self.max_batch_size)
+                    or (
+                        self.max_batch_tokens
+                        and batch_tokens + doc_tokens > self.max_batch_tokens
+                    )
+                ):
+                    yield batch
+                    batch, batch_tokens = [], 0
+                batch.append(doc)
+                batch_tokens += doc_tokens
+
+        if batch:
+            yield batch
+
+    def embed_with_split(self, docs: list[Document]) -> EmbeddingBatch:
+        """Embed `docs`, halving the batch and resending the part that fails"""
+        try:
+            return self.embedding.embed_batch(docs)
+        except Exception as e:
+            if len(docs) == 1 or not is_batch_error(e):
+                raise
+            logger.warning(
+                f"Embedding a batch of {len(docs)} documents failed ({e}), splitting it"
+            )
+
+        middle = len(docs) // 2
+        first = self.embed_with_split(docs[:middle])
+        second = self.embed_with_split(docs[middle:])
+        return EmbeddingBatch(docs, np.concatenate([first.vectors, second.vectors]))
+
+    def run(self, docs: Iterable[Document]) -> Iterator[EmbeddingBatch]:
+        """Embed `docs`, yielding the batches in input order as they complete
+
+        Up to `max_concurrency` batches are embedded while the caller handles the
+        yielded one.
+        """
+        batches = self.pack(docs)
+        if self.max_concurrency == 1:
+            for batch in batches:
+                yield self.embed_with_split(batch)
+            return
+
+        in_flight: deque[Future] = deque()
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="embedding"
+        )
+        try:
+            for batch in batches:
+                in_flight.append(executor.submit(self.embed_with_split, batch))
+                # one extra batch is queued, so `max_concurrency` requests keep
+                # running while the caller handles the yielded batch
+                if len(in_flight) > self.max_concurrency:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from abc import abstractmethod
+from functools import partial
 from typing import Any, Type
 
 from llama_index.core.node_parser.interface import NodeParser
@@ -70,6 +71,10 @@ class LlamaIndexDocTransformerMixin:
         kwargs_repr = ", ".join(kwargs)
         return f"{self.__class__.__name__}({kwargs_repr})"
 
+    def __reduce__(self):
+        # rebuild the wrapped Llama-index object from the params when unpickling
+        return (partial(self.__class__, **self._kwargs), ())
+
     def __setattr__(self, name: str, value: Any) -> None:
         if name.startswith("_") or name in self._protected_keywords():
             return super().__setattr__(name, value)
@@ -52,7 +52,9 @@ KH_DEFAULT_FILE_EXTRACTORS: dict[str, BaseReader] = {
     ".jpg": unstructured,
     ".tiff": unstructured,
     ".tif": unstructured,
-    ".pdf": PDFThumbnailReader(),
+    ".pdf": PDFThumbnailReader(
+        thumbnail_dir=getattr(flowsettings, "KH_THUMBNAIL_OUTPUT_DIR", None)
+    ),
     ".txt": TxtReader(),
     ".md": TxtReader(),
 }
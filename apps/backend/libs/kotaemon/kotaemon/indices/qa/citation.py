@@ -64,30 +64,36 @@ class CitationPipeline(BaseComponent):
         ]
         return messages, llm_kwargs
 
+    def parse_output(self, llm_output) -> CiteEvidence | None:
+        """Extract the cited evidences from the LLM tool call"""
+        if not llm_output.additional_kwargs.get("tool_calls"):
+            return None
+
+        first_func = llm_output.additional_kwargs["tool_calls"][0]
+
+        if "function" in first_func:
+            # openai and cohere format
+            function_output = first_func["function"]["arguments"]
+        else:
+            # anthropic format
+            function_output = first_func["args"]
+
+        print("CitationPipeline:", function_output)
+
+        if isinstance(function_output, str):
+            output = CiteEvidence.parse_raw(function_output)
+        else:
+            output = CiteEvidence.parse_obj(function_output)
+
+        return output
+
     def invoke(self, context: str, question: str):
         messages, llm_kwargs = self.prepare_llm(context, question)
         try:
             print("CitationPipeline: invoking LLM")
             llm_output = self.get_from_path("llm").invoke(messages, **llm_kwargs)
             print("CitationPipeline: finish invoking LLM")
-            if not llm_output.additional_kwargs.get("tool_calls"):
-                return None
-
-            first_func = llm_output.additional_kwargs["tool_calls"][0]
-
-            if "function" in first_func:
-                # openai and cohere format
-                function_output = first_func["function"]["arguments"]
-            else:
-                # anthropic format
-                function_output = first_func["args"]
-
-            print("CitationPipeline:", function_output)
-
-            if isinstance(function_output, str):
-                output = CiteEvidence.parse_raw(function_output)
-            else:
-                output = CiteEvidence.parse_obj(function_output)
+            output = self.parse_output(llm_output)
         except Exception as e:
             print(e)
             return None
@@ -95,4 +101,12 @@ class CitationPipeline(BaseComponent):
         return output
 
     async def ainvoke(self, context: str, question: str):
-        raise NotImplementedError()
+        messages, llm_kwargs = self.prepare_llm(context, question)
+        try:
+            llm_output = await self.get_from_path("llm").ainvoke(messages, **llm_kwargs)
+            output = self.parse_output(llm_output)
+        except Exception as e:
+            print(e)
+            return None
+
+        return output
@@ -1,6 +1,7 @@
+import asyncio
 import threading
 from collections import defaultdict
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 import numpy as np
 from decouple import config
@@ -37,6 +38,15 @@ CONTEXT_RELEVANT_WARNING_SCORE = config(
     "CONTEXT_RELEVANT_WARNING_SCORE", 0.3, cast=float
 )
 
+
+async def wait_for_side_task(task: asyncio.Task):
+    """Wait for a citation / mindmap task, giving up after CITATION_TIMEOUT"""
+    try:
+        return await asyncio.wait_for(task, timeout=CITATION_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+
+
 DEFAULT_QA_TEXT_PROMPT = (
     "Use the following pieces of context to answer the question at the end in detail with clear explanation. "  # noqa: E501
     "If you don't know the answer, just say that you don't know, don't try to "
@@ -187,6 +197,67 @@ class AnswerWithContextPipeline(BaseComponent):
         """
         raise NotImplementedError
 
+    def prepare_messages(
+        self,
+        question: str,
+        evidence: str,
+        evidence_mode: int,
+        images: list[str],
+        history: list,
+    ) -> tuple[list, str]:
+        """Prepare the LLM messages, return them with the (formatted) evidence"""
+        # check if evidence exists, use QA prompt
+        if evidence:
+            prompt, evidence = self.get_prompt(question, evidence, evidence_mode)
+        else:
+            prompt = question
+
+        messages = []
+        if self.system_prompt:
+            messages.append(SystemMessage(content=self.system_prompt))
+
+        for human, ai in history[-self.n_last_interactions :]:
+            messages.append(HumanMessage(content=human))
+            messages.append(AIMessage(content=ai))
+
+        if self.use_multimodal and evidence_mode == EVIDENCE_MODE_FIGURE:
+            # create image message:
+            messages.append(
+                HumanMessage(
+                    content=[
+                        {"type": "text", "text": prompt},
+                    ]
+                    + [
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": image},
+                        }
+                        for image in images[:MAX_IMAGES]
+                    ],
+                )
+            )
+        else:
+            # append main prompt
+            messages.append(HumanMessage(content=prompt))
+
+        return messages, evidence
+
+    def make_answer(self, output: str, logprobs: list, citation, mindmap) -> Document:
+        if logprobs:
+            qa_score = np.exp(np.average(logprobs))
+        else:
+            qa_score = None
+
+        return Document(
+            text=output,
+            metadata={
+                "citation_viz": self.enable_citation_viz,
+                "mindmap": mindmap,
+                "citation": citation,
+                "qa_score": qa_score,
+            },
+        )
+
     def stream(  # type: ignore
         self,
         question: str,
@@ -197,11 +268,9 @@ class AnswerWithContextPipeline(BaseComponent):
     ) -> Generator[Document, None, Document]:
         history = kwargs.get("history", [])
         print(f"Got {len(images)} images")
-        # check if evidence exists, use QA prompt
-        if evidence:
-            prompt, evidence = self.get_prompt(question, evidence, evidence_mode)
-        else:
-            prompt = question
+        messages, evidence = self.prepare_messages(
+            question, evidence, evidence_mode, images, history
+        )
 
         # retrieve the citation
         citation = None
@@ -231,34 +300,6 @@ class AnswerWithContextPipeline(BaseComponent):
         output = ""
         logprobs = []
 
-        messages = []
-        if self.system_prompt:
-            messages.append(SystemMessage(content=self.system_prompt))
-
-        for human, ai in history[-self.n_last_interactions :]:
-            messages.append(HumanMessage(content=human))
-            messages.append(AIMessage(content=ai))
-
-        if self.use_multimodal and evidence_mode == EVIDENCE_MODE_FIGURE:
-            # create image message:
-            messages.append(
-                HumanMessage(
-                    content=[
-                        {"type": "text", "text": prompt},
-                    ]
-                    + [
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": image},
-                        }
-                        for image in images[:MAX_IMAGES]
-                    ],
-                )
-            )
-        else:
-            # append main prompt
-            messages.append(HumanMessage(content=prompt))
-
         try:
             # try streaming first
             print("Trying LLM streaming")
@@ -271,27 +312,71 @@ class AnswerWithContextPipeline(BaseComponent):
             output = self.llm(messages).text
             yield Document(channel="chat", content=output)
 
-        if logprobs:
-            qa_score = np.exp(np.average(logprobs))
-        else:
-            qa_score = None
-
         if citation_thread:
             citation_thread.join(timeout=CITATION_TIMEOUT)
         if mindmap_thread:
             mindmap_thread.join(timeout=CITATION_TIMEOUT)
 
-        answer = Document(
-            text=output,
-            metadata={
-                "citation_viz": self.enable_citation_viz,
-                "mindmap": mindmap,
-                "citation": citation,
-                "qa_score": qa_score,
-            },
+        return self.make_answer(output, logprobs, citation, mindmap)
+
+    async def astream(  # type: ignore
+        self,
+        question: str,
+        evidence: str,
+        evidence_mode: int = 0,
+        images: list[str] = [],
+        **kwargs,
+    ) -> AsyncGenerator[Document, None]:
+        """Async version of `stream`
+
+        Citation and mindmap generation run as concurrent tasks alongside the
+        answer streaming. As async generators cannot return a value, the final
+        answer is yielded last as a Document without channel.
+        """
+        history = kwargs.get("history", [])
+        messages, evidence = self.prepare_messages(
+            question, evidence, evidence_mode, images, history
         )
 
-        return answer
+        citation_task = None
+        mindmap_task = None
+        if evidence:
+            if self.enable_citation:
+                citation_task = asyncio.create_task(
+                    self.citation_pipeline.ainvoke(context=evidence, question=question)
+                )
+            if self.enable_mindmap:
+                mindmap_task = asyncio.create_task(
+                    self.create_mindmap_pipeline.ainvoke(
+                        context=evidence, question=question
+                    )
+                )
+
+        output = ""
+        logprobs = []
+        try:
+            try:
+                async for out_msg in self.llm.astream(messages):
+                    output += out_msg.text
+                    logprobs += out_msg.logprobs
+                    yield Document(channel="chat", content=out_msg.text)
+            except NotImplementedError:
+                print("Streaming is not supported, falling back to normal processing")
+                output = (await self.llm.ainvoke(messages)).text
+                yield Document(channel="chat", content=output)
+        except BaseException:
+            for task in (citation_task, mindmap_task):
+                if task:
+                    task.cancel()
+            raise
+
+        citation, mindmap = None, None
+        if citation_task:
+            citation = await wait_for_side_task(citation_task)
+        if mindmap_task:
+            mindmap = await wait_for_side_task(mindmap_task)
+
+        yield self.make_answer(output, logprobs, citation, mindmap)
 
     def match_evidence_with_context(self, answer, docs) -> dict[str, list[dict]]:
         """Match the evidence with the context"""
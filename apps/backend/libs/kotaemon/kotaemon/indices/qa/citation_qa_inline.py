@@ -1,15 +1,21 @@
+import asyncio
 import re
 import threading
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 import numpy as np
 
 from kotaemon.base import AIMessage, Document, HumanMessage, SystemMessage
 from kotaemon.llms import PromptTemplate
 
-from .citation_qa import CITATION_TIMEOUT, MAX_IMAGES, AnswerWithContextPipeline
+from .citation_qa import (
+    CITATION_TIMEOUT,
+    MAX_IMAGES,
+    AnswerWithContextPipeline,
+    wait_for_side_task,
+)
 from .format_context import EVIDENCE_MODE_FIGURE
 from .utils import find_start_end_phrase
 
@@ -319,6 +325,81 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
 
         return answer
 
+    async def astream(  # type: ignore
+        self,
+        question: str,
+        evidence: str,
+        evidence_mode: int = 0,
+        images: list[str] = [],
+        **kwargs,
+    ) -> AsyncGenerator[Document, None]:
+        """Async version of `stream`
+
+        The final answer is yielded last as a Document without channel.
+        """
+        history = kwargs.get("history", [])
+        messages, evidence = self.prepare_messages(
+            question, evidence, evidence_mode, images, history
+        )
+
+        mindmap_task = None
+        if evidence and self.enable_mindmap:
+            mindmap_task = asyncio.create_task(
+                self.create_mindmap_pipeline.ainvoke(
+                    context=evidence, question=question
+                )
+            )
+
+        output = ""
+        final_answer = ""
+        logprobs = []
+
+        try:
+            async for out_msg in self.llm.astream(messages):
+                if evidence:
+                    if START_ANSWER in output:
+                        if not final_answer:
+                            try:
+                                left_over_answer = output.split(START_ANSWER)[
+                                    1
+                                ].lstrip()
+                            except IndexError:
+                                left_over_answer = ""
+                            if left_over_answer:
+                                out_msg.text = left_over_answer + out_msg.text
+
+                        final_answer += (
+                            out_msg.text.lstrip() if not final_answer else out_msg.text
+                        )
+                        yield Document(channel="chat", content=out_msg.text)
+
+                        # check for the edge case of citation list is repeated
+                        # with smaller LLMs
+                        if START_CITATION in out_msg.text:
+                            break
+                else:
+                    yield Document(channel="chat", content=out_msg.text)
+
+                output += out_msg.text
+                logprobs += out_msg.logprobs
+        except BaseException:
+            if mindmap_task:
+                mindmap_task.cancel()
+            raise
+
+        citation = self.answer_to_citations(output)
+        mindmap = await wait_for_side_task(mindmap_task) if mindmap_task else None
+        answer = self.make_answer(final_answer, logprobs, citation, mindmap)
+
+        # yield the final answer
+        final_answer = self.replace_citation_with_link(final_answer)
+
+        if final_answer:
+            yield Document(channel="chat", content=None)
+            yield Document(channel="chat", content=final_answer)
+
+        yield answer
+
     def match_evidence_with_context(self, answer, docs) -> dict[str, list[dict]]:
         """Match the evidence with the context"""
         spans: dict[str, list[dict]] = defaultdict(list)
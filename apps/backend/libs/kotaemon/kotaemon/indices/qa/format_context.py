@@ -1,9 +1,7 @@
 import html
-from functools import partial
-
-import tiktoken
 
 from kotaemon.base import BaseComponent, Document, RetrievedDocument
+from kotaemon.base.tokens import get_token_counter
 from kotaemon.indices.splitters import TokenSplitter
 
 EVIDENCE_MODE_TEXT = 0
@@ -20,6 +18,8 @@ class PrepareEvidencePipeline(BaseComponent):
     Args:
         trim_func: a callback function or a BaseComponent, that splits a large
             chunk of text into smaller ones. The first one will be retained.
+            By default, the evidence is cut to `max_context_length` tokens with
+            the shared token counter.
     """
 
     max_context_length: int = 32000
@@ -31,21 +31,6 @@ class PrepareEvidencePipeline(BaseComponent):
         table_found = 0
         evidence_modes = []
 
-        evidence_trim_func = (
-            self.trim_func
-            if self.trim_func
-            else TokenSplitter(
-                chunk_size=self.max_context_length,
-                chunk_overlap=0,
-                separator=" ",
-                tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-                    allowed_special=set(),
-                    disallowed_special="all",
-                ),
-            )
-        )
-
         for _, retrieved_item in enumerate(docs):
             retrieved_content = ""
             page = retrieved_item.metadata.get("page_label", None)
@@ -107,8 +92,10 @@ class PrepareEvidencePipeline(BaseComponent):
         # trim context by trim_len
         print("len (original)", len(evidence))
         if evidence:
-            texts = evidence_trim_func([Document(text=evidence)])
-            evidence = texts[0].text
+            if self.trim_func:
+                evidence = self.trim_func([Document(text=evidence)])[0].text
+            else:
+                evidence = get_token_counter().trim(evidence, self.max_context_length)
             print("len (trimmed)", len(evidence))
 
         return Document(content=(evidence_mode, evidence, images))
@@ -0,0 +1,125 @@
+"""Exact-substring alignment of quoted text against long contexts
+
+`difflib.SequenceMatcher` finds each longest match with a dynamic program over
+the whole quote and context, which is slow for long chunks. The citation code
+only keeps matches above a minimum size, so here a few sampled k-grams of the
+quote are searched in the context, the hits are extended into maximal matches,
+and the `SequenceMatcher` recursion is replayed on those matches only.
+
+For blocks of at least `min_size` characters, the results are the same as
+`SequenceMatcher(None, a, b, autojunk=False)`.
+"""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+# longest k-gram searched in the context, longer matches are extended from it
+MAX_GRAM_SIZE = 16
+
+
+class Match(NamedTuple):
+    a: int
+    b: int
+    size: int
+
+
+def _find_all(text: str, sub: str):
+    pos = text.find(sub)
+    while pos != -1:
+        yield pos
+        pos = text.find(sub, pos + 1)
+
+
+def maximal_matches(a: str, b: str, min_size: int) -> list[Match]:
+    """All maximal common substrings of `a` and `b` with at least `min_size` chars
+
+    Args:
+        a: the short text, e.g. a quote
+        b: the long text, e.g. a retrieved chunk
+        min_size: the minimum size of the returned matches
+
+    Returns:
+        the matches, sorted by their position in `a` then in `b`
+    """
+    min_size = max(min_size, 1)
+    if len(a) < min_size or len(b) < min_size:
+        return []
+
+    k = min((min_size + 1) // 2, MAX_GRAM_SIZE)
+    # any match of `min_size` chars covers a k-gram of `a` starting at a
+    # multiple of `step`, so only those are looked up
+    step = min_size - k + 1
+    # end in `a` of the last match found on each diagonal (b - a)
+    diagonal_end: dict[int, int] = {}
+    matches = []
+    for i in range(0, len(a) - k + 1, step):
+        for j in _find_all(b, a[i : i + k]):
+            if diagonal_end.get(j - i, -1) > i:
+                continue
+
+            start_a, start_b = i, j
+            while start_a > 0 and start_b > 0 and a[start_a - 1] == b[start_b - 1]:
+                start_a -= 1
+                start_b -= 1
+            end_a, end_b = i + k, j + k
+            while end_a < len(a) and end_b < len(b) and a[end_a] == b[end_b]:
+                end_a += 1
+                end_b += 1
+
+            diagonal_end[j - i] = end_a
+            if end_a - start_a >= min_size:
+                matches.append(Match(start_a, start_b, end_a - start_a))
+
+    return sorted(matches)
+
+
+def _longest_in(
+    matches: list[Match], alo: int, ahi: int, blo: int, bhi: int
+) -> Match | None:
+    """Longest match within a[alo:ahi] and b[blo:bhi], ties broken as in difflib"""
+    best = None
+    for match in matches:
+        offset = max(alo - match.a, blo - match.b, 0)
+        size = min(ahi - match.a, bhi - match.b, match.size) - offset
+        if size <= 0:
+            continue
+        clipped = Match(match.a + offset, match.b + offset, size)
+        if (
+            best is None
+            or size > best.size
+            or (size == best.size and (clipped.a, clipped.b) < (best.a, best.b))
+        ):
+            best = clipped
+    return best
+
+
+def longest_match(a: str, b: str, min_size: int) -> Match | None:
+    """The longest common substring, if it has at least `min_size` chars
+
+    Same as `SequenceMatcher(None, a, b, autojunk=False).find_longest_match()`
+    whenever that match is at least `min_size` long.
+    """
+    return _longest_in(maximal_matches(a, b, min_size), 0, len(a), 0, len(b))
+
+
+def matching_blocks(a: str, b: str, min_size: int) -> list[Match]:
+    """The matching blocks of `a` and `b` with at least `min_size` chars
+
+    Same as the blocks of at least `min_size` chars returned by
+    `SequenceMatcher(None, a, b, autojunk=False).get_matching_blocks()`.
+    """
+    matches = maximal_matches(a, b, min_size)
+    blocks = []
+    queue = [(0, len(a), 0, len(b))]
+    while queue:
+        alo, ahi, blo, bhi = queue.pop()
+        match = _longest_in(matches, alo, ahi, blo, bhi)
+        if match is None or match.size < min_size:
+            continue
+        blocks.append(match)
+        if alo < match.a and blo < match.b:
+            queue.append((alo, match.a, blo, match.b))
+        if match.a + match.size < ahi and match.b + match.size < bhi:
+            queue.append((match.a + match.size, ahi, match.b + match.size, bhi))
+
+    return sorted(blocks)
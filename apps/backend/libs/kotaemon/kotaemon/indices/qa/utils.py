@@ -1,4 +1,6 @@
-from difflib import SequenceMatcher
+import math
+
+from .span_matcher import longest_match, matching_blocks
 
 
 def find_text(search_span, context, min_length=5):
@@ -11,17 +13,12 @@ def find_text(search_span, context, min_length=5):
     # don't search for small text
     if len(search_span) > min_length:
         for sentence in sentence_list:
-            match_results = SequenceMatcher(
-                None,
-                sentence,
-                context,
-                autojunk=False,
-            ).get_matching_blocks()
-
-            matched_blocks = []
-            for _, start, length in match_results:
-                if length > max(len(sentence) * 0.25, min_length):
-                    matched_blocks.append((start, start + length))
+            # only blocks longer than this threshold are kept
+            min_size = math.floor(max(len(sentence) * 0.25, min_length)) + 1
+            matched_blocks = [
+                (start, start + length)
+                for _, start, length in matching_blocks(sentence, context, min_size)
+            ]
 
             if matched_blocks:
                 start_index = min(start for start, _ in matched_blocks)
@@ -55,10 +52,9 @@ def find_start_end_phrase(
         if sentence is None:
             continue
 
-        match = SequenceMatcher(
-            None, sentence, context, autojunk=False
-        ).find_longest_match()
-        if match.size > max(len(sentence) * 0.35, min_length):
+        min_size = math.floor(max(len(sentence) * 0.35, min_length)) + 1
+        match = longest_match(sentence, context, min_size)
+        if match is not None:
             matches.append((match.b, match.b + match.size))
             matched_length += match.size
 
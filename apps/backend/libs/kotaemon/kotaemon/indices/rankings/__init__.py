@@ -1,12 +1,14 @@
 from .base import BaseReranking
 from .cohere import CohereReranking
 from .llm import LLMReranking
+from .llm_listwise import LLMListwiseScoring
 from .llm_scoring import LLMScoring
 from .llm_trulens import LLMTrulensScoring
 
 __all__ = [
     "CohereReranking",
     "LLMReranking",
+    "LLMListwiseScoring",
     "LLMScoring",
     "BaseReranking",
     "LLMTrulensScoring",
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from abc import abstractmethod
 
 from kotaemon.base import BaseComponent, Document
@@ -11,3 +12,12 @@ class BaseReranking(BaseComponent):
         """Main method to transform list of documents
         (re-ranking, filtering, etc)"""
         ...
+
+    async def ainvoke(  # type: ignore
+        self, documents: list[Document], query: str
+    ) -> list[Document]:
+        """Async version of `run`
+
+        Rerankers without a native async client run `run` in a worker thread.
+        """
+        return await asyncio.to_thread(self.run, documents=documents, query=query)
@@ -3,6 +3,7 @@ from __future__ import annotations
 from decouple import config
 
 from kotaemon.base import Document
+from kotaemon.rerankings.cohere import get_cohere_client
 
 from .base import BaseReranking
 
@@ -15,13 +16,6 @@ class CohereReranking(BaseReranking):
     def run(self, documents: list[Document], query: str) -> list[Document]:
         """Use Cohere Reranker model to re-order documents
         with their relevance score"""
-        try:
-            import cohere
-        except ImportError:
-            raise ImportError(
-                "Please install Cohere `pip install cohere` to use Cohere Reranking"
-            )
-
         # try to get COHERE_API_KEY from embeddings
         if not self.cohere_api_key and self.use_key_from_ktem:
             try:
@@ -42,7 +36,7 @@ class CohereReranking(BaseReranking):
             print("Cohere API key not found. Skipping rerankings.")
             return documents
 
-        cohere_client = cohere.Client(self.cohere_api_key)
+        cohere_client = get_cohere_client(self.cohere_api_key)
         compressed_docs: list[Document] = []
 
         if not documents:  # to avoid empty api call
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
 from langchain.output_parsers.boolean import BooleanOutputParser
@@ -32,9 +33,6 @@ class LLMReranking(BaseReranking):
         query: str,
     ) -> list[Document]:
         """Filter down documents based on their relevance to the query."""
-        filtered_docs = []
-        output_parser = BooleanOutputParser()
-
         if self.concurrent:
             with ThreadPoolExecutor() as executor:
                 futures = []
@@ -53,9 +51,37 @@ class LLMReranking(BaseReranking):
                 )
                 results.append(self.llm(_prompt).text)
 
+        return self.filter_documents(documents, results)
+
+    async def ainvoke(  # type: ignore
+        self,
+        documents: list[Document],
+        query: str,
+    ) -> list[Document]:
+        """Filter down documents based on their relevance to the query, with
+        the LLM calls running as concurrent tasks."""
+        results = await asyncio.gather(
+            *[
+                self.llm.ainvoke(
+                    self.prompt_template.populate(
+                        question=query, context=doc.get_content()
+                    )
+                )
+                for doc in documents
+            ]
+        )
+        return self.filter_documents(documents, [result.text for result in results])
+
+    def filter_documents(
+        self, documents: list[Document], results: list[str]
+    ) -> list[Document]:
+        """Keep the documents that the LLM judged relevant"""
+        filtered_docs = []
+        output_parser = BooleanOutputParser()
+
         # use Boolean parser to extract relevancy output from LLM
-        results = [output_parser.parse(result) for result in results]
-        for include_doc, doc in zip(results, documents):
+        parsed = [output_parser.parse(result) for result in results]
+        for include_doc, doc in zip(parsed, documents):
             if include_doc:
                 filtered_docs.append(doc)
 
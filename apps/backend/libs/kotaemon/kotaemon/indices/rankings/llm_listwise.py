@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from kotaemon.base import Document, HumanMessage, Param, SystemMessage
+from kotaemon.base.tokens import get_token_counter
+from kotaemon.llms import PromptTemplate
+from kotaemon.rerankings.cache import (
+    InMemoryRerankScoreCache,
+    lookup_tiers,
+    query_key,
+)
+
+from .llm_trulens import LLMTrulensScoring, re_0_10_rating
+
+LISTWISE_SYSTEM_PROMPT_TEMPLATE = PromptTemplate(
+    """You are a RELEVANCE grader; providing the relevance of each of the given numbered CONTEXTS to the given QUESTION.
+        Score each CONTEXT on its own, as a number from 0 to 10 where 0 is the least relevant and 10 is the most relevant.
+
+        A few additional scoring guidelines:
+
+        - Long CONTEXTS should score equally well as short CONTEXTS.
+
+        - CONTEXT that is RELEVANT to some of the QUESTION should score of 2, 3 or 4. Higher score indicates more RELEVANCE.
+
+        - CONTEXT that is RELEVANT to most of the QUESTION should get a score of 5, 6, 7 or 8. Higher score indicates more RELEVANCE.
+
+        - CONTEXT that is RELEVANT to the entire QUESTION should get a score of 9 or 10. Higher score indicates more RELEVANCE.
+
+        - CONTEXT must be relevant and helpful for answering the entire QUESTION to get a score of 10.
+
+        Respond only with a JSON object mapping the number of every CONTEXT to its score, e.g. {{"1": 7, "2": 0, "3": 10}}. Never elaborate."""  # noqa: E501
+)
+
+LISTWISE_USER_PROMPT_TEMPLATE = PromptTemplate(
+    """QUESTION: {question}
+
+        CONTEXTS:
+        {contexts}
+
+        RELEVANCE (JSON): """
+)  # noqa
+
+PATTERN_SCORE: re.Pattern = re.compile(
+    r"\"?\[?(\d+)\]?\"?\s*[:=]\s*\"?(\d+(?:\.\d+)?)"
+)
+"""Regex that matches `"<context number>": <score>` pairs."""
+
+
+def parse_listwise_scores(s: str, n_contexts: int) -> dict[int, float]:
+    """Extract the 0-10 scores of the contexts numbered from 1 to `n_contexts`
+
+    Returns the scores by 0-based context index. Contexts without a valid score
+    are left out.
+    """
+    scores: dict[int, float] = {}
+    for number, score in PATTERN_SCORE.findall(s):
+        idx, value = int(number) - 1, float(score)
+        if 0 <= idx < n_contexts and 0 <= value <= 10 and idx not in scores:
+            scores[idx] = value
+    return scores
+
+
+class LLMListwiseScoring(LLMTrulensScoring):
+    """Score the relevance of several documents in one LLM call
+
+    Documents are scored `batch_size` at a time, each trimmed to
+    `max_document_tokens`, with up to `max_concurrency` calls in flight.
+    Scores are cached by (LLM, query, document id) in the `caches` tiers, so
+    the documents retrieved again for the same question are not sent to the
+    LLM. A document left out of the LLM answer is scored on its own, with the
+    prompt of `LLMTrulensScoring`.
+    """
+
+    listwise_system_prompt_template: PromptTemplate = LISTWISE_SYSTEM_PROMPT_TEMPLATE
+    listwise_user_prompt_template: PromptTemplate = LISTWISE_USER_PROMPT_TEMPLATE
+    batch_size: int = 10
+    max_concurrency: int = 4
+    max_document_tokens: int = 1000
+    caches: list = Param(
+        default_callback=lambda _: [InMemoryRerankScoreCache()],
+        help="The score cache tiers, fastest first",
+    )
+
+    def llm_id(self) -> str:
+        """Identify the LLM in the cache keys"""
+        llm = self.llm
+        name = f"{llm.__class__.__module__}.{llm.__class__.__qualname__}"
+        for attr in ("model", "model_name", "azure_deployment"):
+            value = getattr(llm, attr, None)
+            if isinstance(value, str) and value:
+                name += f":{value}"
+                break
+        return name
+
+    def cache_key(self, llm_id: str, query_hash: str, doc: Document) -> str:
+        return hashlib.sha256(
+            f"llm-relevance\0{llm_id}\0{query_hash}\0{doc.doc_id}".encode()
+        ).hexdigest()
+
+    def prepare_list_messages(self, documents: list[Document], query: str) -> list:
+        """Prepare the grading messages for a batch of documents"""
+        counter = get_token_counter()
+        contexts = "\n\n".join(
+            f"[{idx}] "
+            + counter.trim(doc.get_content(), self.max_document_tokens).replace(
+                "\n", " "
+            )
+            for idx, doc in enumerate(documents, start=1)
+        )
+        return [
+            SystemMessage(self.listwise_system_prompt_template.populate()),
+            HumanMessage(
+                self.listwise_user_prompt_template.populate(
+                    question=query, contexts=contexts
+                )
+            ),
+        ]
+
+    def _split(
+        self, documents: list[Document], query: str
+    ) -> tuple[dict[str, float], list[str], list[list[tuple[str, Document]]]]:
+        """Look up the cached scores, batching the documents to score"""
+        llm_id, query_hash = self.llm_id(), query_key(query)
+        keys = [self.cache_key(llm_id, query_hash, doc) for doc in documents]
+        found = lookup_tiers(self.caches, keys)
+
+        to_score = list(
+            {key: doc for key, doc in zip(keys, documents) if key not in found}.items()
+        )
+        batch_size = max(self.batch_size, 1)
+        batches = [
+            to_score[i : i + batch_size] for i in range(0, len(to_score), batch_size)
+        ]
+        return found, keys, batches
+
+    def _collect(
+        self, batches: list[list[tuple[str, Document]]], results: list[str]
+    ) -> tuple[dict[str, float], list[tuple[str, Document]]]:
+        """Parse the batch answers, returning the scores and the unscored docs"""
+        scores: dict[str, float] = {}
+        unscored: list[tuple[str, Document]] = []
+        for batch, result in zip(batches, results):
+            parsed = parse_listwise_scores(result, len(batch))
+            for idx, (key, doc) in enumerate(batch):
+                if idx in parsed:
+                    scores[key] = parsed[idx]
+                else:
+                    unscored.append((key, doc))
+        return scores, unscored
+
+    def _rank(
+        self,
+        documents: list[Document],
+        keys: list[str],
+        found: dict[str, float],
+        new_scores: dict[str, float],
+    ) -> list[Document]:
+        if new_scores:
+            for cache in self.caches:
+                cache.set_many(new_scores)
+
+        scores = {**found, **new_scores}
+        for key, doc in zip(keys, documents):
+            doc.metadata["llm_trulens_score"] = scores[key] / self.normalize
+        ranked = sorted(
+            documents, key=lambda doc: doc.metadata["llm_trulens_score"], reverse=True
+        )
+        print(
+            "LLM rerank scores",
+            [doc.metadata["llm_trulens_score"] for doc in ranked],
+        )
+        return ranked
+
+    def run(
+        self,
+        documents: list[Document],
+        query: str,
+    ) -> list[Document]:
+        """Score the documents in batches, with a bounded number of LLM calls"""
+        found, keys, batches = self._split(documents, query)
+
+        results: list[str] = []
+        if batches:
+            with ThreadPoolExecutor(
+                max_workers=max(min(self.max_concurrency, len(batches)), 1)
+            ) as executor:
+                results = list(
+                    executor.map(
+                        lambda batch: self.llm(
+                            self.prepare_list_messages([doc for _, doc in batch], query)
+                        ).text,
+                        batches,
+                    )
+                )
+
+        new_scores, unscored = self._collect(batches, results)
+        for key, doc in unscored:
+            result = self.llm(self.prepare_messages(doc, query)).text
+            new_scores[key] = float(re_0_10_rating(result))
+
+        return self._rank(documents, keys, found, new_scores)
+
+    async def ainvoke(  # type: ignore
+        self,
+        documents: list[Document],
+        query: str,
+    ) -> list[Document]:
+        """Score the documents in batches, with a bounded number of concurrent
+        LLM calls"""
+        found, keys, batches = self._split(documents, query)
+        semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+        async def score(messages: list) -> str:
+            async with semaphore:
+                return (await self.llm.ainvoke(messages)).text
+
+        results = await asyncio.gather(
+            *[
+                score(self.prepare_list_messages([doc for _, doc in batch], query))
+                for batch in batches
+            ]
+        )
+
+        new_scores, unscored = self._collect(batches, list(results))
+        fallback = await asyncio.gather(
+            *[score(self.prepare_messages(doc, query)) for _, doc in unscored]
+        )
+        for (key, _), result in zip(unscored, fallback):
+            new_scores[key] = float(re_0_10_rating(result))
+
+        return self._rank(documents, keys, found, new_scores)
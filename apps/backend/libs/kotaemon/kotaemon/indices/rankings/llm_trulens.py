@@ -1,12 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import re
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
-import tiktoken
-
 from kotaemon.base import Document, HumanMessage, SystemMessage
+from kotaemon.base.tokens import get_encoding
 from kotaemon.indices.splitters import TokenSplitter
 from kotaemon.llms import BaseLLM, PromptTemplate
 
@@ -104,50 +104,47 @@ class LLMTrulensScoring(LLMReranking):
         chunk_overlap=0,
         separator=" ",
         tokenizer=partial(
-            tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
+            get_encoding("gpt-3.5-turbo").encode,
             allowed_special=set(),
             disallowed_special="all",
         ),
     )
 
+    def prepare_messages(self, doc: Document, query: str) -> list:
+        """Prepare the grading messages for a single document"""
+        chunked_doc_content = self.trim_func(
+            [
+                Document(content=doc.get_content())
+                # skip metadata which cause troubles
+            ]
+        )[0].text
+
+        messages = []
+        messages.append(SystemMessage(self.system_prompt_template.populate()))
+        messages.append(
+            HumanMessage(
+                self.user_prompt_template.populate(
+                    question=query, context=chunked_doc_content
+                )
+            )
+        )
+        return messages
+
     def run(
         self,
         documents: list[Document],
         query: str,
     ) -> list[Document]:
         """Filter down documents based on their relevance to the query."""
-        filtered_docs = []
-
         documents = sorted(documents, key=lambda doc: doc.get_content())
         if self.concurrent:
             with ThreadPoolExecutor() as executor:
                 futures = []
                 for doc in documents:
-                    chunked_doc_content = self.trim_func(
-                        [
-                            Document(content=doc.get_content())
-                            # skip metadata which cause troubles
-                        ]
-                    )[0].text
-
-                    messages = []
-                    messages.append(
-                        SystemMessage(self.system_prompt_template.populate())
-                    )
-                    messages.append(
-                        HumanMessage(
-                            self.user_prompt_template.populate(
-                                question=query, context=chunked_doc_content
-                            )
-                        )
-                    )
-
-                    def llm_call():
-                        return self.llm(messages).text
-
-                    futures.append(executor.submit(llm_call))
+                    messages = self.prepare_messages(doc, query)
+                    futures.append(executor.submit(self.llm, messages))
 
-                results = [future.result() for future in futures]
+                results = [future.result().text for future in futures]
         else:
             results = []
             for doc in documents:
@@ -162,14 +159,35 @@ class LLMTrulensScoring(LLMReranking):
                 )
                 results.append(self.llm(messages).text)
 
+        return self.score_documents(documents, results)
+
+    async def ainvoke(  # type: ignore
+        self,
+        documents: list[Document],
+        query: str,
+    ) -> list[Document]:
+        """Score documents based on their relevance to the query, with the LLM
+        calls running as concurrent tasks."""
+        documents = sorted(documents, key=lambda doc: doc.get_content())
+        results = await asyncio.gather(
+            *[self.llm.ainvoke(self.prepare_messages(doc, query)) for doc in documents]
+        )
+        return self.score_documents(documents, [result.text for result in results])
+
+    def score_documents(
+        self, documents: list[Document], results: list[str]
+    ) -> list[Document]:
+        """Attach the LLM relevance scores and sort the documents by them"""
+        filtered_docs = []
+
         # use Boolean parser to extract relevancy output from LLM
-        results = [
+        scores = [
             (r_idx, float(re_0_10_rating(result)) / self.normalize)
             for r_idx, result in enumerate(results)
         ]
-        results.sort(key=lambda x: x[1], reverse=True)
+        scores.sort(key=lambda x: x[1], reverse=True)
 
-        for r_idx, score in results:
+        for r_idx, score in scores:
             doc = documents[r_idx]
             doc.metadata["llm_trulens_score"] = score
             filtered_docs.append(doc)
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
+import asyncio
 import threading
 import uuid
+from itertools import zip_longest
 from pathlib import Path
-from typing import Optional, Sequence, cast
+from typing import Iterator, Optional, Sequence, cast
 
 from theflow.settings import settings as flowsettings
 
 from kotaemon.base import BaseComponent, Document, RetrievedDocument
-from kotaemon.embeddings import BaseEmbeddings
+from kotaemon.embeddings import BaseEmbeddings, EmbeddingScheduler
+from kotaemon.loaders.pdf_loader import resolve_thumbnail
+from kotaemon.rerankings import BaseReranking as BaseModelReranking
 from kotaemon.storages import BaseDocumentStore, BaseVectorStore
 
 from .base import BaseIndexing, BaseRetrieval
@@ -82,15 +86,30 @@ class VectorIndexing(BaseIndexing):
             self.doc_store.add(docs)
 
     def add_to_vectorstore(self, docs: list[Document]):
+        for _ in self.stream_to_vectorstore(docs):
+            pass
+
+    def stream_to_vectorstore(self, docs: list[Document]) -> Iterator[list[Document]]:
+        """Embed and store `docs`, yielding each batch once it is in the store
+
+        Batches are packed and embedded concurrently by `EmbeddingScheduler`, so
+        a batch is written to the vector store while the next ones are still
+        being embedded.
+        """
         # in case we want to skip embedding
-        if self.vector_store:
-            print(f"Getting embeddings for {len(docs)} nodes")
-            embeddings = self.embedding(docs)
-            print("Adding embeddings to vector store")
+        if not self.vector_store or not docs:
+            return
+
+        print(f"Getting embeddings for {len(docs)} nodes")
+        # keep the vectors in one float32 array until they reach the store,
+        # `embed_batch` is not reachable through the tracked child node
+        scheduler = EmbeddingScheduler(self.get_from_path("embedding"))
+        for embeddings in scheduler.run(docs):
             self.vector_store.add(
                 embeddings=embeddings,
-                ids=[t.doc_id for t in docs],
+                ids=[t.doc_id for t in embeddings.documents],
             )
+            yield embeddings.documents
 
     def run(self, text: str | list[str] | Document | list[Document]):
         input_: list[Document] = []
@@ -122,6 +141,10 @@ class VectorRetrieval(BaseRetrieval):
     rerankers: Sequence[BaseReranking] = []
     top_k: int = 5
     first_round_top_k_mult: int = 10
+    # maximum number of first-round candidates sent to the rerankers, 0 for all
+    max_rerank_candidates: int = getattr(
+        flowsettings, "KH_RERANK_MAX_CANDIDATES", 50
+    )
     retrieval_mode: str = "hybrid"  # vector, text, hybrid
 
     def _filter_docs(
@@ -131,17 +154,33 @@ class VectorRetrieval(BaseRetrieval):
             documents = documents[:top_k]
         return documents
 
-    def run(
-        self, text: str | Document, top_k: Optional[int] = None, **kwargs
+    def _rerank_candidates(
+        self, documents: list[RetrievedDocument], top_k: int
     ) -> list[RetrievedDocument]:
-        """Retrieve a list of documents from vector store
+        """Cap the documents sent to the rerankers to `max_rerank_candidates`
 
-        Args:
-            text: the text to retrieve similar documents
-            top_k: number of top similar documents to return
-
-        Returns:
-            list[RetrievedDocument]: list of retrieved documents
+        The full-text and vector hits are interleaved, so the cap keeps the best
+        candidates of both searches.
+        """
+        limit = max(self.max_rerank_candidates, top_k)
+        if not self.max_rerank_candidates or len(documents) <= limit:
+            return documents
+
+        text_hits = [doc for doc in documents if doc.score == -1.0]
+        vector_hits = [doc for doc in documents if doc.score != -1.0]
+        candidates = [
+            doc
+            for pair in zip_longest(text_hits, vector_hits)
+            for doc in pair
+            if doc is not None
+        ]
+        return candidates[:limit]
+
+    def _prepare_query(self, top_k: Optional[int], kwargs: dict):
+        """Resolve the query parameters shared by `run` and `ainvoke`
+
+        Pops the retrieval-specific entries out of `kwargs`, so that the remaining
+        ones can be forwarded to the vector store.
         """
         if top_k is None:
             top_k = self.top_k
@@ -160,9 +199,133 @@ class VectorRetrieval(BaseRetrieval):
                 "retrieve the documents"
             )
 
-        result: list[RetrievedDocument] = []
         # TODO: should declare scope directly in the run params
         scope = kwargs.pop("scope", None)
+        # the files of the chunks in scope, for stores that can filter on file_id
+        file_scope = kwargs.pop("file_ids", None)
+
+        return top_k, top_k_first_round, thumbnail_count, scope, file_scope
+
+    def _merge_hybrid_results(self, ds_docs, vs_docs, vs_scores, vs_ids):
+        result = [
+            RetrievedDocument(**doc.to_dict(), score=-1.0)
+            for doc in ds_docs
+            if doc not in vs_ids
+        ]
+        result += [
+            RetrievedDocument(**doc.to_dict(), score=score)
+            for doc, score in zip(vs_docs, vs_scores)
+        ]
+        print(f"Got {len(vs_docs)} from vectorstore")
+        print(f"Got {len(ds_docs)} from docstore")
+        return result
+
+    def _split_thumbnails(
+        self, result: list[RetrievedDocument], thumbnail_count: int
+    ) -> tuple[
+        set[str],
+        dict[str, RetrievedDocument],
+        list[RetrievedDocument],
+        list[RetrievedDocument],
+    ]:
+        # add page thumbnails to the result if exists
+        thumbnail_doc_ids: set[str] = set()
+        # we should copy the text from retrieved text chunk
+        # to the thumbnail to get relevant LLM score correctly
+        text_thumbnail_docs: dict[str, RetrievedDocument] = {}
+
+        non_thumbnail_docs = []
+        raw_thumbnail_docs = []
+        for doc in result:
+            if doc.metadata.get("type") == "thumbnail":
+                # change type to image to display on UI
+                doc.metadata["type"] = "image"
+                raw_thumbnail_docs.append(doc)
+                continue
+            if (
+                "thumbnail_doc_id" in doc.metadata
+                and len(thumbnail_doc_ids) < thumbnail_count
+            ):
+                thumbnail_id = doc.metadata["thumbnail_doc_id"]
+                thumbnail_doc_ids.add(thumbnail_id)
+                text_thumbnail_docs[thumbnail_id] = doc
+            else:
+                non_thumbnail_docs.append(doc)
+
+        return (
+            thumbnail_doc_ids,
+            text_thumbnail_docs,
+            non_thumbnail_docs,
+            raw_thumbnail_docs,
+        )
+
+    def _merge_thumbnails(
+        self,
+        linked_thumbnail_docs: list[Document],
+        text_thumbnail_docs: dict[str, RetrievedDocument],
+        non_thumbnail_docs: list[RetrievedDocument],
+        raw_thumbnail_docs: list[RetrievedDocument],
+        thumbnail_count: int,
+    ) -> list[RetrievedDocument]:
+        print(
+            "thumbnail docs",
+            len(linked_thumbnail_docs),
+            "non-thumbnail docs",
+            len(non_thumbnail_docs),
+            "raw-thumbnail docs",
+            len(raw_thumbnail_docs),
+        )
+        additional_docs = []
+
+        for thumbnail_doc in linked_thumbnail_docs:
+            text_doc = text_thumbnail_docs[thumbnail_doc.doc_id]
+            # thumbnails saved as files are only read once retrieved
+            if not resolve_thumbnail(thumbnail_doc):
+                non_thumbnail_docs.append(text_doc)
+                continue
+            doc_dict = thumbnail_doc.to_dict()
+            doc_dict["_id"] = text_doc.doc_id
+            doc_dict["content"] = text_doc.content
+            doc_dict["metadata"]["type"] = "image"
+            for key in text_doc.metadata:
+                if key not in doc_dict["metadata"]:
+                    doc_dict["metadata"][key] = text_doc.metadata[key]
+
+            additional_docs.append(RetrievedDocument(**doc_dict, score=text_doc.score))
+
+        result = additional_docs + non_thumbnail_docs
+
+        if not result:
+            # return output from raw retrieved thumbnails
+            raw_thumbnail_docs = [
+                doc for doc in raw_thumbnail_docs if resolve_thumbnail(doc)
+            ]
+            result = self._filter_docs(raw_thumbnail_docs, top_k=thumbnail_count)
+
+        return result
+
+    def run(
+        self, text: str | Document, top_k: Optional[int] = None, **kwargs
+    ) -> list[RetrievedDocument]:
+        """Retrieve a list of documents from vector store
+
+        Args:
+            text: the text to retrieve similar documents
+            top_k: number of top similar documents to return
+
+        Returns:
+            list[RetrievedDocument]: list of retrieved documents
+        """
+        (
+            top_k,
+            top_k_first_round,
+            thumbnail_count,
+            scope,
+            file_scope,
+        ) = self._prepare_query(top_k, kwargs)
+        assert self.doc_store is not None
+
+        result: list[RetrievedDocument] = []
         emb: list[float]
 
         if self.retrieval_mode == "vector":
@@ -180,7 +343,7 @@ class VectorRetrieval(BaseRetrieval):
             docs = []
             if scope:
                 docs = self.doc_store.query(
-                    query, top_k=top_k_first_round, doc_ids=scope
+                    query, top_k=top_k_first_round, doc_ids=scope, file_ids=file_scope
                 )
             result = [RetrievedDocument(**doc.to_dict(), score=-1.0) for doc in docs]
         elif self.retrieval_mode == "hybrid":
@@ -212,7 +375,10 @@ class VectorRetrieval(BaseRetrieval):
                 query = text.text if isinstance(text, Document) else text
                 if scope:
                     ds_docs = self.doc_store.query(
-                        query, top_k=top_k_first_round, doc_ids=scope
+                        query,
+                        top_k=top_k_first_round,
+                        doc_ids=scope,
+                        file_ids=file_scope,
                     )
 
             vs_query_thread = threading.Thread(target=query_vectorstore)
@@ -224,83 +390,127 @@ class VectorRetrieval(BaseRetrieval):
             vs_query_thread.join()
             ds_query_thread.join()
 
-            result = [
-                RetrievedDocument(**doc.to_dict(), score=-1.0)
-                for doc in ds_docs
-                if doc not in vs_ids
-            ]
-            result += [
-                RetrievedDocument(**doc.to_dict(), score=score)
-                for doc, score in zip(vs_docs, vs_scores)
-            ]
-            print(f"Got {len(vs_docs)} from vectorstore")
-            print(f"Got {len(ds_docs)} from docstore")
+            result = self._merge_hybrid_results(ds_docs, vs_docs, vs_scores, vs_ids)
 
         # use additional reranker to re-order the document list
         if self.rerankers and text:
-            for reranker in self.rerankers:
+            result = self._rerank_candidates(result, top_k)
+            for idx, reranker in enumerate(self.rerankers):
                 # if reranker is LLMReranking, limit the document with top_k items only
                 if isinstance(reranker, LLMReranking):
                     result = self._filter_docs(result, top_k=top_k)
-                result = reranker.run(documents=result, query=text)
+                if isinstance(reranker, BaseModelReranking):
+                    # only the last reranker can drop the documents below top_k
+                    top_n = top_k if idx == len(self.rerankers) - 1 else None
+                    result = reranker.run(documents=result, query=text, top_n=top_n)
+                else:
+                    result = reranker.run(documents=result, query=text)
 
         result = self._filter_docs(result, top_k=top_k)
         print(f"Got raw {len(result)} retrieved documents")
 
-        # add page thumbnails to the result if exists
-        thumbnail_doc_ids: set[str] = set()
-        # we should copy the text from retrieved text chunk
-        # to the thumbnail to get relevant LLM score correctly
-        text_thumbnail_docs: dict[str, RetrievedDocument] = {}
-
-        non_thumbnail_docs = []
-        raw_thumbnail_docs = []
-        for doc in result:
-            if doc.metadata.get("type") == "thumbnail":
-                # change type to image to display on UI
-                doc.metadata["type"] = "image"
-                raw_thumbnail_docs.append(doc)
-                continue
-            if (
-                "thumbnail_doc_id" in doc.metadata
-                and len(thumbnail_doc_ids) < thumbnail_count
-            ):
-                thumbnail_id = doc.metadata["thumbnail_doc_id"]
-                thumbnail_doc_ids.add(thumbnail_id)
-                text_thumbnail_docs[thumbnail_id] = doc
-            else:
-                non_thumbnail_docs.append(doc)
-
+        (
+            thumbnail_doc_ids,
+            text_thumbnail_docs,
+            non_thumbnail_docs,
+            raw_thumbnail_docs,
+        ) = self._split_thumbnails(result, thumbnail_count)
         linked_thumbnail_docs = self.doc_store.get(list(thumbnail_doc_ids))
-        print(
-            "thumbnail docs",
-            len(linked_thumbnail_docs),
-            "non-thumbnail docs",
-            len(non_thumbnail_docs),
-            "raw-thumbnail docs",
-            len(raw_thumbnail_docs),
+
+        return self._merge_thumbnails(
+            linked_thumbnail_docs,
+            text_thumbnail_docs,
+            non_thumbnail_docs,
+            raw_thumbnail_docs,
+            thumbnail_count,
         )
-        additional_docs = []
 
-        for thumbnail_doc in linked_thumbnail_docs:
-            text_doc = text_thumbnail_docs[thumbnail_doc.doc_id]
-            doc_dict = thumbnail_doc.to_dict()
-            doc_dict["_id"] = text_doc.doc_id
-            doc_dict["content"] = text_doc.content
-            doc_dict["metadata"]["type"] = "image"
-            for key in text_doc.metadata:
-                if key not in doc_dict["metadata"]:
-                    doc_dict["metadata"][key] = text_doc.metadata[key]
+    async def ainvoke(  # type: ignore
+        self, text: str | Document, top_k: Optional[int] = None, **kwargs
+    ) -> list[RetrievedDocument]:
+        """Async version of `run`
 
-            additional_docs.append(RetrievedDocument(**doc_dict, score=text_doc.score))
+        In hybrid mode, the full-text search runs concurrently with the query
+        embedding and the vector search.
+        """
+        (
+            top_k,
+            top_k_first_round,
+            thumbnail_count,
+            scope,
+            file_scope,
+        ) = self._prepare_query(top_k, kwargs)
+        doc_store = self.doc_store
+        assert doc_store is not None
+        query = text.text if isinstance(text, Document) else text
+
+        async def query_vectorstore():
+            emb = (await self.embedding.ainvoke(text))[0].embedding
+            _, vs_scores, vs_ids = await self.vector_store.aquery(
+                embedding=emb, top_k=top_k_first_round, doc_ids=scope, **kwargs
+            )
+            vs_docs = await doc_store.aget(vs_ids) if vs_ids else []
+            return vs_docs, vs_scores, vs_ids
+
+        async def query_docstore():
+            if not scope:
+                return []
+            return await doc_store.aquery(
+                query, top_k=top_k_first_round, doc_ids=scope, file_ids=file_scope
+            )
 
-        result = additional_docs + non_thumbnail_docs
+        result: list[RetrievedDocument] = []
+        if self.retrieval_mode == "vector":
+            docs, scores, _ = await query_vectorstore()
+            result = [
+                RetrievedDocument(**doc.to_dict(), score=score)
+                for doc, score in zip(docs, scores)
+            ]
+        elif self.retrieval_mode == "text":
+            docs = await query_docstore()
+            result = [RetrievedDocument(**doc.to_dict(), score=-1.0) for doc in docs]
+        elif self.retrieval_mode == "hybrid":
+            (vs_docs, vs_scores, vs_ids), ds_docs = await asyncio.gather(
+                query_vectorstore(), query_docstore()
+            )
+            result = self._merge_hybrid_results(ds_docs, vs_docs, vs_scores, vs_ids)
 
-        if not result:
-            # return output from raw retrieved thumbnails
-            result = self._filter_docs(raw_thumbnail_docs, top_k=thumbnail_count)
+        # use additional reranker to re-order the document list
+        if self.rerankers and text:
+            result = self._rerank_candidates(result, top_k)
+            for idx, reranker in enumerate(self.rerankers):
+                # if reranker is LLMReranking, limit the document with top_k items only
+                if isinstance(reranker, LLMReranking):
+                    result = self._filter_docs(result, top_k=top_k)
+                if isinstance(reranker, BaseModelReranking):
+                    # only the last reranker can drop the documents below top_k
+                    top_n = top_k if idx == len(self.rerankers) - 1 else None
+                    result = await reranker.ainvoke(
+                        documents=result, query=text, top_n=top_n
+                    )
+                else:
+                    result = await reranker.ainvoke(documents=result, query=text)
 
-        return result
+        result = self._filter_docs(result, top_k=top_k)
+        print(f"Got raw {len(result)} retrieved documents")
+
+        (
+            thumbnail_doc_ids,
+            text_thumbnail_docs,
+            non_thumbnail_docs,
+            raw_thumbnail_docs,
+        ) = self._split_thumbnails(result, thumbnail_count)
+        linked_thumbnail_docs = (
+            await doc_store.aget(list(thumbnail_doc_ids)) if thumbnail_doc_ids else []
+        )
+
+        return self._merge_thumbnails(
+            linked_thumbnail_docs,
+            text_thumbnail_docs,
+            non_thumbnail_docs,
+            raw_thumbnail_docs,
+            thumbnail_count,
+        )
 
 
 class TextVectorQA(BaseComponent):
@@ -1,3 +1,4 @@
+import asyncio
 from typing import AsyncGenerator, Iterator
 
 from langchain_core.language_models.base import BaseLanguageModel
@@ -13,13 +14,21 @@ class BaseLLM(BaseComponent):
         raise NotImplementedError
 
     async def ainvoke(self, *args, **kwargs) -> LLMInterface:
-        raise NotImplementedError
+        """Async version of `invoke`
+
+        LLMs without a native async client run `run` in a worker thread.
+        """
+        return await asyncio.to_thread(self.run, *args, **kwargs)
 
     def stream(self, *args, **kwargs) -> Iterator[LLMInterface]:
         raise NotImplementedError
 
-    def astream(self, *args, **kwargs) -> AsyncGenerator[LLMInterface, None]:
-        raise NotImplementedError
+    async def astream(self, *args, **kwargs) -> AsyncGenerator[LLMInterface, None]:
+        """Async version of `stream`
+
+        LLMs without native async streaming yield the whole output at once.
+        """
+        yield await self.ainvoke(*args, **kwargs)
 
     def run(self, *args, **kwargs):
         return self.invoke(*args, **kwargs)
@@ -1,3 +1,5 @@
+import asyncio
+
 import requests
 
 from kotaemon.base import (
@@ -85,4 +87,4 @@ class EndpointChatLLM(ChatLLM):
     async def ainvoke(
         self, messages: str | BaseMessage | list[BaseMessage], **kwargs
     ) -> LLMInterface:
-        return self.invoke(messages, **kwargs)
+        return await asyncio.to_thread(self.invoke, messages, **kwargs)
@@ -11,6 +11,7 @@ from kotaemon.base import (
     Param,
     StructuredOutputLLMInterface,
 )
+from kotaemon.base.openai_clients import get_openai_client
 
 from .base import ChatLLM
 
@@ -264,15 +265,28 @@ class BaseChatOpenAI(ChatLLM):
     ) -> AsyncGenerator[LLMInterface, None]:
         client = self.prepare_client(async_version=True)
         input_messages = self.prepare_message(messages)
-        resp = self.openai_response(
+        resp = await self.aopenai_response(
             client, messages=input_messages, stream=True, **kwargs
         )
 
-        async for chunk in resp:
-            if not chunk.choices:
+        async for c in resp:
+            chunk = c.dict()
+            if not chunk["choices"]:
                 continue
-            if chunk.choices[0].delta.content is not None:
-                yield LLMInterface(content=chunk.choices[0].delta.content)
+            if chunk["choices"][0]["delta"]["content"] is not None:
+                if chunk["choices"][0].get("logprobs") is None:
+                    logprobs = []
+                else:
+                    logprobs = [
+                        logprob["logprob"]
+                        for logprob in chunk["choices"][0]["logprobs"].get(
+                            "content", []
+                        )
+                    ]
+
+                yield LLMInterface(
+                    content=chunk["choices"][0]["delta"]["content"], logprobs=logprobs
+                )
 
 
 class ChatOpenAI(BaseChatOpenAI):
@@ -298,11 +312,11 @@ class ChatOpenAI(BaseChatOpenAI):
         if async_version:
             from openai import AsyncOpenAI
 
-            return AsyncOpenAI(**params)
+            return get_openai_client(AsyncOpenAI, async_version=True, **params)
 
         from openai import OpenAI
 
-        return OpenAI(**params)
+        return get_openai_client(OpenAI, **params)
 
     def prepare_params(self, **kwargs):
         if "tools_pydantic" in kwargs:
@@ -459,11 +473,11 @@ class AzureChatOpenAI(BaseChatOpenAI):
         if async_version:
             from openai import AsyncAzureOpenAI
 
-            return AsyncAzureOpenAI(**params)
+            return get_openai_client(AsyncAzureOpenAI, async_version=True, **params)
 
         from openai import AzureOpenAI
 
-        return AzureOpenAI(**params)
+        return get_openai_client(AzureOpenAI, **params)
 
     def prepare_params(self, **kwargs):
         if "tools_pydantic" in kwargs:
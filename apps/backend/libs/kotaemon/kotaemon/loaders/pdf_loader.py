@@ -1,16 +1,28 @@
 import base64
+import hashlib
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
 from decouple import config
 from fsspec import AbstractFileSystem
+from llama_index.core.readers.file.base import get_default_fs, is_default_fs
 from llama_index.readers.file import PDFReader
 from PIL import Image
 
 from kotaemon.base import Document
 
+logger = logging.getLogger(__name__)
+
 PDF_LOADER_DPI = config("PDF_LOADER_DPI", default=40, cast=int)
+# number of thumbnails waiting to be rendered before the parsing of the next
+# pages waits for them
+PDF_THUMBNAIL_QUEUE_SIZE = config("PDF_THUMBNAIL_QUEUE_SIZE", default=8, cast=int)
 
 
 def get_page_thumbnails(
@@ -38,14 +50,27 @@ def get_page_thumbnails(
 
     output_imgs = []
     for page_number in pages:
-        page = doc.load_page(page_number)
-        pm = page.get_pixmap(dpi=dpi)
-        img = Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
+        img = render_page(doc, page_number, dpi)
         output_imgs.append(convert_image_to_base64(img))
 
     return output_imgs
 
 
+def render_page(doc, page_number: int, dpi: int = PDF_LOADER_DPI) -> Image.Image:
+    """Render a page of a PyMuPDF document"""
+    pm = doc.load_page(page_number).get_pixmap(dpi=dpi)
+    return Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
+
+
+def save_page_thumbnail(doc, page_number: int, path: Path, dpi: int = PDF_LOADER_DPI):
+    """Render a page of a PyMuPDF document to a PNG file, unless it exists"""
+    if path.exists():
+        return
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    render_page(doc, page_number, dpi).save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+
 def convert_image_to_base64(img: Image.Image) -> str:
     # convert the image into base64
     img_bytes = BytesIO()
@@ -56,14 +81,171 @@ def convert_image_to_base64(img: Image.Image) -> str:
     return img_base64
 
 
+@lru_cache(maxsize=256)
+def thumbnail_data_url(path: str) -> str:
+    """The base64 data URL of a PNG thumbnail file"""
+    img_base64 = base64.b64encode(Path(path).read_bytes()).decode("utf-8")
+    return f"data:image/png;base64,{img_base64}"
+
+
+def resolve_thumbnail(doc: Document) -> bool:
+    """Set the `image_origin` of a thumbnail document stored as a file
+
+    Returns:
+        whether the document has an `image_origin`
+    """
+    if "image_origin" in doc.metadata:
+        return True
+    path = doc.metadata.get("thumbnail_path")
+    if not path:
+        return False
+    try:
+        doc.metadata["image_origin"] = thumbnail_data_url(path)
+    except OSError as e:
+        logger.warning(f"Cannot read the page thumbnail {path}: {e}")
+        return False
+    return True
+
+
+def file_digest(file: Path, fs: AbstractFileSystem) -> str:
+    digest = hashlib.sha256()
+    with fs.open(str(file), "rb") as fp:
+        while block := fp.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 class PDFThumbnailReader(PDFReader):
-    """PDF parser with thumbnail for each page."""
+    """PDF parser with thumbnail for each page.
+
+    Pages are parsed one at a time (see `iter_pages`). When `thumbnail_dir` is
+    set, thumbnails are rendered in a background thread while the next pages
+    are parsed and saved as PNG files, in a sub-directory named after the
+    `file_id` of `extra_info` (or else the hash of the file content), so that
+    they are deleted with the file. Thumbnail documents then only hold the file
+    path in `thumbnail_path`, which `resolve_thumbnail` turns into the
+    `image_origin` data URL when the thumbnail is retrieved. Without
+    `thumbnail_dir`, the data URL is stored in the document.
 
-    def __init__(self) -> None:
+    Args:
+        thumbnail_dir: directory where the thumbnails are saved
+        dpi: resolution of the thumbnails
+    """
+
+    def __init__(
+        self, thumbnail_dir: Optional[str | Path] = None, dpi: int = PDF_LOADER_DPI
+    ) -> None:
         """
         Initialize PDFReader.
         """
         super().__init__(return_full_document=False)
+        self.thumbnail_dir = thumbnail_dir
+        self.dpi = dpi
+
+    def iter_pages(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        fs: Optional[AbstractFileSystem] = None,
+    ) -> Iterator[list[Document]]:
+        """Parse the file page by page
+
+        Pages whose label is not a number are skipped. When saved to files, all
+        the thumbnails are written once the iteration is complete.
+
+        Yields:
+            the text document and the thumbnail document of each page
+        """
+        try:
+            import fitz
+            import pypdf
+        except ImportError:
+            raise ImportError(
+                "Please install PyMuPDF and pypdf: 'pip install PyMuPDF pypdf'"
+            )
+
+        file = Path(file)
+        extra_info = extra_info or {}
+        fs = fs or get_default_fs()
+
+        thumbnail_dir = None
+        if self.thumbnail_dir is not None:
+            thumbnail_dir = Path(self.thumbnail_dir) / (
+                extra_info.get("file_id") or file_digest(file, fs)
+            )
+            thumbnail_dir.mkdir(parents=True, exist_ok=True)
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail")
+        pending: deque[Future] = deque()
+        with fs.open(str(file), "rb") as fp, fitz.open(file) as thumbnail_pdf:
+            try:
+                stream = fp if is_default_fs(fs) else BytesIO(fp.read())
+                pdf = pypdf.PdfReader(stream)
+                # computed once, `PdfReader.page_labels` builds the whole list
+                page_labels = pdf.page_labels
+
+                for page_number, page_label in enumerate(page_labels):
+                    try:
+                        int(page_label)
+                    except ValueError:
+                        continue
+
+                    text_doc = Document(
+                        text=pdf.pages[page_number].extract_text(),
+                        metadata={
+                            "page_label": page_label,
+                            "file_name": file.name,
+                            **extra_info,
+                        },
+                    )
+
+                    if thumbnail_dir is None:
+                        thumbnail = {
+                            "image_origin": convert_image_to_base64(
+                                render_page(thumbnail_pdf, page_number, self.dpi)
+                            )
+                        }
+                    else:
+                        path = thumbnail_dir / f"{page_number}.png"
+                        pending.append(
+                            executor.submit(
+                                save_page_thumbnail,
+                                thumbnail_pdf,
+                                page_number,
+                                path,
+                                self.dpi,
+                            )
+                        )
+                        thumbnail = {"thumbnail_path": str(path)}
+
+                    thumbnail_doc = Document(
+                        text="Page thumbnail",
+                        metadata={
+                            **thumbnail,
+                            "type": "thumbnail",
+                            "page_label": page_label,
+                            **extra_info,
+                        },
+                    )
+                    yield [text_doc, thumbnail_doc]
+
+                    while len(pending) > PDF_THUMBNAIL_QUEUE_SIZE:
+                        pending.popleft().result()
+
+                while pending:
+                    pending.popleft().result()
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def lazy_load_data(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        fs: Optional[AbstractFileSystem] = None,
+    ) -> Iterator[Document]:
+        """Parse file, yielding the documents of each page as it is parsed."""
+        for page_docs in self.iter_pages(file, extra_info, fs):
+            yield from page_docs
 
     def load_data(
         self,
@@ -72,46 +254,4 @@ class PDFThumbnailReader(PDFReader):
         fs: Optional[AbstractFileSystem] = None,
     ) -> List[Document]:
         """Parse file."""
-        documents = super().load_data(file, extra_info, fs)
-
-        page_numbers_str = []
-        filtered_docs = []
-        is_int_page_number: dict[str, bool] = {}
-
-        for doc in documents:
-            if "page_label" in doc.metadata:
-                page_num_str = doc.metadata["page_label"]
-                page_numbers_str.append(page_num_str)
-                try:
-                    _ = int(page_num_str)
-                    is_int_page_number[page_num_str] = True
-                    filtered_docs.append(doc)
-                except ValueError:
-                    is_int_page_number[page_num_str] = False
-                    continue
-
-        documents = filtered_docs
-        page_numbers = list(range(len(page_numbers_str)))
-
-        print("Page numbers:", len(page_numbers))
-        page_thumbnails = get_page_thumbnails(file, page_numbers)
-
-        documents.extend(
-            [
-                Document(
-                    text="Page thumbnail",
-                    metadata={
-                        "image_origin": page_thumbnail,
-                        "type": "thumbnail",
-                        "page_label": page_number,
-                        **(extra_info if extra_info is not None else {}),
-                    },
-                )
-                for (page_thumbnail, page_number) in zip(
-                    page_thumbnails, page_numbers_str
-                )
-                if is_int_page_number[page_number]
-            ]
-        )
-
-        return documents
+        return list(self.lazy_load_data(file, extra_info, fs))
@@ -1,6 +1,23 @@
 from .base import BaseReranking
+from .cache import (
+    BaseRerankScoreCache,
+    CachedReranking,
+    InMemoryRerankScoreCache,
+    SQLiteRerankScoreCache,
+)
 from .cohere import CohereReranking
+from .fastembed import FastEmbedReranking
 from .tei_fast_rerank import TeiFastReranking
 from .voyageai import VoyageAIReranking
 
-__all__ = ["BaseReranking", "TeiFastReranking", "CohereReranking", "VoyageAIReranking"]
+__all__ = [
+    "BaseReranking",
+    "BaseRerankScoreCache",
+    "CachedReranking",
+    "InMemoryRerankScoreCache",
+    "SQLiteRerankScoreCache",
+    "TeiFastReranking",
+    "CohereReranking",
+    "FastEmbedReranking",
+    "VoyageAIReranking",
+]
@@ -1,13 +1,34 @@
 from __future__ import annotations
 
+import asyncio
 from abc import abstractmethod
+from typing import Optional
 
 from kotaemon.base import BaseComponent, Document
 
 
 class BaseReranking(BaseComponent):
     @abstractmethod
-    def run(self, documents: list[Document], query: str) -> list[Document]:
+    def run(
+        self, documents: list[Document], query: str, top_n: Optional[int] = None
+    ) -> list[Document]:
         """Main method to transform list of documents
-        (re-ranking, filtering, etc)"""
+        (re-ranking, filtering, etc)
+
+        Args:
+            documents: the documents to re-rank
+            query: the query to score the documents against
+            top_n: number of best documents to return, all of them if None
+        """
         ...
+
+    async def ainvoke(  # type: ignore
+        self, documents: list[Document], query: str, top_n: Optional[int] = None
+    ) -> list[Document]:
+        """Async version of `run`
+
+        Rerankers without a native async client run `run` in a worker thread.
+        """
+        return await asyncio.to_thread(
+            self.run, documents=documents, query=query, top_n=top_n
+        )
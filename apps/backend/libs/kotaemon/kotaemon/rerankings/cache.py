@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence
+
+from kotaemon.base import Document, Param
+
+from .base import BaseReranking
+
+
+def query_key(query: str) -> str:
+    """Hash a query, ignoring case and whitespace differences"""
+    return hashlib.sha256(" ".join(query.lower().split()).encode()).hexdigest()
+
+
+def reranking_model_id(reranker: BaseReranking) -> str:
+    """Identify the model behind a reranking component, for cache keys"""
+    if isinstance(reranker, CachedReranking):
+        return reranker.model_id
+
+    name = f"{reranker.__class__.__module__}.{reranker.__class__.__qualname__}"
+    for attr in ("model_name", "model", "endpoint_url"):
+        value = getattr(reranker, attr, None)
+        if isinstance(value, str) and value:
+            name += f":{value}"
+            break
+    return name
+
+
+def lookup_tiers(caches: Sequence, keys: Sequence[str]) -> dict:
+    """Look up `keys` in cache tiers ordered fastest first
+
+    Each tier is only asked for the keys the faster ones missed, and its hits
+    are promoted to the faster tiers. Works with any cache exposing `lookup`
+    and `set_many`, such as the reranking score and embedding caches.
+    """
+    found: dict = {}
+    remaining = list(dict.fromkeys(keys))
+    for idx, cache in enumerate(caches):
+        if not remaining:
+            break
+        tier_found = cache.lookup(remaining)
+        if tier_found:
+            # promote to the faster tiers
+            for upper in caches[:idx]:
+                upper.set_many(tier_found)
+            found.update(tier_found)
+            remaining = [key for key in remaining if key not in tier_found]
+    return found
+
+
+class BaseRerankScoreCache:
+    """Store reranking scores by key
+
+    Subclasses implement `get_many` and `set_many`. Hits and misses are
+    counted by `lookup`.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, float]:
+        raise NotImplementedError
+
+    def set_many(self, items: dict[str, float]):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def lookup(self, keys: Sequence[str]) -> dict[str, float]:
+        found = self.get_many(keys)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def cache_info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class InMemoryRerankScoreCache(BaseRerankScoreCache):
+    """LRU cache in process memory
+
+    Args:
+        maxsize: maximum number of scores to keep
+        ttl: seconds after which an entry expires, None to never expire
+    """
+
+    def __init__(self, maxsize: int = 65536, ttl: Optional[float] = None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._store: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, float]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._store.get(key)
+                if item is None:
+                    continue
+                expires_at, score = item
+                if expires_at < now:
+                    del self._store[key]
+                    continue
+                self._store.move_to_end(key)
+                found[key] = score
+        return found
+
+    def set_many(self, items: dict[str, float]):
+        expires_at = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            for key, score in items.items():
+                self._store[key] = (expires_at, float(score))
+                self._store.move_to_end(key)
+            while len(self._store) > self.maxsize:
+                self._store.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+
+    def cache_info(self) -> dict:
+        return {**super().cache_info(), "size": len(self._store)}
+
+
+class SQLiteRerankScoreCache(BaseRerankScoreCache):
+    """Persistent cache in a SQLite file, shared across processes and restarts
+
+    Args:
+        path: path to the SQLite database file
+        ttl: seconds after which an entry expires, None to never expire
+    """
+
+    def __init__(self, path: str | Path, ttl: Optional[float] = None):
+        super().__init__()
+        self.path = str(path)
+        self.ttl = ttl
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "key TEXT PRIMARY KEY, score REAL NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, float]:
+        if not keys:
+            return {}
+        min_created_at = time.time() - self.ttl if self.ttl else 0.0
+        found = {}
+        with self._lock:
+            # stay below SQLite's limit on the number of bound parameters
+            for start in range(0, len(keys), 500):
+                batch = list(keys[start : start + 500])
+                rows = self._conn.execute(
+                    "SELECT key, score FROM scores "
+                    f"WHERE key IN ({', '.join('?' * len(batch))}) "
+                    "AND created_at >= ?",
+                    [*batch, min_created_at],
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def set_many(self, items: dict[str, float]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO scores (key, score, created_at) "
+                "VALUES (?, ?, ?)",
+                [(key, float(score), now) for key, score in items.items()],
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM scores")
+
+
+class CachedReranking(BaseReranking):
+    """Wrap a reranking model with a tiered cache of its scores
+
+    Scores are keyed on (model id, query hash, document id), so the documents
+    already scored for a query are not sent to the model again. The tiers are
+    looked up in order; a hit in a lower tier is copied to the tiers above it,
+    and the misses are scored in one call to the wrapped model. The wrapped model
+    scores all the misses, so that they are all cached, and `top_n` is applied
+    to the merged ranking.
+
+    Args:
+        reranker: the reranking model to wrap
+        caches: the cache tiers, fastest first
+        model_id: overrides the model identifier used in the cache keys
+    """
+
+    reranker: BaseReranking
+    caches: list = Param(
+        default_callback=lambda _: [InMemoryRerankScoreCache()],
+        help="The cache tiers, fastest first",
+    )
+    model_id: str = Param(
+        default_callback=lambda obj: reranking_model_id(obj.reranker),
+        help="Identify the wrapped model in the cache keys",
+    )
+
+    def cache_key(self, query_hash: str, doc: Document) -> str:
+        return hashlib.sha256(
+            f"{self.model_id}\0{query_hash}\0{doc.doc_id}".encode()
+        ).hexdigest()
+
+    def cache_info(self) -> list[dict]:
+        return [
+            {"tier": cache.__class__.__name__, **cache.cache_info()}
+            for cache in self.caches
+        ]
+
+    def _split(
+        self, documents: list[Document], query: str
+    ) -> tuple[str, list[Document], list[Document]]:
+        """Set the cached scores, returning the hits and the documents to score"""
+        query_hash = query_key(query)
+        keys = [self.cache_key(query_hash, doc) for doc in documents]
+        found = lookup_tiers(self.caches, keys)
+
+        hits: dict[str, Document] = {}
+        to_score: dict[str, Document] = {}
+        for key, doc in zip(keys, documents):
+            if key in found:
+                doc.metadata["reranking_score"] = found[key]
+                hits.setdefault(key, doc)
+            elif key not in to_score:
+                to_score[key] = doc
+        return query_hash, list(hits.values()), list(to_score.values())
+
+    def _merge(
+        self,
+        query_hash: str,
+        hits: list[Document],
+        scored: list[Document],
+        top_n: Optional[int],
+    ) -> list[Document]:
+        new_items = {
+            self.cache_key(query_hash, doc): doc.metadata["reranking_score"]
+            for doc in scored
+            if doc.metadata.get("reranking_score") is not None
+        }
+        if new_items:
+            for cache in self.caches:
+                cache.set_many(new_items)
+
+        if not hits:
+            return scored[:top_n]
+
+        return sorted(
+            hits + scored,
+            key=lambda doc: doc.metadata.get("reranking_score", float("-inf")),
+            reverse=True,
+        )[:top_n]
+
+    def run(
+        self, documents: list[Document], query: str, top_n: Optional[int] = None
+    ) -> list[Document]:
+        query_hash, hits, to_score = self._split(documents, query)
+        scored = (
+            self.reranker.run(documents=to_score, query=query)
+            if to_score
+            else []
+        )
+        return self._merge(query_hash, hits, scored, top_n)
+
+    async def ainvoke(  # type: ignore
+        self, documents: list[Document], query: str, top_n: Optional[int] = None
+    ) -> list[Document]:
+        query_hash, hits, to_score = self._split(documents, query)
+        scored = (
+            await self.reranker.ainvoke(documents=to_score, query=query)
+            if to_score
+            else []
+        )
+        return self._merge(query_hash, hits, scored, top_n)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import os
+from functools import lru_cache
+from typing import Optional
 
 from decouple import config
 
@@ -9,6 +11,20 @@ from kotaemon.base import Document, Param
 from .base import BaseReranking
 
 
+@lru_cache(maxsize=None)
+def get_cohere_client(api_key: str, base_url: Optional[str] = None):
+    """The shared Cohere client of `api_key` and `base_url`, which keeps its
+    connection pool between requests"""
+    try:
+        import cohere
+    except ImportError:
+        raise ImportError(
+            "Please install Cohere " "`pip install cohere` to use Cohere Reranking"
+        )
+
+    return cohere.Client(api_key, base_url=base_url)
+
+
 class CohereReranking(BaseReranking):
     """Cohere Reranking model"""
 
@@ -31,22 +47,17 @@ class CohereReranking(BaseReranking):
         required=False,
     )
 
-    def run(self, documents: list[Document], query: str) -> list[Document]:
+    def run(
+        self, documents: list[Document], query: str, top_n: Optional[int] = None
+    ) -> list[Document]:
         """Use Cohere Reranker model to re-order documents
         with their relevance score"""
-        try:
-            import cohere
-        except ImportError:
-            raise ImportError(
-                "Please install Cohere " "`pip install cohere` to use Cohere Reranking"
-            )
-
         if not self.cohere_api_key or "COHERE_API_KEY" in self.cohere_api_key:
             print("Cohere API key not found. Skipping rerankings.")
             return documents
 
-        cohere_client = cohere.Client(
-            self.cohere_api_key, base_url=self.base_url or os.getenv("CO_API_URL")
+        cohere_client = get_cohere_client(
+            self.cohere_api_key, self.base_url or os.getenv("CO_API_URL")
         )
         compressed_docs: list[Document] = []
 
@@ -55,7 +66,7 @@ class CohereReranking(BaseReranking):
 
         _docs = [d.content for d in documents]
         response = cohere_client.rerank(
-            model=self.model_name, query=query, documents=_docs
+            model=self.model_name, query=query, documents=_docs, top_n=top_n
         )
         for r in response.results:
             doc = documents[r.index]
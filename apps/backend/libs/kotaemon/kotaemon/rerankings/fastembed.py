@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+from kotaemon.base import Document, Param
+
+from .base import BaseReranking
+
+if TYPE_CHECKING:
+    from fastembed.rerank.cross_encoder import TextCrossEncoder
+
+_load_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _inference_slots(model_name: str, max_concurrency: int) -> threading.Semaphore:
+    return threading.BoundedSemaphore(max(max_concurrency, 1))
+
+
+@lru_cache(maxsize=None)
+def _load_cross_encoder(
+    model_name: str, threads: Optional[int], cache_dir: Optional[str]
+) -> "TextCrossEncoder":
+    try:
+        from fastembed.rerank.cross_encoder import TextCrossEncoder
+    except ImportError:
+        raise ImportError("Please install FastEmbed: `pip install fastembed`")
+
+    return TextCrossEncoder(model_name=model_name, threads=threads, cache_dir=cache_dir)
+
+
+class FastEmbedReranking(BaseReranking):
+    """Rerank with a cross-encoder run locally on CPU by fastembed (ONNX Runtime)
+
+    The model is loaded on first use and shared by the instances with the same
+    settings. Documents are sorted by length and grouped into batches whose
+    padded size stays within `max_batch_tokens`, so that short chunks are not
+    padded to the length of the longest one. Token counts are estimated from
+    the text length, to avoid tokenizing twice.
+
+    Supported models: https://qdrant.github.io/fastembed/examples/Supported_Models/
+    """
+
+    model_name: str = Param(
+        "Xenova/ms-marco-MiniLM-L-6-v2",
+        help=(
+            "Cross-encoder model for fastembed. Please refer "
+            "[here](https://qdrant.github.io/fastembed/examples/Supported_Models/) "
+            "for the list of supported models."
+        ),
+        required=True,
+    )
+    batch_size: int = Param(64, help="Maximum number of documents per batch")
+    max_batch_tokens: int = Param(
+        16384, help="Maximum number of tokens per batch, counting the padding"
+    )
+    max_tokens: int = Param(
+        512,
+        help="Maximum number of tokens of a (query, document) pair, beyond which "
+        "the model truncates it",
+    )
+    threads: Optional[int] = Param(
+        None, help="Number of onnxruntime threads, None for the onnxruntime default"
+    )
+    max_concurrency: int = Param(
+        1,
+        help=(
+            "Number of reranking requests running the model at the same time, the "
+            "others wait so that the CPU is not oversubscribed"
+        ),
+    )
+    cache_dir: Optional[str] = Param(
+        None, help="Directory of the downloaded models, e.g. for offline use"
+    )
+
+    def _get_encoder(self) -> "TextCrossEncoder":
+        with _load_lock:
+            return _load_cross_encoder(self.model_name, self.threads, self.cache_dir)
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+    def _batches(self, query: str, documents: list[Document]) -> list[list[int]]:
+        """Group the indices of `documents` by length, within the batch limits"""
+        query_tokens = self._estimate_tokens(query) + 3  # [CLS] and [SEP]s
+        lengths = [
+            min(query_tokens + self._estimate_tokens(doc.content), self.max_tokens)
+            for doc in documents
+        ]
+
+        batches: list[list[int]] = []
+        batch: list[int] = []
+        for idx in sorted(range(len(documents)), key=lambda i: lengths[i]):
+            # sorted by length, so the new document is the longest of the batch
+            if batch and (
+                len(batch) >= self.batch_size
+                or (len(batch) + 1) * lengths[idx] > self.max_batch_tokens
+            ):
+                batches.append(batch)
+                batch = []
+            batch.append(idx)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def run(
+        self, documents: list[Document], query: str, top_n: Optional[int] = None
+    ) -> list[Document]:
+        """Score the documents with the cross-encoder, best first"""
+        if not documents:
+            return []
+
+        encoder = self._get_encoder()
+        scores: list[float] = [0.0] * len(documents)
+        with _inference_slots(self.model_name, self.max_concurrency):
+            for batch in self._batches(query, documents):
+                batch_scores = encoder.rerank(
+                    query,
+                    [documents[idx].content for idx in batch],
+                    batch_size=len(batch),
+                )
+                for idx, score in zip(batch, batch_scores):
+                    scores[idx] = float(score)
+
+        for doc, score in zip(documents, scores):
+            doc.metadata["reranking_score"] = score
+        ranked = sorted(
+            range(len(documents)), key=lambda idx: scores[idx], reverse=True
+        )
+        return [documents[idx] for idx in ranked[:top_n]]
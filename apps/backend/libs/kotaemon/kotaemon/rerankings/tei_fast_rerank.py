@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import requests
@@ -36,8 +37,11 @@ class TeiFastReranking(BaseReranking):
             "maximum number of tokens supported by the reranker model."
         ),
     )
+    batch_size: int = Param(6, help="Number of documents per request")
+    max_concurrency: int = Param(4, help="Number of requests sent concurrently")
 
     def client(self, query, texts):
+        truncated_texts = texts
         if self.is_truncated:
             max_tokens = self.max_tokens  # default is 512 tokens.
             truncated_texts = [text[:max_tokens] for text in texts]
@@ -52,9 +56,24 @@ class TeiFastReranking(BaseReranking):
         ).json()
         return response
 
-    def run(self, documents: list[Document], query: str) -> list[Document]:
+    def _score_batch(self, query: str, mini_batch: list[Document]) -> list[Document]:
+        rerank_resp = self.client(query, [d.content for d in mini_batch])
+        scored_docs = []
+        for r in rerank_resp:
+            doc = mini_batch[r["index"]]
+            doc.metadata["reranking_score"] = r["score"]
+            scored_docs.append(doc)
+        return scored_docs
+
+    def run(
+        self, documents: list[Document], query: str, top_n: Optional[int] = None
+    ) -> list[Document]:
         """Use the deployed TEI rerankings service to re-order documents
-        with their relevance score"""
+        with their relevance score
+
+        The documents are sent in mini-batches of `batch_size`, up to
+        `max_concurrency` of them at a time.
+        """
         if not self.endpoint_url:
             print("TEI API reranking URL not found. Skipping rerankings.")
             return documents
@@ -67,22 +86,24 @@ class TeiFastReranking(BaseReranking):
         if isinstance(documents[0], str):
             documents = self.prepare_input(documents)
 
-        batch_size = 6
-        num_batch = max(len(documents) // batch_size, 1)
-        for i in range(num_batch):
-            if i == num_batch - 1:
-                mini_batch = documents[batch_size * i :]
-            else:
-                mini_batch = documents[batch_size * i : batch_size * (i + 1)]
-
-            _docs = [d.content for d in mini_batch]
-            rerank_resp = self.client(query, _docs)
-            for r in rerank_resp:
-                doc = mini_batch[r["index"]]
-                doc.metadata["reranking_score"] = r["score"]
-                compressed_docs.append(doc)
+        batch_size = max(self.batch_size, 1)
+        mini_batches = [
+            documents[i : i + batch_size] for i in range(0, len(documents), batch_size)
+        ]
+        if len(mini_batches) == 1 or self.max_concurrency <= 1:
+            for mini_batch in mini_batches:
+                compressed_docs.extend(self._score_batch(query, mini_batch))
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(self.max_concurrency, len(mini_batches))
+            ) as executor:
+                for scored_docs in executor.map(
+                    lambda mini_batch: self._score_batch(query, mini_batch),
+                    mini_batches,
+                ):
+                    compressed_docs.extend(scored_docs)
 
         compressed_docs = sorted(
             compressed_docs, key=lambda x: x.metadata["reranking_score"], reverse=True
         )
-        return compressed_docs
+        return compressed_docs[:top_n]
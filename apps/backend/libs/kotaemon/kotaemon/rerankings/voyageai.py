@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import importlib
+from typing import Optional
 
 from decouple import config
 from theflow import Param
@@ -49,7 +50,9 @@ class VoyageAIReranking(BaseReranking):
         self._client = _import_voyageai().Client(api_key=self.api_key)
         self._aclient = _import_voyageai().AsyncClient(api_key=self.api_key)
 
-    def run(self, documents: list[Document], query: str) -> list[Document]:
+    def run(
+        self, documents: list[Document], query: str, top_n: Optional[int] = None
+    ) -> list[Document]:
         """Use VoyageAI Reranker model to re-order documents
         with their relevance score"""
         compressed_docs: list[Document] = []
@@ -59,7 +62,7 @@ class VoyageAIReranking(BaseReranking):
 
         _docs = [d.content for d in documents]
         response = self._client.rerank(
-            model=self.model_name, query=query, documents=_docs
+            model=self.model_name, query=query, documents=_docs, top_k=top_n
         )
         for r in response.results:
             doc = documents[r.index]
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List, Optional, Union
 
@@ -43,11 +44,52 @@ class BaseDocumentStore(ABC):
 
     @abstractmethod
     def query(
-        self, query: str, top_k: int = 10, doc_ids: Optional[list] = None
+        self,
+        query: str,
+        top_k: int = 10,
+        doc_ids: Optional[list] = None,
+        file_ids: Optional[list] = None,
     ) -> List[Document]:
-        """Search document store using search query"""
+        """Search document store using search query
+
+        Args:
+            query: the search query
+            top_k: number of documents to return
+            doc_ids: restrict the search to these document ids
+            file_ids: the files `doc_ids` belong to. Stores that can filter on the
+                `file_id` metadata may use it instead of the (longer) `doc_ids`.
+        """
+        ...
+
+    def refresh_indices(self):
+        """Make pending writes visible to `query`
+
+        Stores that index on write don't need to do anything.
+        """
         ...
 
+    async def aget(self, ids: Union[List[str], str]) -> List[Document]:
+        """Async version of `get`
+
+        Stores without a native async client run `get` in a worker thread.
+        """
+        return await asyncio.to_thread(self.get, ids)
+
+    async def aquery(
+        self,
+        query: str,
+        top_k: int = 10,
+        doc_ids: Optional[list] = None,
+        file_ids: Optional[list] = None,
+    ) -> List[Document]:
+        """Async version of `query`
+
+        Stores without a native async client run `query` in a worker thread.
+        """
+        return await asyncio.to_thread(
+            self.query, query, top_k=top_k, doc_ids=doc_ids, file_ids=file_ids
+        )
+
     @abstractmethod
     def delete(self, ids: Union[List[str], str]):
         """Delete document by id"""
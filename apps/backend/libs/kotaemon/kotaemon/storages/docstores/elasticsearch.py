@@ -100,6 +100,10 @@ class ElasticsearchDocumentStore(BaseDocumentStore):
         if refresh_indices:
             self.client.indices.refresh(index=self.index_name)
 
+    def refresh_indices(self):
+        """Request Elasticsearch to update its index"""
+        self.client.indices.refresh(index=self.index_name)
+
     def query_raw(self, query: dict) -> List[Document]:
         """Query Elasticsearch store using query format of ES client
 
@@ -122,7 +126,11 @@ class ElasticsearchDocumentStore(BaseDocumentStore):
         return docs
 
     def query(
-        self, query: str, top_k: int = 10, doc_ids: Optional[list] = None
+        self,
+        query: str,
+        top_k: int = 10,
+        doc_ids: Optional[list] = None,
+        file_ids: Optional[list] = None,
     ) -> List[Document]:
         """Search Elasticsearch docstore using search query (BM25)
 
@@ -82,7 +82,11 @@ class InMemoryDocumentStore(BaseDocumentStore):
         self._store = {key: Document.from_dict(value) for key, value in store.items()}
 
     def query(
-        self, query: str, top_k: int = 10, doc_ids: Optional[list] = None
+        self,
+        query: str,
+        top_k: int = 10,
+        doc_ids: Optional[list] = None,
+        file_ids: Optional[list] = None,
     ) -> List[Document]:
         """Perform full-text search on document store"""
         return []
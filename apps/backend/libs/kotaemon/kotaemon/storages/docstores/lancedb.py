@@ -1,17 +1,109 @@
+import atexit
 import json
+import logging
+import math
+import re
+import threading
+import time
+import weakref
+from collections import Counter
+from pathlib import Path
 from typing import List, Optional, Union
 
 from kotaemon.base import Document
 
 from .base import BaseDocumentStore
 
+logger = logging.getLogger(__name__)
+
 MAX_DOCS_TO_GET = 10**4
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+# stores that defer their full-text index rebuild, refreshed on exit by a single
+# hook for the process
+_deferred_stores: "weakref.WeakSet[LanceDBDocumentStore]" = weakref.WeakSet()
+
+
+def _refresh_deferred_stores():
+    for store in list(_deferred_stores):
+        try:
+            store.refresh_indices()
+        except Exception:
+            logger.exception(
+                f"Failed to rebuild the full-text index of {store.collection_name}"
+            )
+
+
+atexit.register(_refresh_deferred_stores)
+
+
+def _tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def _in_filter(column: str, values: list[str]) -> str:
+    values_str = ", ".join([f"'{value}'" for value in values])
+    return f"{column} in ({values_str})"
+
+
+def _bm25_scores(
+    query: str, texts: list[str], k1: float = 1.2, b: float = 0.75
+) -> list[float]:
+    """Score `texts` against `query` with BM25, using `texts` as the corpus"""
+    query_terms = set(_tokenize(query))
+    if not query_terms or not texts:
+        return [0.0] * len(texts)
+
+    term_freqs = [Counter(_tokenize(text)) for text in texts]
+    avg_len = sum(sum(tf.values()) for tf in term_freqs) / len(texts) or 1.0
+    doc_freqs = {
+        term: sum(1 for tf in term_freqs if term in tf) for term in query_terms
+    }
+
+    scores = []
+    for tf in term_freqs:
+        doc_len = sum(tf.values())
+        score = 0.0
+        for term in query_terms:
+            if term not in tf:
+                continue
+            idf = math.log(
+                1 + (len(texts) - doc_freqs[term] + 0.5) / (doc_freqs[term] + 0.5)
+            )
+            score += idf * (
+                tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * doc_len / avg_len))
+            )
+        scores.append(score)
+    return scores
 
 
 class LanceDBDocumentStore(BaseDocumentStore):
-    """LancdDB document store which support full-text search query"""
+    """LancdDB document store which support full-text search query
+
+    Args:
+        path: the lancedb uri
+        collection_name: the table name
+        fts_refresh_delay: if None, the full-text index is rebuilt on every
+            `add`/`delete`. Otherwise, writes only mark the index as stale and
+            the rebuild runs once, this many seconds after the last write (or
+            when `refresh_indices` is called). Rows written since the last
+            rebuild are searched by a brute-force scan in the meantime.
+        fts_refresh_max_delay: in deferred mode, the longest a write waits for
+            the rebuild while more writes keep coming, default to 10 times
+            `fts_refresh_delay`. The rebuild also runs as soon as
+            `fts_refresh_max_pending` rows are waiting for it. A marker
+            file next to the table records that a rebuild is pending, so that
+            the index is rebuilt on open after a crash or restart.
+    """
 
-    def __init__(self, path: str = "lancedb", collection_name: str = "docstore"):
+    def __init__(
+        self,
+        path: str = "lancedb",
+        collection_name: str = "docstore",
+        fts_refresh_delay: Optional[float] = None,
+        fts_refresh_max_delay: Optional[float] = None,
+        fts_refresh_max_pending: int = MAX_DOCS_TO_GET,
+    ):
         try:
             import lancedb
         except ImportError:
@@ -21,8 +113,35 @@ class LanceDBDocumentStore(BaseDocumentStore):
 
         self.db_uri = path
         self.collection_name = collection_name
+        self.fts_refresh_delay = fts_refresh_delay
+        if fts_refresh_max_delay is None and fts_refresh_delay is not None:
+            fts_refresh_max_delay = 10 * fts_refresh_delay
+        self.fts_refresh_max_delay = fts_refresh_max_delay
+        self.fts_refresh_max_pending = fts_refresh_max_pending
         self.db_connection = lancedb.connect(self.db_uri)  # type: ignore
 
+        # ids written since the last full-text index build
+        self._unindexed_ids: set[str] = set()
+        self._deleted_ids: set[str] = set()
+        self._refresh_timer: Optional[threading.Timer] = None
+        # when the oldest write still waiting for the rebuild was made
+        self._pending_since: Optional[float] = None
+        self._lock = threading.RLock()
+        if fts_refresh_delay is not None:
+            # don't leave the index stale if the process exits mid-debounce
+            _deferred_stores.add(self)
+
+        marker = self._pending_marker()
+        if marker is not None and marker.exists():
+            # rows written by a previous process that were never indexed
+            try:
+                self._create_fts_index()
+                marker.unlink(missing_ok=True)
+            except Exception:
+                logger.exception(
+                    f"Failed to rebuild the full-text index of {collection_name}"
+                )
+
     def add(
         self,
         docs: Union[Document, List[Document]],
@@ -31,16 +150,25 @@ class LanceDBDocumentStore(BaseDocumentStore):
         **kwargs,
     ):
         """Load documents into lancedb storage."""
+        if ids and not isinstance(ids, list):
+            ids = [ids]
+        if not isinstance(docs, list):
+            docs = [docs]
         doc_ids = ids if ids else [doc.doc_id for doc in docs]
         data: list[dict[str, str]] | None = [
             {
                 "id": doc_id,
                 "text": doc.text,
                 "attributes": json.dumps(doc.metadata),
+                "file_id": doc.metadata.get("file_id") or "",
             }
             for doc_id, doc in zip(doc_ids, docs)
         ]
 
+        if self.fts_refresh_delay is not None:
+            # before the write, so that a crash right after it is recovered
+            self._mark_pending()
+
         if self.collection_name not in self.db_connection.table_names():
             if data:
                 document_collection = self.db_connection.create_table(
@@ -49,41 +177,87 @@ class LanceDBDocumentStore(BaseDocumentStore):
         else:
             # add data to existing table
             document_collection = self.db_connection.open_table(self.collection_name)
+            if data and not self._has_file_id(document_collection):
+                # tables created before the file_id column was introduced
+                for row in data:
+                    del row["file_id"]
             if data:
                 document_collection.add(data)
 
-        if refresh_indices:
+        if self.fts_refresh_delay is not None:
+            with self._lock:
+                self._unindexed_ids.update(doc_ids)
+            if refresh_indices:
+                self._schedule_refresh()
+        elif refresh_indices:
             document_collection.create_fts_index(
                 "text",
                 tokenizer_name="en_stem",
                 replace=True,
             )
 
+    @staticmethod
+    def _has_file_id(document_collection) -> bool:
+        return "file_id" in document_collection.schema.names
+
     def query(
-        self, query: str, top_k: int = 10, doc_ids: Optional[list] = None
+        self,
+        query: str,
+        top_k: int = 10,
+        doc_ids: Optional[list] = None,
+        file_ids: Optional[list] = None,
     ) -> List[Document]:
-        if doc_ids:
-            id_filter = ", ".join([f"'{_id}'" for _id in doc_ids])
-            query_filter = f"id in ({id_filter})"
+        with self._lock:
+            stale_ids = self._unindexed_ids | self._deleted_ids
+            unindexed_ids = list(self._unindexed_ids)
+            n_deleted = len(self._deleted_ids)
+
+        try:
+            document_collection = self.db_connection.open_table(self.collection_name)
+        except (ValueError, FileNotFoundError):
+            return []
+
+        file_filter = None
+        if file_ids and self._has_file_id(document_collection):
+            # a handful of file ids instead of thousands of chunk ids
+            file_filter = _in_filter("file_id", file_ids)
+            query_filter: Optional[str] = file_filter
+        elif doc_ids:
+            query_filter = _in_filter("id", doc_ids)
+            unindexed_ids = list(set(unindexed_ids).intersection(doc_ids))
         else:
             query_filter = None
         try:
-            document_collection = self.db_connection.open_table(self.collection_name)
+            # over-fetch so that deleted hits can be dropped without losing top_k
+            limit = top_k + min(n_deleted, MAX_DOCS_TO_GET)
             if query_filter:
                 docs = (
                     document_collection.search(query, query_type="fts")
                     .where(query_filter, prefilter=True)
-                    .limit(top_k)
+                    .limit(limit)
                     .to_list()
                 )
             else:
                 docs = (
                     document_collection.search(query, query_type="fts")
-                    .limit(top_k)
+                    .limit(limit)
                     .to_list()
                 )
         except (ValueError, FileNotFoundError):
             docs = []
+        except Exception:
+            # the full-text index may not be built yet in deferred mode
+            if not unindexed_ids:
+                raise
+            docs = []
+
+        if stale_ids:
+            docs = [doc for doc in docs if doc["id"] not in stale_ids][:top_k]
+        if unindexed_ids:
+            docs = self._merge_unindexed(
+                docs, self._scan_unindexed(query, unindexed_ids, file_filter), top_k
+            )
+
         return [
             Document(
                 id_=doc["id"],
@@ -93,6 +267,54 @@ class LanceDBDocumentStore(BaseDocumentStore):
             for doc in docs
         ]
 
+    def _scan_unindexed(
+        self, query: str, ids: list[str], extra_filter: Optional[str] = None
+    ) -> list[dict]:
+        """Brute-force search the rows that are not in the full-text index yet"""
+        rows = []
+        for start in range(0, len(ids), MAX_DOCS_TO_GET):
+            batch = ids[start : start + MAX_DOCS_TO_GET]
+            query_filter = _in_filter("id", batch)
+            if extra_filter:
+                query_filter = f"({query_filter}) AND ({extra_filter})"
+            try:
+                document_collection = self.db_connection.open_table(
+                    self.collection_name
+                )
+                rows.extend(
+                    document_collection.search()
+                    .where(query_filter)
+                    .limit(len(batch))
+                    .to_list()
+                )
+            except (ValueError, FileNotFoundError):
+                pass
+
+        scores = _bm25_scores(query, [row["text"] or "" for row in rows])
+        for row, score in zip(rows, scores):
+            row["_score"] = score
+        return [row for row in rows if row["_score"] > 0]
+
+    @staticmethod
+    def _merge_unindexed(
+        indexed: list[dict], unindexed: list[dict], top_k: int
+    ) -> list[dict]:
+        """Merge indexed hits with brute-force hits
+
+        The two score scales are not comparable, so each list is normalized by
+        its best score before merging.
+        """
+
+        def normalized(rows: list[dict]) -> list[tuple[float, dict]]:
+            max_score = max((row.get("_score") or 0.0 for row in rows), default=0.0)
+            if max_score <= 0:
+                return [(0.0, row) for row in rows]
+            return [((row.get("_score") or 0.0) / max_score, row) for row in rows]
+
+        merged = normalized(indexed) + normalized(unindexed)
+        merged.sort(key=lambda item: item[0], reverse=True)
+        return [row for _, row in merged[:top_k]]
+
     def get(self, ids: Union[List[str], str]) -> List[Document]:
         """Get document by id"""
         if not isinstance(ids, list):
@@ -134,18 +356,110 @@ class LanceDBDocumentStore(BaseDocumentStore):
         document_collection = self.db_connection.open_table(self.collection_name)
         id_filter = ", ".join([f"'{_id}'" for _id in ids])
         query_filter = f"id in ({id_filter})"
+        if self.fts_refresh_delay is not None:
+            self._mark_pending()
         document_collection.delete(query_filter)
 
-        if refresh_indices:
+        if self.fts_refresh_delay is not None:
+            with self._lock:
+                self._deleted_ids.update(ids)
+                self._unindexed_ids.difference_update(ids)
+            if refresh_indices:
+                self._schedule_refresh()
+        elif refresh_indices:
             document_collection.create_fts_index(
                 "text",
                 tokenizer_name="en_stem",
                 replace=True,
             )
 
+    def _pending_marker(self) -> Optional[Path]:
+        """The file recording a pending full-text index rebuild, for local paths"""
+        if "://" in self.db_uri:
+            return None
+        return Path(self.db_uri) / f"{self.collection_name}.fts_pending"
+
+    def _mark_pending(self):
+        marker = self._pending_marker()
+        if marker is not None and not marker.exists():
+            marker.parent.mkdir(parents=True, exist_ok=True)
+            marker.touch()
+
+    def _create_fts_index(self):
+        if self.collection_name in self.db_connection.table_names():
+            document_collection = self.db_connection.open_table(self.collection_name)
+            document_collection.create_fts_index(
+                "text",
+                tokenizer_name="en_stem",
+                replace=True,
+            )
+
+    def _schedule_refresh(self):
+        """(Re)arm the debounce timer that rebuilds the full-text index
+
+        The rebuild runs right away once too many rows wait for it, and the timer
+        never fires later than `fts_refresh_max_delay` after the oldest write.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._pending_since is None:
+                self._pending_since = now
+            n_pending = len(self._unindexed_ids) + len(self._deleted_ids)
+            delay = min(
+                self.fts_refresh_delay,  # type: ignore
+                self._pending_since + self.fts_refresh_max_delay - now,  # type: ignore
+            )
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+            if n_pending < self.fts_refresh_max_pending and delay > 0:
+                self._refresh_timer = threading.Timer(delay, self.refresh_indices)
+                self._refresh_timer.daemon = True
+                self._refresh_timer.start()
+                return
+
+        self.refresh_indices()
+
+    def refresh_indices(self):
+        """Rebuild the full-text index if there are pending writes"""
+        with self._lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+            self._pending_since = None
+            if not self._unindexed_ids and not self._deleted_ids:
+                return
+            unindexed_ids, self._unindexed_ids = self._unindexed_ids, set()
+            deleted_ids, self._deleted_ids = self._deleted_ids, set()
+
+        try:
+            self._create_fts_index()
+        except Exception:
+            # keep the rows searchable through the brute-force path
+            with self._lock:
+                self._unindexed_ids |= unindexed_ids
+                self._deleted_ids |= deleted_ids
+            raise
+
+        marker = self._pending_marker()
+        with self._lock:
+            # unless more writes came in during the rebuild
+            if marker is not None and not self._unindexed_ids | self._deleted_ids:
+                marker.unlink(missing_ok=True)
+
     def drop(self):
         """Drop the document store"""
+        with self._lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+            self._pending_since = None
+            self._unindexed_ids.clear()
+            self._deleted_ids.clear()
         self.db_connection.drop_table(self.collection_name)
+        marker = self._pending_marker()
+        if marker is not None:
+            marker.unlink(missing_ok=True)
 
     def count(self) -> int:
         raise NotImplementedError
@@ -157,4 +471,7 @@ class LanceDBDocumentStore(BaseDocumentStore):
         return {
             "db_uri": self.db_uri,
             "collection_name": self.collection_name,
+            "fts_refresh_delay": self.fts_refresh_delay,
+            "fts_refresh_max_delay": self.fts_refresh_max_delay,
+            "fts_refresh_max_pending": self.fts_refresh_max_pending,
         }
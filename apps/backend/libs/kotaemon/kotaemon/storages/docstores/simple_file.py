@@ -1,3 +1,4 @@
+import threading
 from pathlib import Path
 from typing import List, Optional, Union
 
@@ -13,6 +14,8 @@ class SimpleFileDocumentStore(InMemoryDocumentStore):
         super().__init__()
         self._path = path
         self._collection_name = collection_name
+        # files can be indexed from several threads, each write rewrites the file
+        self._lock = threading.RLock()
 
         Path(path).mkdir(parents=True, exist_ok=True)
         self._save_path = Path(path) / f"{collection_name}.json"
@@ -46,13 +49,15 @@ class SimpleFileDocumentStore(InMemoryDocumentStore):
             exist_ok: raise error when duplicate doc-id
                 found in the docstore (default to False)
         """
-        super().add(docs=docs, ids=ids, **kwargs)
-        self.save(self._save_path)
+        with self._lock:
+            super().add(docs=docs, ids=ids, **kwargs)
+            self.save(self._save_path)
 
     def delete(self, ids: Union[List[str], str]):
         """Delete document by id"""
-        super().delete(ids=ids)
-        self.save(self._save_path)
+        with self._lock:
+            super().delete(ids=ids)
+            self.save(self._save_path)
 
     def drop(self):
         """Drop the document store"""
@@ -1,14 +1,30 @@
 from __future__ import annotations
 
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Any, Optional
 
+import numpy as np
 from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
 from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from llama_index.core.vector_stores.types import VectorStore as LIVectorStore
 from llama_index.core.vector_stores.types import VectorStoreQuery
 
-from kotaemon.base import DocumentWithEmbedding
+from kotaemon.base import DocumentWithEmbedding, EmbeddingBatch
+
+
+def set_node_metadata_and_ids(
+    nodes: list, metadatas: Optional[list[dict]], ids: Optional[list[str]]
+) -> list:
+    """Set the metadata and ids of the llama-index nodes to add"""
+    if metadatas is not None:
+        for node, metadata in zip(nodes, metadatas):
+            node.metadata = metadata
+    if ids is not None:
+        for node, id in zip(nodes, ids):
+            node.id_ = id
+            node.relationships = {NodeRelationship.SOURCE: RelatedNodeInfo(node_id=id)}
+    return nodes
 
 
 class BaseVectorStore(ABC):
@@ -19,14 +35,15 @@ class BaseVectorStore(ABC):
     @abstractmethod
     def add(
         self,
-        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
         metadatas: Optional[list[dict]] = None,
         ids: Optional[list[str]] = None,
     ) -> list[str]:
         """Add vector embeddings to vector stores
 
         Args:
-            embeddings: List of embeddings
+            embeddings: List of embeddings, or an EmbeddingBatch which stores that
+                support it write from its array without converting each vector
             metadatas: List of metadata of the embeddings
             ids: List of ids of the embeddings
             kwargs: meant for vectorstore-specific parameters
@@ -40,12 +57,34 @@ class BaseVectorStore(ABC):
     def delete(self, ids: list[str], **kwargs):
         """Delete vector embeddings from vector stores
 
+        Stores delete all the ids with as few requests as their backend allows.
+
         Args:
             ids: List of ids of the embeddings to be deleted
             kwargs: meant for vectorstore-specific parameters
         """
         ...
 
+    def upsert(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ) -> list[str]:
+        """Add vector embeddings, replacing the existing ones with the same ids
+
+        Stores without a native upsert delete the ids, then add the embeddings.
+        Takes the same arguments as `add`.
+        """
+        if ids is None:
+            if isinstance(embeddings, EmbeddingBatch):
+                ids = [doc.doc_id for doc in embeddings.documents]
+            elif embeddings and isinstance(embeddings[0], DocumentWithEmbedding):
+                ids = [doc.doc_id for doc in embeddings]  # type: ignore
+        if ids:
+            self.delete(ids)
+        return self.add(embeddings, metadatas, ids)
+
     @abstractmethod
     def query(
         self,
@@ -66,6 +105,31 @@ class BaseVectorStore(ABC):
         """
         ...
 
+    async def aquery(
+        self,
+        embedding: list[float],
+        top_k: int = 1,
+        ids: Optional[list[str]] = None,
+        **kwargs,
+    ) -> tuple[list[list[float]], list[float], list[str]]:
+        """Async version of `query`
+
+        Stores without a native async client run `query` in a worker thread.
+        """
+        return await asyncio.to_thread(
+            self.query, embedding, top_k=top_k, ids=ids, **kwargs
+        )
+
+    def get_vectors(self, ids: list[str]) -> dict[str, np.ndarray]:
+        """Get the stored vectors of `ids`
+
+        Stores that cannot read vectors back return an empty dict.
+
+        Returns:
+            the vector of each id found in the store
+        """
+        return {}
+
     @abstractmethod
     def drop(self):
         """Drop the vector store"""
@@ -112,31 +176,31 @@ class LlamaIndexVectorStore(BaseVectorStore):
 
     def add(
         self,
-        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
         metadatas: Optional[list[dict]] = None,
         ids: Optional[list[str]] = None,
     ):
-        if isinstance(embeddings[0], list):
-            nodes: list[DocumentWithEmbedding] = [
+        if isinstance(embeddings, EmbeddingBatch):
+            nodes: list[DocumentWithEmbedding] = list(embeddings)
+        elif isinstance(embeddings[0], list):
+            nodes = [
                 DocumentWithEmbedding(embedding=embedding) for embedding in embeddings
             ]
         else:
             nodes = embeddings  # type: ignore
-        if metadatas is not None:
-            for node, metadata in zip(nodes, metadatas):
-                node.metadata = metadata
-        if ids is not None:
-            for node, id in zip(nodes, ids):
-                node.id_ = id
-                node.relationships = {
-                    NodeRelationship.SOURCE: RelatedNodeInfo(node_id=id)
-                }
+        set_node_metadata_and_ids(nodes, metadatas, ids)
 
         return self._client.add(nodes=nodes)
 
     def delete(self, ids: list[str], **kwargs):
-        for id_ in ids:
-            self._client.delete(ref_doc_id=id_, **kwargs)
+        if not ids:
+            return
+        try:
+            # the ids are the node ids, which are also their ref_doc_id
+            self._client.delete_nodes(node_ids=ids, **kwargs)
+        except NotImplementedError:
+            for id_ in ids:
+                self._client.delete(ref_doc_id=id_, **kwargs)
 
     def query(
         self,
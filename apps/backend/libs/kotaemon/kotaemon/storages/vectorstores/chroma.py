@@ -1,8 +1,14 @@
 from typing import Any, Dict, List, Optional, Type, cast
 
+import numpy as np
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
 from llama_index.vector_stores.chroma import ChromaVectorStore as LIChromaVectorStore
+from llama_index.vector_stores.chroma.base import MAX_CHUNK_SIZE
 
-from .base import LlamaIndexVectorStore
+from kotaemon.base import DocumentWithEmbedding, EmbeddingBatch
+
+from .base import LlamaIndexVectorStore, set_node_metadata_and_ids
 
 
 class ChromaVectorStore(LlamaIndexVectorStore):
@@ -57,6 +63,64 @@ class ChromaVectorStore(LlamaIndexVectorStore):
         )
         self._client = cast(LIChromaVectorStore, self._client)
 
+    def add(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ):
+        if not isinstance(embeddings, EmbeddingBatch):
+            return super().add(embeddings, metadatas, ids)
+        return self._write_batch(embeddings, metadatas, ids, upsert=False)
+
+    def upsert(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ):
+        if not isinstance(embeddings, EmbeddingBatch):
+            return super().upsert(embeddings, metadatas, ids)
+        return self._write_batch(embeddings, metadatas, ids, upsert=True)
+
+    def _write_batch(
+        self,
+        embeddings: EmbeddingBatch,
+        metadatas: Optional[list[dict]],
+        ids: Optional[list[str]],
+        upsert: bool,
+    ) -> list[str]:
+        # same records as the llama-index store writes, with the vectors passed
+        # to chroma as slices of the batch array
+        collection = self._client.client
+        write = collection.upsert if upsert else collection.add
+        nodes = set_node_metadata_and_ids(
+            [doc.copy() for doc in embeddings.documents], metadatas, ids
+        )
+        for start in range(0, len(nodes), MAX_CHUNK_SIZE):
+            chunk = nodes[start : start + MAX_CHUNK_SIZE]
+            chunk_metadatas = []
+            for node in chunk:
+                metadata = node_to_metadata_dict(
+                    node, remove_text=True, flat_metadata=self._client.flat_metadata
+                )
+                chunk_metadatas.append(
+                    {
+                        key: "" if value is None else value
+                        for key, value in metadata.items()
+                    }
+                )
+            write(
+                embeddings=embeddings.vectors[start : start + len(chunk)],
+                ids=[node.node_id for node in chunk],
+                metadatas=chunk_metadatas,
+                documents=[
+                    node.get_content(metadata_mode=MetadataMode.NONE) for node in chunk
+                ],
+            )
+
+        return [node.node_id for node in nodes]
+
     def delete(self, ids: List[str], **kwargs):
         """Delete vector embeddings from vector stores
 
@@ -64,7 +128,17 @@ class ChromaVectorStore(LlamaIndexVectorStore):
             ids: List of ids of the embeddings to be deleted
             kwargs: meant for vectorstore-specific parameters
         """
-        self._client.client.delete(ids=ids)
+        for start in range(0, len(ids), MAX_CHUNK_SIZE):
+            self._client.client.delete(ids=ids[start : start + MAX_CHUNK_SIZE])
+
+    def get_vectors(self, ids: list[str]) -> dict[str, np.ndarray]:
+        if not ids:
+            return {}
+        result = self._client.client.get(ids=ids, include=["embeddings"])
+        return {
+            id_: np.asarray(vector, dtype=np.float32)
+            for id_, vector in zip(result["ids"], result["embeddings"])
+        }
 
     def drop(self):
         """Delete entire collection from vector stores"""
@@ -2,9 +2,12 @@
 from typing import Any, Optional, Type
 
 import fsspec
+import numpy as np
 from llama_index.core.vector_stores import SimpleVectorStore as LISimpleVectorStore
 from llama_index.core.vector_stores.simple import SimpleVectorStoreData
 
+from kotaemon.base import DocumentWithEmbedding, EmbeddingBatch
+
 from .base import LlamaIndexVectorStore
 
 
@@ -53,6 +56,23 @@ class InMemoryVectorStore(LlamaIndexVectorStore):
         """
         self._client = self._client.from_persist_path(persist_path=load_path, fs=fs)
 
+    def upsert(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ):
+        # the simple store keys its data by node id, adding replaces
+        return self.add(embeddings, metadatas, ids)
+
+    def get_vectors(self, ids: list[str]) -> dict[str, np.ndarray]:
+        embedding_dict = self._client.data.embedding_dict
+        return {
+            id_: np.asarray(embedding_dict[id_], dtype=np.float32)
+            for id_ in ids
+            if id_ in embedding_dict
+        }
+
     def drop(self):
         """Clear the old data"""
         self._data = SimpleVectorStoreData()
@@ -1,10 +1,15 @@
-from typing import Any, List, Type, cast
+from typing import Any, List, Optional, Type, cast
 
+import numpy as np
+from llama_index.core.schema import MetadataMode
 from llama_index.core.vector_stores.types import MetadataFilters
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
 from llama_index.vector_stores.lancedb import LanceDBVectorStore as LILanceDBVectorStore
 from llama_index.vector_stores.lancedb import base as base_lancedb
 
-from .base import LlamaIndexVectorStore
+from kotaemon.base import Document, DocumentWithEmbedding, EmbeddingBatch
+
+from .base import LlamaIndexVectorStore, set_node_metadata_and_ids
 
 # custom monkey patch for LanceDB
 original_to_lance_filter = base_lancedb._to_lance_filter
@@ -26,6 +31,9 @@ def custom_to_lance_filter(
 LILanceDBVectorStore._table_exists = lambda _: False
 base_lancedb._to_lance_filter = custom_to_lance_filter
 
+# number of ids in the predicate of a delete
+DELETE_BATCH_SIZE = 1000
+
 
 class LanceDBVectorStore(LlamaIndexVectorStore):
     _li_class: Type[LILanceDBVectorStore] = LILanceDBVectorStore
@@ -49,7 +57,8 @@ class LanceDBVectorStore(LlamaIndexVectorStore):
         db_connection = lancedb.connect(path)  # type: ignore
         try:
             table = db_connection.open_table(collection_name)
-        except FileNotFoundError:
+        except (FileNotFoundError, ValueError):
+            # newer lancedb versions raise ValueError for a missing table
             table = None
 
         self._kwargs = kwargs
@@ -64,6 +73,110 @@ class LanceDBVectorStore(LlamaIndexVectorStore):
         self._client = cast(LILanceDBVectorStore, self._client)
         self._client._metadata_keys = ["file_id"]
 
+    def add(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ):
+        if not len(embeddings):
+            return []
+
+        # writes the table of the llama-index store directly, through its private
+        # attributes, see test_vectorstore.py::TestLanceDBVectorStore. The
+        # llama-index `add` would also replace the table with its default "overwrite"
+        # mode, instead of appending to it
+        client = self._client
+        nodes, data = self._to_arrow(self._to_batch(embeddings), metadatas, ids)
+        if client._table is None:
+            client._table = client._connection.create_table(
+                client._table_name, data, mode=client.mode
+            )
+        else:
+            client._table.add(data)
+        client._fts_index = None
+
+        return [node.node_id for node in nodes]
+
+    def upsert(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ):
+        client = self._client
+        if not len(embeddings) or client._table is None:
+            return self.add(embeddings, metadatas, ids)
+
+        # a single merge on the id column instead of a delete and an add
+        nodes, data = self._to_arrow(self._to_batch(embeddings), metadatas, ids)
+        (
+            client._table.merge_insert("id")
+            .when_matched_update_all()
+            .when_not_matched_insert_all()
+            .execute(data)
+        )
+        client._fts_index = None
+
+        return [node.node_id for node in nodes]
+
+    @staticmethod
+    def _to_batch(
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+    ) -> EmbeddingBatch:
+        if isinstance(embeddings, EmbeddingBatch):
+            return embeddings
+        if isinstance(embeddings[0], list):
+            return EmbeddingBatch(
+                [Document() for _ in embeddings],
+                np.asarray(embeddings, dtype=np.float32),
+            )
+        return EmbeddingBatch(
+            embeddings,  # type: ignore
+            np.asarray(
+                [doc.embedding for doc in embeddings],  # type: ignore
+                dtype=np.float32,
+            ),
+        )
+
+    def _to_arrow(
+        self,
+        embeddings: EmbeddingBatch,
+        metadatas: Optional[list[dict]],
+        ids: Optional[list[str]],
+    ):
+        """The nodes of the batch, and their rows as an arrow table"""
+        import pyarrow as pa
+
+        # same rows as the llama-index store writes, with the vector column
+        # built from the batch array instead of one python list per row
+        client = self._client
+        nodes = set_node_metadata_and_ids(
+            [doc.copy() for doc in embeddings.documents], metadatas, ids
+        )
+        data = pa.Table.from_pylist(
+            [
+                {
+                    "id": node.node_id,
+                    client.doc_id_key: node.ref_doc_id,
+                    client.text_key: node.get_content(metadata_mode=MetadataMode.NONE),
+                    "metadata": node_to_metadata_dict(
+                        node, remove_text=False, flat_metadata=client.flat_metadata
+                    ),
+                }
+                for node in nodes
+            ]
+        )
+        vectors = embeddings.vectors
+        data = data.add_column(
+            2,
+            client.vector_column_name,
+            pa.FixedSizeListArray.from_arrays(
+                pa.array(vectors.reshape(-1)), vectors.shape[1]
+            ),
+        )
+        return nodes, data
+
     def delete(self, ids: List[str], **kwargs):
         """Delete vector embeddings from vector stores
 
@@ -71,7 +184,34 @@ class LanceDBVectorStore(LlamaIndexVectorStore):
             ids: List of ids of the embeddings to be deleted
             kwargs: meant for vectorstore-specific parameters
         """
-        self._client.delete_nodes(ids)
+        table = self._client._table
+        if table is None:
+            return
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            quoted_ids = ", ".join(
+                "'{}'".format(id_.replace("'", "''"))
+                for id_ in ids[start : start + DELETE_BATCH_SIZE]
+            )
+            table.delete(f"id IN ({quoted_ids})")
+        self._client._fts_index = None
+
+    def get_vectors(self, ids: list[str]) -> dict[str, np.ndarray]:
+        client = self._client
+        if client._table is None or not ids:
+            return {}
+        quoted_ids = ", ".join("'{}'".format(id_.replace("'", "''")) for id_ in ids)
+        rows = (
+            client._table.search()
+            .where(f"id IN ({quoted_ids})")
+            .select(["id", client.vector_column_name])
+            .limit(len(ids))
+            .to_arrow()
+        )
+        vectors = rows[client.vector_column_name].to_numpy(zero_copy_only=False)
+        return {
+            id_: np.asarray(vector, dtype=np.float32)
+            for id_, vector in zip(rows["id"].to_pylist(), vectors)
+        }
 
     def drop(self):
         """Delete entire collection from vector stores"""
@@ -0,0 +1,488 @@
+"""Vector store on memory-mapped float32 segments
+
+Vectors are normalized and appended to fixed-capacity segment files that are
+memory-mapped, so the matrix is read from the page cache instead of being
+loaded in Python objects. Rows are never rewritten: deleting an id only marks
+its row as a tombstone, and adding an existing id deletes its previous row.
+
+Files of a collection, in `path / collection_name`:
+    - meta.json: the dimension and the segment capacity
+    - segment-00000.f32, ...: the vectors, `segment_size` rows per file
+    - rows.jsonl: the id and file id of the rows, one line per `add`
+    - tombstones.i64: the deleted rows
+    - ivf.npz: the centroids and row lists of the IVF index, when built
+"""
+from __future__ import annotations
+
+import json
+import logging
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilters
+
+from kotaemon.base import DocumentWithEmbedding, EmbeddingBatch
+
+from .base import BaseVectorStore
+
+logger = logging.getLogger(__name__)
+
+
+def _grow(array: np.ndarray, size: int, fill) -> np.ndarray:
+    """`array` with room for `size` items, doubling its capacity when needed"""
+    if size <= len(array):
+        return array
+    grown = np.full(max(size, 2 * len(array), 1024), fill, dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the `top_k` highest scores, highest first"""
+    if len(scores) > top_k:
+        indices = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        indices = np.arange(len(scores))
+    return indices[np.argsort(-scores[indices], kind="stable")]
+
+
+class MemmapVectorStore(BaseVectorStore):
+    """Vector store on memory-mapped float32 segments, without external service
+
+    Queries are exact by default: the candidate rows are scored with one matrix
+    product per segment. Filters on `file_id` select the rows of these files
+    before scoring them. For large collections, `build_ivf` clusters the vectors
+    so that only the rows of the `n_probe` nearest clusters are scored; it is
+    called on the first query once `ivf_min_rows` rows are stored when
+    `ivf_lists` is set. Scores are cosine similarities.
+
+    Args:
+        path: directory of the collections
+        collection_name: name of the collection
+        segment_size: number of rows per segment file
+        ivf_lists: number of IVF clusters built automatically, 0 to only search
+            exhaustively unless `build_ivf` is called
+        ivf_min_rows: number of rows from which the IVF index is built
+        n_probe: number of IVF clusters searched by a query
+    """
+
+    def __init__(
+        self,
+        path: str | Path = "./memmap",
+        collection_name: str = "default",
+        segment_size: int = 1 << 17,
+        ivf_lists: int = 0,
+        ivf_min_rows: int = 200_000,
+        n_probe: int = 8,
+        **kwargs: Any,
+    ):
+        self._path = path
+        self._collection_name = collection_name
+        self._dir = Path(path) / collection_name
+        self._segment_size = segment_size
+        self._ivf_lists = ivf_lists
+        self._ivf_min_rows = ivf_min_rows
+        self._n_probe = n_probe
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        self._dim: Optional[int] = None
+        self._segments: list[np.memmap] = []
+        self._n_rows = 0
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._codes: dict[Optional[str], int] = {}
+        # rows of each file and of each IVF cluster, as arrays appended by `add`
+        self._file_rows: dict[int, list[np.ndarray]] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._ivf_rows: list[list[np.ndarray]] = []
+
+        meta_path = self._dir / "meta.json"
+        if not meta_path.exists():
+            return
+
+        meta = json.loads(meta_path.read_text())
+        self._dim = meta["dim"]
+        self._segment_size = meta["segment_size"]
+
+        ids: list[str] = []
+        file_ids: list[Optional[str]] = []
+        with open(self._dir / "rows.jsonl", "rb+") as f:
+            for line in iter(f.readline, b""):
+                try:
+                    batch = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of an interrupted `add`, dropped so that the
+                    # next rows start on a new line
+                    f.truncate(f.tell() - len(line))
+                    break
+                if not line.endswith(b"\n"):
+                    f.write(b"\n")
+                ids.extend(batch["ids"])
+                file_ids.extend(batch["file_ids"])
+
+        n_segments = -(-len(ids) // self._segment_size)
+        for segment_idx in range(n_segments):
+            self._open_segment(segment_idx)
+        self._append_rows(ids, file_ids)
+
+        tombstones_path = self._dir / "tombstones.i64"
+        if tombstones_path.exists():
+            deleted = np.fromfile(tombstones_path, dtype=np.int64)
+            self._alive[deleted[deleted < self._n_rows]] = False
+            for row in deleted:
+                if row < self._n_rows and self._rows.get(self._ids[row]) == row:
+                    del self._rows[self._ids[row]]
+
+        ivf_path = self._dir / "ivf.npz"
+        if ivf_path.exists():
+            with np.load(ivf_path) as ivf:
+                self._set_ivf(ivf["centroids"], ivf["assignments"])
+
+    def _open_segment(self, segment_idx: int) -> np.memmap:
+        assert self._dim is not None
+        segment_path = self._dir / f"segment-{segment_idx:05d}.f32"
+        shape = (self._segment_size, self._dim)
+        if not segment_path.exists():
+            # sparse file, the disk space is only used by the written rows
+            with open(segment_path, "wb") as f:
+                f.truncate(self._segment_size * self._dim * 4)
+        segment = np.memmap(segment_path, dtype=np.float32, mode="r+", shape=shape)
+        self._segments.append(segment)
+        return segment
+
+    def _append_rows(self, ids: list[str], file_ids: list[Optional[str]]):
+        """Record the rows of `ids`, whose vectors are written"""
+        start = self._n_rows
+        end = start + len(ids)
+        self._alive = _grow(self._alive, end, False)
+        self._alive[start:end] = True
+
+        for row, id_ in enumerate(ids, start=start):
+            previous = self._rows.get(id_)
+            if previous is not None:
+                self._alive[previous] = False
+            self._rows[id_] = row
+
+        codes = np.array(
+            [self._codes.setdefault(file_id, len(self._codes)) for file_id in file_ids],
+            dtype=np.int32,
+        )
+        for code in np.unique(codes):
+            rows = start + np.flatnonzero(codes == code)
+            self._file_rows.setdefault(int(code), []).append(rows)
+
+        self._ids.extend(ids)
+        self._n_rows = end
+
+    def _write_vectors(self, vectors: np.ndarray):
+        """Write `vectors` after the last row, opening segments as needed"""
+        row = self._n_rows
+        written = 0
+        while written < len(vectors):
+            segment_idx, offset = divmod(row + written, self._segment_size)
+            if segment_idx == len(self._segments):
+                self._open_segment(segment_idx)
+            segment = self._segments[segment_idx]
+            count = min(len(vectors) - written, self._segment_size - offset)
+            segment[offset : offset + count] = vectors[written : written + count]
+            segment.flush()
+            written += count
+
+    def add(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ) -> list[str]:
+        if isinstance(embeddings, EmbeddingBatch):
+            vectors = embeddings.vectors
+            docs_metadata = [doc.metadata for doc in embeddings.documents]
+            default_ids = [doc.doc_id for doc in embeddings.documents]
+        elif embeddings and isinstance(embeddings[0], DocumentWithEmbedding):
+            vectors = np.array([doc.embedding for doc in embeddings])  # type: ignore
+            docs_metadata = [doc.metadata for doc in embeddings]  # type: ignore
+            default_ids = [doc.doc_id for doc in embeddings]  # type: ignore
+        else:
+            vectors = np.array(embeddings)
+            docs_metadata = [{} for _ in embeddings]
+            default_ids = [None] * len(embeddings)
+
+        if not len(vectors):
+            return []
+
+        ids = list(ids) if ids is not None else default_ids
+        if any(id_ is None for id_ in ids):
+            raise ValueError("MemmapVectorStore needs the ids of the vectors")
+        metadatas = metadatas if metadatas is not None else docs_metadata
+        file_ids = [metadata.get("file_id") for metadata in metadatas]
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._dir.mkdir(parents=True, exist_ok=True)
+                (self._dir / "meta.json").write_text(
+                    json.dumps({"dim": self._dim, "segment_size": self._segment_size})
+                )
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(
+                    f"Expected vectors of dimension {self._dim}, got {vectors.shape[1]}"
+                )
+
+            # the vectors are written before their rows, so that a row is only
+            # recorded once its vector is on disk
+            self._write_vectors(vectors)
+            with open(self._dir / "rows.jsonl", "a") as f:
+                f.write(json.dumps({"ids": ids, "file_ids": file_ids}) + "\n")
+
+            start = self._n_rows
+            self._append_rows(ids, file_ids)  # type: ignore[arg-type]
+            if self._centroids is not None:
+                self._assign_to_ivf(start, vectors)
+
+        return ids  # type: ignore[return-value]
+
+    def upsert(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ) -> list[str]:
+        # adding an existing id already replaces its row
+        return self.add(embeddings, metadatas, ids)
+
+    def delete(self, ids: list[str], **kwargs):
+        with self._lock:
+            rows = [self._rows.pop(id_) for id_ in ids if id_ in self._rows]
+            if not rows:
+                return
+            self._alive[rows] = False
+            with open(self._dir / "tombstones.i64", "ab") as f:
+                f.write(np.array(rows, dtype=np.int64).tobytes())
+
+    def _blocks(self, segments: list[np.memmap], n_rows: int):
+        """The first row and the written vectors of each segment"""
+        for idx, segment in enumerate(segments):
+            start = idx * self._segment_size
+            yield start, segment[: min(self._segment_size, n_rows - start)]
+
+    def _vectors_of(self, rows: np.ndarray) -> np.ndarray:
+        """The vectors of `rows`, gathered segment by segment"""
+        assert self._dim is not None
+        order = np.argsort(rows, kind="stable")
+        sorted_rows = rows[order]
+        output = np.empty((len(rows), self._dim), dtype=np.float32)
+        bounds = np.searchsorted(
+            sorted_rows // self._segment_size, np.arange(len(self._segments) + 1)
+        )
+        for idx, segment in enumerate(self._segments):
+            start, end = bounds[idx], bounds[idx + 1]
+            if start < end:
+                output[order[start:end]] = segment[
+                    sorted_rows[start:end] - idx * self._segment_size
+                ]
+        return output
+
+    def _file_filter(self, filters: Optional[MetadataFilters]) -> Optional[set]:
+        """The file ids selected by `filters`, None when there is no filter"""
+        if not filters or not filters.filters:
+            return None
+
+        file_ids: set = set()
+        for metadata_filter in filters.filters:
+            if not (
+                getattr(metadata_filter, "key", None) == "file_id"
+                and metadata_filter.operator in (FilterOperator.EQ, FilterOperator.IN)
+            ):
+                raise NotImplementedError(
+                    "MemmapVectorStore only filters on file_id with == or in"
+                )
+            value = metadata_filter.value
+            file_ids.update(value if isinstance(value, list) else [value])
+        return file_ids
+
+    def _candidate_rows(
+        self, query: np.ndarray, file_ids: Optional[set], ids: Optional[list[str]]
+    ) -> Optional[np.ndarray]:
+        """The alive rows to score, None to score all of them
+
+        The lock must be held.
+        """
+        rows: Optional[np.ndarray] = None
+        if file_ids is not None:
+            codes = [self._codes[id_] for id_ in file_ids if id_ in self._codes]
+            rows = np.concatenate(
+                [np.zeros(0, dtype=np.int64)]
+                + [chunk for code in codes for chunk in self._file_rows[code]]
+            )
+        elif ids is not None:
+            rows = np.array(
+                [self._rows[id_] for id_ in ids if id_ in self._rows], dtype=np.int64
+            )
+
+        if self._centroids is not None and (
+            rows is None or len(rows) > self._n_rows // 8
+        ):
+            # scoring the rows of the nearest clusters is cheaper than the
+            # exhaustive search on a large share of the collection
+            probed = _top_k(self._centroids @ query, self._n_probe)
+            ivf_rows = np.concatenate(
+                [chunk for idx in probed for chunk in self._ivf_rows[idx]]
+            )
+            rows = ivf_rows if rows is None else np.intersect1d(rows, ivf_rows)
+
+        if rows is None:
+            return None
+        return rows[self._alive[rows]]
+
+    def query(
+        self,
+        embedding: list[float],
+        top_k: int = 1,
+        ids: Optional[list[str]] = None,
+        **kwargs,
+    ) -> tuple[list[list[float]], list[float], list[str]]:
+        if "where" in kwargs:
+            raise NotImplementedError("MemmapVectorStore does not support `where`")
+        file_ids = self._file_filter(kwargs.get("filters"))
+        # the chunk ids of the searched files, redundant with a file filter
+        ids = ids if ids is not None else kwargs.get("doc_ids")
+
+        query = _normalize(np.asarray([embedding], dtype=np.float32))[0]
+        with self._lock:
+            if self._dim is None or top_k <= 0:
+                return [], [], []
+            if (
+                self._ivf_lists
+                and self._centroids is None
+                and self._n_rows >= self._ivf_min_rows
+            ):
+                self.build_ivf(self._ivf_lists)
+            rows = self._candidate_rows(query, file_ids, ids)
+            n_rows = self._n_rows
+            segments = list(self._segments)
+            alive = self._alive
+
+        if rows is not None:
+            scores = self._vectors_of(rows) @ query
+            best = _top_k(scores, top_k)
+            best_rows, best_scores = rows[best], scores[best]
+        else:
+            # exhaustive search, one matrix product per segment
+            candidate_rows, candidate_scores = [], []
+            for start, block in self._blocks(segments, n_rows):
+                scores = block @ query
+                scores[~alive[start : start + len(block)]] = -np.inf
+                best = _top_k(scores, top_k)
+                candidate_rows.append(best + start)
+                candidate_scores.append(scores[best])
+            all_rows = np.concatenate(candidate_rows)
+            all_scores = np.concatenate(candidate_scores)
+            best = _top_k(all_scores, top_k)
+            best = best[np.isfinite(all_scores[best])]
+            best_rows, best_scores = all_rows[best], all_scores[best]
+
+        return (
+            self._vectors_of(best_rows).tolist(),
+            best_scores.tolist(),
+            [self._ids[row] for row in best_rows],
+        )
+
+    def get_vectors(self, ids: list[str]) -> dict[str, np.ndarray]:
+        with self._lock:
+            found = {id_: self._rows[id_] for id_ in ids if id_ in self._rows}
+        if not found:
+            return {}
+        vectors = self._vectors_of(np.array(list(found.values()), dtype=np.int64))
+        return dict(zip(found, vectors))
+
+    def build_ivf(self, n_lists: Optional[int] = None, n_iter: int = 10):
+        """Cluster the stored vectors with k-means for approximate search
+
+        Args:
+            n_lists: number of clusters, defaults to the square root of the number
+                of rows
+            n_iter: number of k-means iterations
+        """
+        with self._lock:
+            n_rows = self._n_rows
+            if not n_rows:
+                return
+            n_lists = min(n_lists or int(np.sqrt(n_rows)), n_rows)
+
+            # fit on a sample, then assign all the rows segment by segment
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(
+                rng.choice(n_rows, size=min(n_rows, 64 * n_lists), replace=False)
+            )
+            sample = self._vectors_of(sample_rows)
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+            for _ in range(n_iter):
+                assignments = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, sample)
+                counts = np.bincount(assignments, minlength=n_lists)
+                non_empty = counts > 0
+                centroids[non_empty] = _normalize(sums[non_empty])
+
+            assignments = np.concatenate(
+                [
+                    np.argmax(block @ centroids.T, axis=1)
+                    for _, block in self._blocks(self._segments, n_rows)
+                ]
+            )
+            self._set_ivf(centroids, assignments)
+            np.savez(
+                self._dir / "ivf.npz", centroids=centroids, assignments=assignments
+            )
+
+    def _set_ivf(self, centroids: np.ndarray, assignments: np.ndarray):
+        self._centroids = centroids
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        self._ivf_rows = [
+            [order[bounds[idx] : bounds[idx + 1]]] for idx in range(len(centroids))
+        ]
+        # rows added after the index was saved
+        start = len(assignments)
+        if start < self._n_rows:
+            rows = np.arange(start, self._n_rows)
+            self._assign_to_ivf(start, self._vectors_of(rows))
+
+    def _assign_to_ivf(self, start: int, vectors: np.ndarray):
+        assert self._centroids is not None
+        assignments = np.argmax(vectors @ self._centroids.T, axis=1)
+        for idx in np.unique(assignments):
+            self._ivf_rows[idx].append(start + np.flatnonzero(assignments == idx))
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def drop(self):
+        """Delete the collection"""
+        with self._lock:
+            self._segments.clear()
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._load()
+
+    def __persist_flow__(self):
+        return {
+            "path": self._path,
+            "collection_name": self._collection_name,
+            "segment_size": self._segment_size,
+            "ivf_lists": self._ivf_lists,
+            "ivf_min_rows": self._ivf_min_rows,
+            "n_probe": self._n_probe,
+        }
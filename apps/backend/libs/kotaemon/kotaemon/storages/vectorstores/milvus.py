@@ -1,7 +1,7 @@
 import os
 from typing import Any, Optional, cast
 
-from kotaemon.base import DocumentWithEmbedding
+from kotaemon.base import DocumentWithEmbedding, EmbeddingBatch
 
 from .base import LlamaIndexVectorStore
 
@@ -66,12 +66,14 @@ class MilvusVectorStore(LlamaIndexVectorStore):
 
     def add(
         self,
-        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
         metadatas: Optional[list[dict]] = None,
         ids: Optional[list[str]] = None,
     ):
         if not self._inited:
-            if isinstance(embeddings[0], list):
+            if isinstance(embeddings, EmbeddingBatch):
+                dim = embeddings.vectors.shape[1]
+            elif isinstance(embeddings[0], list):
                 dim = len(embeddings[0])
             else:
                 dim = len(embeddings[0].embedding)
@@ -92,7 +94,12 @@ class MilvusVectorStore(LlamaIndexVectorStore):
 
     def delete(self, ids: list[str], **kwargs):
         self._lazy_init()
-        super().delete(ids=ids, **kwargs)
+        if not ids:
+            return
+        # the ids are the primary keys, deleted with one request
+        self._client.client.delete(
+            collection_name=self._collection_name, ids=ids, **kwargs
+        )
 
     def drop(self):
         self._client.client.drop_collection(self._collection_name)
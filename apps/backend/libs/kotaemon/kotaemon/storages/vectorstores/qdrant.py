@@ -1,5 +1,7 @@
 from typing import Any, List, Optional, cast
 
+from kotaemon.base import DocumentWithEmbedding, EmbeddingBatch
+
 from .base import LlamaIndexVectorStore
 
 
@@ -46,6 +48,15 @@ class QdrantVectorStore(LlamaIndexVectorStore):
 
         self._client = cast(LIQdrantVectorStore, self._client)
 
+    def upsert(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ):
+        # points written by qdrant replace the ones with the same id
+        return self.add(embeddings, metadatas, ids)
+
     def delete(self, ids: List[str], **kwargs):
         """Delete vector embeddings from vector stores
 
@@ -1,12 +1,14 @@
 """Simple file vector store index."""
+import threading
 from pathlib import Path
 from typing import Any, Optional, Type
 
 import fsspec
+import numpy as np
 from llama_index.core.vector_stores import SimpleVectorStore as LISimpleVectorStore
 from llama_index.core.vector_stores.simple import SimpleVectorStoreData
 
-from kotaemon.base import DocumentWithEmbedding
+from kotaemon.base import DocumentWithEmbedding, EmbeddingBatch
 
 from .base import LlamaIndexVectorStore
 
@@ -31,6 +33,8 @@ class SimpleFileVectorStore(LlamaIndexVectorStore):
         self._collection_name = collection_name
         self._path = path
         self._save_path = Path(path) / collection_name
+        # files can be indexed from several threads, each write rewrites the file
+        self._lock = threading.RLock()
 
         super().__init__(
             data=data,
@@ -45,19 +49,38 @@ class SimpleFileVectorStore(LlamaIndexVectorStore):
 
     def add(
         self,
-        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
         metadatas: Optional[list[dict]] = None,
         ids: Optional[list[str]] = None,
     ):
-        r = super().add(embeddings, metadatas, ids)
-        self._client.persist(str(self._save_path), self._fs)
+        with self._lock:
+            r = super().add(embeddings, metadatas, ids)
+            self._client.persist(str(self._save_path), self._fs)
         return r
 
+    def upsert(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingBatch,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ):
+        # the simple store keys its data by node id, adding replaces
+        return self.add(embeddings, metadatas, ids)
+
     def delete(self, ids: list[str], **kwargs):
-        r = super().delete(ids, **kwargs)
-        self._client.persist(str(self._save_path), self._fs)
+        with self._lock:
+            r = super().delete(ids, **kwargs)
+            self._client.persist(str(self._save_path), self._fs)
         return r
 
+    def get_vectors(self, ids: list[str]) -> dict[str, np.ndarray]:
+        embedding_dict = self._client.data.embedding_dict
+        return {
+            id_: np.asarray(embedding_dict[id_], dtype=np.float32)
+            for id_ in ids
+            if id_ in embedding_dict
+        }
+
     def drop(self):
         self._data = SimpleVectorStoreData()
         self._save_path.unlink(missing_ok=True)
@@ -79,6 +79,16 @@ def if_voyageai_not_installed():
         return False
 
 
+def if_lancedb_not_installed():
+    try:
+        import lancedb  # noqa: F401
+        import tantivy  # noqa: F401
+    except ImportError:
+        return True
+    else:
+        return False
+
+
 skip_when_haystack_not_installed = pytest.mark.skipif(
     if_haystack_not_installed(), reason="Haystack is not installed"
 )
@@ -110,3 +120,7 @@ skip_llama_cpp_not_installed = pytest.mark.skipif(
 skip_when_voyageai_not_installed = pytest.mark.skipif(
     if_voyageai_not_installed(), reason="voyageai is not installed"
 )
+
+skip_when_lancedb_not_installed = pytest.mark.skipif(
+    if_lancedb_not_installed(), reason="lancedb is not installed"
+)
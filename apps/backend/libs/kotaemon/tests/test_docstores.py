@@ -8,9 +8,12 @@ from kotaemon.base import Document
 from kotaemon.storages import (
     ElasticsearchDocumentStore,
     InMemoryDocumentStore,
+    LanceDBDocumentStore,
     SimpleFileDocumentStore,
 )
 
+from .conftest import skip_when_lancedb_not_installed
+
 meta_success = ApiResponseMeta(
     status=200,
     http_version="1.1",
@@ -322,6 +325,97 @@ def test_simplefile_document_store_base_interfaces(tmp_path):
     os.remove(tmp_path / "default.json")
 
 
+@skip_when_lancedb_not_installed
+def test_lancedb_document_store_deferred_fts(tmp_path):
+    """Writes are searchable before the deferred full-text index is rebuilt"""
+    store = LanceDBDocumentStore(
+        path=str(tmp_path), collection_name="test", fts_refresh_delay=3600
+    )
+    store.add(
+        [
+            Document(text="the tenant shall pay rent", id_="a"),
+            Document(text="the landlord shall repair", id_="b"),
+        ]
+    )
+    assert [doc.doc_id for doc in store.query("rent")] == ["a"]
+
+    store.refresh_indices()
+    store.add(Document(text="late rent incurs a fee", id_="c"))
+    assert {doc.doc_id for doc in store.query("rent")} == {"a", "c"}
+    assert [doc.doc_id for doc in store.query("rent", doc_ids=["c"])] == ["c"]
+
+    store.delete("a")
+    assert [doc.doc_id for doc in store.query("rent")] == ["c"]
+
+    store.refresh_indices()
+    assert [doc.doc_id for doc in store.query("rent")] == ["c"]
+    assert [doc.doc_id for doc in store.query("repair")] == ["b"]
+
+
+@skip_when_lancedb_not_installed
+def test_lancedb_document_store_deferred_fts_restart(tmp_path):
+    """Writes not indexed before a crash are indexed when the store is reopened"""
+    store = LanceDBDocumentStore(
+        path=str(tmp_path), collection_name="test", fts_refresh_delay=3600
+    )
+    store.add(Document(text="the tenant shall pay rent", id_="a"))
+    assert (tmp_path / "test.fts_pending").exists()
+
+    # a new process only knows about the rows through the index
+    reopened = LanceDBDocumentStore(
+        path=str(tmp_path), collection_name="test", fts_refresh_delay=3600
+    )
+    assert not (tmp_path / "test.fts_pending").exists()
+    assert [doc.doc_id for doc in reopened.query("rent")] == ["a"]
+
+    reopened.add(Document(text="late rent incurs a fee", id_="b"))
+    reopened.refresh_indices()
+    assert not (tmp_path / "test.fts_pending").exists()
+
+
+@skip_when_lancedb_not_installed
+def test_lancedb_document_store_deferred_fts_limits(tmp_path):
+    """Sustained writes don't postpone the rebuild for ever"""
+    store = LanceDBDocumentStore(
+        path=str(tmp_path),
+        collection_name="test",
+        fts_refresh_delay=3600,
+        fts_refresh_max_pending=3,
+    )
+    store.add(Document(text="the tenant shall pay rent", id_="a"))
+    assert (tmp_path / "test.fts_pending").exists()
+    store.add(
+        [
+            Document(text="late rent incurs a fee", id_="b"),
+            Document(text="the landlord shall repair", id_="c"),
+        ]
+    )
+    assert not (tmp_path / "test.fts_pending").exists()
+
+    store = LanceDBDocumentStore(
+        path=str(tmp_path),
+        collection_name="test",
+        fts_refresh_delay=3600,
+        fts_refresh_max_delay=0,
+    )
+    store.add(Document(text="rent is due monthly", id_="d"))
+    assert not (tmp_path / "test.fts_pending").exists()
+    assert {doc.doc_id for doc in store.query("rent")} == {"a", "b", "d"}
+
+
+@skip_when_lancedb_not_installed
+def test_lancedb_document_store_file_id_filter(tmp_path):
+    store = LanceDBDocumentStore(path=str(tmp_path), collection_name="test")
+    store.add(
+        [
+            Document(text="rent is due", id_="a", metadata={"file_id": "f1"}),
+            Document(text="rent is late", id_="b", metadata={"file_id": "f2"}),
+        ]
+    )
+    assert [doc.doc_id for doc in store.query("rent", file_ids=["f2"])] == ["b"]
+    assert [doc.doc_id for doc in store.query("rent", doc_ids=["a"])] == ["a"]
+
+
 @patch(
     "elastic_transport.Transport.perform_request",
     side_effect=_elastic_search_responses,
@@ -1,16 +1,26 @@
+import base64
 import json
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+import httpx
+import numpy as np
+import openai
+import pytest
 from openai.types.create_embedding_response import CreateEmbeddingResponse
 
-from kotaemon.base import Document, DocumentWithEmbedding
+from kotaemon.base import Document, DocumentWithEmbedding, EmbeddingBatch
 from kotaemon.embeddings import (
     AzureOpenAIEmbeddings,
+    BaseEmbeddings,
+    CachedEmbeddings,
+    EmbeddingScheduler,
     FastEmbedEmbeddings,
+    InMemoryEmbeddingCache,
     LCCohereEmbeddings,
     LCHuggingFaceEmbeddings,
     OpenAIEmbeddings,
+    SQLiteEmbeddingCache,
     VoyageAIEmbeddings,
 )
 
@@ -111,6 +121,206 @@ def test_openai_embeddings_batch_raw(openai_embedding_call):
     openai_embedding_call.assert_called()
 
 
+def test_openai_embeddings_batch_base64():
+    vectors = np.array([[0.1, -0.2, 0.3], [0.4, 0.5, -0.6]], dtype=np.float32)
+    response = openai_embedding_batch.model_copy(deep=True)
+    # the API may list the embeddings out of order
+    for item, idx in zip(response.data, [1, 0]):
+        item.index = idx
+        item.embedding = base64.b64encode(vectors[idx].tobytes()).decode()
+
+    model = OpenAIEmbeddings(api_key="some-key", model="text-embedding-ada-002")
+    with patch(
+        "openai.resources.embeddings.Embeddings.create", return_value=response
+    ) as openai_embedding_call:
+        batch = model.embed_batch(["Hello world", "Goodbye world"])
+        output = model(["Hello world", "Goodbye world"])
+
+    assert openai_embedding_call.call_args.kwargs["encoding_format"] == "base64"
+    assert isinstance(batch, EmbeddingBatch)
+    assert batch.vectors.dtype == np.float32
+    np.testing.assert_array_equal(batch.vectors, vectors)
+    assert_embedding_result(output)
+    assert output[1].text == "Goodbye world"
+    assert output[1].embedding == vectors[1].tolist()
+
+
+def test_openai_embeddings_float_fallback():
+    def create(*args, **kwargs):
+        if "encoding_format" in kwargs:
+            raise api_error(
+                openai.BadRequestError, 400, "Unsupported parameter: encoding_format"
+            )
+        return openai_embedding_batch
+
+    model = OpenAIEmbeddings(api_key="some-key", model="text-embedding-ada-002")
+    with patch(
+        "openai.resources.embeddings.Embeddings.create", side_effect=create
+    ) as openai_embedding_call:
+        output = model(["Hello world", "Goodbye world"])
+        assert_embedding_result(output)
+        assert openai_embedding_call.call_count == 2
+        assert "encoding_format" not in openai_embedding_call.call_args.kwargs
+
+    model = OpenAIEmbeddings(
+        api_key="some-key", model="text-embedding-ada-002", use_base64_encoding=False
+    )
+    with patch(
+        "openai.resources.embeddings.Embeddings.create", side_effect=create
+    ) as openai_embedding_call:
+        assert_embedding_result(model(["Hello world", "Goodbye world"]))
+        assert openai_embedding_call.call_count == 1
+        assert "encoding_format" not in openai_embedding_call.call_args.kwargs
+
+
+def test_openai_embeddings_no_fallback_on_other_errors():
+    model = OpenAIEmbeddings(api_key="some-key", model="text-embedding-ada-002")
+    error = api_error(
+        openai.BadRequestError, 400, "maximum context length is 8192 tokens"
+    )
+    with patch(
+        "openai.resources.embeddings.Embeddings.create", side_effect=error
+    ) as openai_embedding_call:
+        with pytest.raises(openai.BadRequestError):
+            model(["Hello world", "Goodbye world"])
+        assert openai_embedding_call.call_count == 1
+    assert model.use_base64_encoding
+
+
+@patch(
+    "openai.resources.embeddings.Embeddings.create",
+    side_effect=lambda *args, **kwargs: openai_embedding,
+)
+def test_cached_embeddings(openai_embedding_call, tmp_path):
+    model = OpenAIEmbeddings(
+        api_key="some-key",
+        model="text-embedding-ada-002",
+    )
+    memory = InMemoryEmbeddingCache(maxsize=8)
+    disk = SQLiteEmbeddingCache(tmp_path / "embeddings.db")
+    cached = CachedEmbeddings(embedding=model, caches=[memory, disk])
+
+    output = cached("Hello world")
+    assert_embedding_result(output)
+    assert openai_embedding_call.call_count == 1
+
+    # whitespace-normalized text is served from memory
+    again = cached("  Hello   world ")
+    assert again[0].embedding == output[0].embedding
+    assert openai_embedding_call.call_count == 1
+    assert memory.cache_info() == {"hits": 1, "misses": 1, "size": 1}
+
+    # the on-disk tier survives a new process-level cache
+    cached = CachedEmbeddings(
+        embedding=model,
+        caches=[InMemoryEmbeddingCache(), SQLiteEmbeddingCache(disk.path)],
+    )
+    assert cached("Hello world")[0].embedding == output[0].embedding
+    assert openai_embedding_call.call_count == 1
+
+
+class LengthEmbeddings(BaseEmbeddings):
+    embedded: list = []
+
+    def invoke(self, text, *args, **kwargs):
+        docs = self.prepare_input(text)
+        self.embedded.extend(doc.text for doc in docs)
+        return [
+            DocumentWithEmbedding(embedding=[float(len(doc.text)), 0.5], content=doc)
+            for doc in docs
+        ]
+
+
+def test_cached_embeddings_only_embed_new_chunks(tmp_path):
+    model = LengthEmbeddings(embedded=[])
+    embedded = model.embedded
+    disk = SQLiteEmbeddingCache(tmp_path / "chunks.db", typecode="f")
+    cached = CachedEmbeddings(embedding=model, caches=[disk], model_id="length")
+
+    cached(["clause one", "clause two", "clause three"])
+    assert embedded == ["clause one", "clause two", "clause three"]
+
+    # re-indexing an edited file only embeds the changed chunk
+    output = cached(["clause one", "clause 2", "clause three"])
+    assert embedded[3:] == ["clause 2"]
+    assert [doc.embedding for doc in output] == [[10.0, 0.5], [8.0, 0.5], [12.0, 0.5]]
+
+    # the batch path reads hits and new rows into one array
+    batch = cached.embed_batch(["clause one", "clause 3"])
+    assert embedded[4:] == ["clause 3"]
+    np.testing.assert_array_equal(batch.vectors, [[10.0, 0.5], [8.0, 0.5]])
+    assert batch[1].text == "clause 3"
+
+
+def api_error(error_class, status_code, message):
+    response = httpx.Response(
+        status_code, request=httpx.Request("POST", "http://localhost/embeddings")
+    )
+    return error_class(message, response=response, body=None)
+
+
+class FlakyEmbeddings(LengthEmbeddings):
+    requests: list = []
+
+    def count_tokens(self, texts):
+        return [len(text.split()) for text in texts]
+
+    def batch_limits(self):
+        return 3, 6
+
+    def invoke(self, text, *args, **kwargs):
+        docs = self.prepare_input(text)
+        self.requests.append([doc.text for doc in docs])
+        if any(doc.text == "bad chunk" for doc in docs) and len(docs) > 1:
+            raise api_error(openai.BadRequestError, 400, "'$.input' is invalid")
+        return super().invoke(docs)
+
+
+def test_embedding_scheduler():
+    model = FlakyEmbeddings(embedded=[], requests=[])
+    texts = ["a b c", "d e", "f", "g h i j", "bad chunk", "k", "l m n o p q r"]
+    docs = [Document(text=text) for text in texts]
+    scheduler = EmbeddingScheduler(model, max_concurrency=2)
+
+    # batches of at most 3 documents and 6 tokens, an oversized one on its own
+    assert [[doc.text for doc in batch] for batch in scheduler.pack(docs)] == [
+        ["a b c", "d e", "f"],
+        ["g h i j", "bad chunk"],
+        ["k"],
+        ["l m n o p q r"],
+    ]
+
+    batches = list(scheduler.run(docs))
+    assert [doc.text for batch in batches for doc in batch.documents] == texts
+    assert [row[0] for batch in batches for row in batch.vectors] == [
+        float(len(text)) for text in texts
+    ]
+    # only the failed batch was split and sent again
+    assert sorted(model.requests) == sorted(
+        [
+            ["a b c", "d e", "f"],
+            ["g h i j", "bad chunk"],
+            ["g h i j"],
+            ["bad chunk"],
+            ["k"],
+            ["l m n o p q r"],
+        ]
+    )
+
+
+def test_embedding_scheduler_does_not_split_on_other_errors():
+    class UnauthorizedEmbeddings(FlakyEmbeddings):
+        def invoke(self, text, *args, **kwargs):
+            self.requests.append(text)
+            raise api_error(openai.AuthenticationError, 401, "Incorrect API key")
+
+    model = UnauthorizedEmbeddings(embedded=[], requests=[])
+    scheduler = EmbeddingScheduler(model, max_concurrency=2)
+    with pytest.raises(openai.AuthenticationError):
+        list(scheduler.run([Document(text=text) for text in ["a", "b", "c"]]))
+    assert len(model.requests) == 1
+
+
 @skip_when_sentence_bert_not_installed
 @patch(
     "sentence_transformers.SentenceTransformer",
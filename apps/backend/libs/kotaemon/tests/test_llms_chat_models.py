@@ -1,10 +1,12 @@
+import asyncio
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 
 from kotaemon.base.schema import AIMessage, HumanMessage, LLMInterface, SystemMessage
-from kotaemon.llms import AzureChatOpenAI, LlamaCppChat
+from kotaemon.embeddings import OpenAIEmbeddings
+from kotaemon.llms import AzureChatOpenAI, ChatOpenAI, LlamaCppChat
 
 try:
     pass
@@ -73,6 +75,28 @@ def test_azureopenai_model(openai_completion):
     openai_completion.assert_called()
 
 
+def test_openai_clients_are_shared():
+    llm = ChatOpenAI(api_key="dummy", model="gpt-4o-mini")
+    other_llm = ChatOpenAI(api_key="dummy", model="gpt-4o")
+    embedding = OpenAIEmbeddings(api_key="dummy", model="text-embedding-3-small")
+    assert llm.prepare_client() is other_llm.prepare_client()
+    assert llm.prepare_client() is embedding.prepare_client()
+    assert (
+        llm.prepare_client()
+        is not ChatOpenAI(api_key="other", model="gpt-4o-mini").prepare_client()
+    )
+
+    async def get_async_clients():
+        return llm.prepare_client(async_version=True), embedding.prepare_client(
+            async_version=True
+        )
+
+    first, second = asyncio.run(get_async_clients())
+    assert first is second
+    # async clients are not shared across event loops
+    assert asyncio.run(get_async_clients())[0] is not first
+
+
 @skip_llama_cpp_not_installed
 def test_llamacpp_chat():
     from llama_cpp import Llama
@@ -11,8 +11,10 @@ from kotaemon.loaders import (
     DocxReader,
     HtmlReader,
     MhtmlReader,
+    PDFThumbnailReader,
     UnstructuredReader,
 )
+from kotaemon.loaders.pdf_loader import resolve_thumbnail
 
 from .conftest import skip_when_unstructured_pdf_not_installed
 
@@ -54,6 +56,35 @@ def test_pdf_reader():
     assert len(nodes) > 0
 
 
+def test_pdf_thumbnail_reader(tmp_path):
+    input_path = Path(__file__).parent / "resources" / "multimodal.pdf"
+    inline_docs = PDFThumbnailReader().load_data(input_path)
+    assert inline_docs
+
+    reader = PDFThumbnailReader(thumbnail_dir=tmp_path)
+    pages = list(reader.iter_pages(input_path, extra_info={"file_id": "a"}))
+    assert len(pages) * 2 == len(inline_docs)
+
+    for (text_doc, thumbnail_doc), inline_text, inline_thumbnail in zip(
+        pages, inline_docs[::2], inline_docs[1::2]
+    ):
+        assert text_doc.text == inline_text.text
+        assert text_doc.metadata["file_id"] == "a"
+        assert thumbnail_doc.metadata["type"] == "thumbnail"
+        assert thumbnail_doc.metadata["page_label"] == text_doc.metadata["page_label"]
+
+        # the thumbnail is saved to a file, and read back when retrieved
+        assert "image_origin" not in thumbnail_doc.metadata
+        assert Path(thumbnail_doc.metadata["thumbnail_path"]).is_file()
+        # one dir per file, deleted with it
+        assert Path(thumbnail_doc.metadata["thumbnail_path"]).parent == tmp_path / "a"
+        assert resolve_thumbnail(thumbnail_doc)
+        assert (
+            thumbnail_doc.metadata["image_origin"]
+            == inline_thumbnail.metadata["image_origin"]
+        )
+
+
 @skip_when_unstructured_pdf_not_installed
 def test_unstructured_pdf_reader():
     reader = UnstructuredReader()
@@ -1,14 +1,25 @@
+import json
+import re
 from unittest.mock import patch
 
 import pytest
 from openai.types.chat.chat_completion import ChatCompletion
 
 from kotaemon.base import Document
-from kotaemon.indices.rankings import LLMReranking
+from kotaemon.indices.rankings import LLMListwiseScoring, LLMReranking
 from kotaemon.llms import AzureChatOpenAI
+from kotaemon.rerankings import (
+    CachedReranking,
+    FastEmbedReranking,
+    SQLiteRerankScoreCache,
+    TeiFastReranking,
+)
 
-_openai_chat_completion_responses = [
-    ChatCompletion.parse_obj(
+from .conftest import skip_when_fastembed_not_installed
+
+
+def _chat_completion(text):
+    return ChatCompletion.parse_obj(
         {
             "id": "chatcmpl-7qyuw6Q1CFCpcKsMdFkmUPUa7JP2x",
             "object": "chat.completion",
@@ -31,6 +42,10 @@ _openai_chat_completion_responses = [
             "usage": {"completion_tokens": 9, "prompt_tokens": 10, "total_tokens": 19},
         }
     )
+
+
+_openai_chat_completion_responses = [
+    _chat_completion(text)
     for text in [
         "YES",
         "NO",
@@ -61,3 +76,91 @@ def test_reranking(openai_completion, llm):
     rerank_docs = reranker(documents, query=query)
 
     assert len(rerank_docs) == 2
+
+
+def _relevance_completion(*args, messages, **kwargs):
+    """Grade `test <n>` contexts n, leaving out `test 2` of the listwise answers"""
+    prompt = messages[-1]["content"]
+    if "CONTEXTS:" not in prompt:
+        return _chat_completion("2")
+    contexts = re.findall(r"\[(\d+)\] test (\d+)", prompt)
+    scores = {number: int(n) for number, n in contexts if n != "2"}
+    return _chat_completion(json.dumps(scores))
+
+
+@patch(
+    "openai.resources.chat.completions.Completions.create",
+    side_effect=_relevance_completion,
+)
+def test_listwise_scoring(openai_completion, llm):
+    documents = [Document(text=f"test {idx}", id_=str(idx)) for idx in range(5)]
+    scorer = LLMListwiseScoring(llm=llm, batch_size=2)
+
+    scored_docs = scorer(documents, query="test query")
+    # 3 batches, plus 1 call for the document left out of its batch answer
+    assert openai_completion.call_count == 4
+    assert [doc.doc_id for doc in scored_docs] == ["4", "3", "2", "1", "0"]
+    assert scored_docs[0].metadata["llm_trulens_score"] == 0.4
+
+    # the scores of the same question are cached
+    scorer(documents[:3], query="test query")
+    assert openai_completion.call_count == 4
+
+
+def _tei_scores(query, texts):
+    return [
+        {"index": idx, "score": float(text.split()[1])}
+        for idx, text in enumerate(texts)
+    ]
+
+
+def test_tei_reranking_top_n():
+    documents = [Document(text=f"test {idx}") for idx in range(10)]
+    reranker = TeiFastReranking(endpoint_url="http://tei", batch_size=3)
+
+    with patch.object(TeiFastReranking, "client", side_effect=_tei_scores) as client:
+        rerank_docs = reranker.run(documents, query="test query", top_n=4)
+
+    # the mini-batches are scored separately, then ranked together
+    assert client.call_count == 4
+    assert [doc.text for doc in rerank_docs] == [f"test {idx}" for idx in [9, 8, 7, 6]]
+
+
+def test_cached_reranking(tmp_path):
+    documents = [Document(text=f"test {idx}", id_=str(idx)) for idx in range(6)]
+    reranker = CachedReranking(
+        reranker=TeiFastReranking(endpoint_url="http://tei"),
+        caches=[SQLiteRerankScoreCache(tmp_path / "scores.db")],
+    )
+
+    with patch.object(TeiFastReranking, "client", side_effect=_tei_scores) as client:
+        reranker.run(documents[:4], query="test query")
+        rerank_docs = reranker.run(documents, query="Test   query", top_n=3)
+
+    # the second query only sends the new documents
+    assert [len(call.args[1]) for call in client.call_args_list] == [4, 2]
+    assert [doc.doc_id for doc in rerank_docs] == ["5", "4", "3"]
+    assert reranker.cache_info()[0]["hits"] == 4
+
+
+def test_fastembed_reranking_batches():
+    reranker = FastEmbedReranking(batch_size=3, max_batch_tokens=60)
+    lengths = [400, 8, 40, 4, 80, 12, 16]
+    documents = [Document(text="x" * length) for length in lengths]
+
+    batches = reranker._batches("q", documents)
+    # sorted by length, at most 3 documents and 60 padded tokens per batch
+    assert batches == [[3, 1, 5], [6, 2], [4], [0]]
+
+
+@skip_when_fastembed_not_installed
+def test_fastembed_reranking():
+    documents = [
+        Document(text="The capital of France is Paris."),
+        Document(text="Bananas are rich in potassium."),
+    ]
+    rerank_docs = FastEmbedReranking().run(
+        documents, query="What is the capital of France?", top_n=1
+    )
+    assert rerank_docs == [documents[0]]
+    assert "reranking_score" in documents[1].metadata
@@ -0,0 +1,52 @@
+import random
+from difflib import SequenceMatcher
+
+from kotaemon.indices.qa.span_matcher import longest_match, matching_blocks
+from kotaemon.indices.qa.utils import find_start_end_phrase, find_text
+
+
+def test_span_matcher_same_as_difflib():
+    rng = random.Random(0)
+    for _ in range(500):
+        context = "".join(rng.choice("ab cd") for _ in range(rng.randint(0, 200)))
+        start = rng.randint(0, len(context))
+        quote = "".join(
+            char if rng.random() > 0.05 else "x"
+            for char in context[start : start + rng.randint(0, 60)]
+        )
+        min_size = rng.randint(1, 10)
+
+        matcher = SequenceMatcher(None, quote, context, autojunk=False)
+        expected = [
+            tuple(block)
+            for block in matcher.get_matching_blocks()
+            if block.size >= min_size
+        ]
+        blocks = matching_blocks(quote, context, min_size)
+        assert [tuple(block) for block in blocks] == expected
+
+        longest = matcher.find_longest_match()
+        match = longest_match(quote, context, min_size)
+        if longest.size >= min_size:
+            assert match is not None
+            assert tuple(match) == (longest.a, longest.b, longest.size)
+        else:
+            assert match is None
+
+
+def test_find_text():
+    context = (
+        "The Supplier shall indemnify the Customer against all losses.\n"
+        "This Agreement is governed by the laws of England."
+    )
+    quote = "the supplier shall indemnify the customer against any losses"
+    [(start, end)] = find_text(quote, context)
+    assert context[start:end].lower().startswith("the supplier shall indemnify")
+
+    assert find_text("unrelated sentence about weather", context) == []
+
+    (start, end), matched_length = find_start_end_phrase(
+        "This Agreement is governed", "laws of England", context
+    )
+    assert context[start:end] == "This Agreement is governed by the laws of England"
+    assert matched_length == len("This Agreement is governed") + len("laws of England")
@@ -1,3 +1,5 @@
+import pickle
+
 from llama_index.core.schema import NodeRelationship
 
 from kotaemon.base import Document
@@ -53,3 +55,14 @@ def test_split_token():
     )
     assert chunks[1].relationships[NodeRelationship.NEXT].node_id == chunks[2].doc_id
     assert chunks[-1].relationships[NodeRelationship.SOURCE].node_id == source2.doc_id
+
+
+def test_pickle_splitter():
+    """Test that a splitter can be sent to a worker process"""
+    splitter = TokenSplitter(chunk_size=30, chunk_overlap=10, separator="\n\n")
+    restored = pickle.loads(pickle.dumps(splitter))
+
+    assert restored.chunk_size == 30
+    assert [chunk.text for chunk in restored([source1])] == [
+        chunk.text for chunk in splitter([source1])
+    ]
@@ -0,0 +1,34 @@
+from unittest.mock import patch
+
+from kotaemon.base.tokens import TokenCounter, get_token_counter
+
+
+def test_token_counter_memoizes_counts():
+    counter = TokenCounter("cl100k_base")
+    texts = ["The Supplier shall indemnify the Customer.", "Governing law.", ""]
+    expected = [len(counter.encoding.encode_ordinary(text)) for text in texts]
+
+    with patch.object(
+        counter.encoding,
+        "encode_ordinary_batch",
+        wraps=counter.encoding.encode_ordinary_batch,
+    ) as encode_batch:
+        assert counter.count_many(texts) == expected
+        assert counter.count_many(texts[::-1]) == expected[::-1]
+        assert counter.count(texts[0]) == expected[0]
+
+    # the new texts are encoded in one batch, then served from the memo
+    assert encode_batch.call_count == 1
+    assert get_token_counter("cl100k_base") is get_token_counter("cl100k_base")
+
+
+def test_token_counter_trim():
+    counter = TokenCounter("cl100k_base")
+    text = " ".join(f"clause {idx} of the agreement" for idx in range(200))
+
+    assert counter.trim("short text", 100) == "short text"
+    trimmed = counter.trim(text, 50)
+    assert text.startswith(trimmed)
+    assert 0 < counter.count(trimmed) <= 50
+    # cut at a word boundary
+    assert text[len(trimmed)] == " "
@@ -1,17 +1,27 @@
 import json
 import os
 
+import numpy as np
 import pytest
+from llama_index.core.vector_stores import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
 
-from kotaemon.base import DocumentWithEmbedding
+from kotaemon.base import Document, DocumentWithEmbedding, EmbeddingBatch
 from kotaemon.storages import (
     ChromaVectorStore,
     InMemoryVectorStore,
+    LanceDBVectorStore,
+    MemmapVectorStore,
     MilvusVectorStore,
     QdrantVectorStore,
     SimpleFileVectorStore,
 )
 
+from .conftest import skip_when_lancedb_not_installed
+
 
 class TestChromaVectorStore:
     def test_add(self, tmp_path):
@@ -41,6 +51,31 @@ class TestChromaVectorStore:
         assert len(output) == 2, "Expected outputting 2 ids"
         assert db._collection.count() == 2, "Expected 2 added entries"
 
+    def test_add_from_batch(self, tmp_path):
+        db = ChromaVectorStore(path=str(tmp_path))
+
+        batch = EmbeddingBatch(
+            [Document(text="first"), Document(text="second")],
+            np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]], dtype=np.float32),
+        )
+        output = db.add(batch, metadatas=[{"a": 1}, {"a": 2}], ids=["1", "2"])
+        assert output == ["1", "2"]
+        db.add(embeddings=[[0.7, 0.8, 0.9]], metadatas=[{"a": 3}], ids=["3"])
+        assert db._collection.count() == 3
+
+        _, sim, out_ids = db.query(embedding=[0.4, 0.5, 0.6], top_k=1)
+        assert out_ids == ["2"]
+        assert abs(sim[0] - 1.0) < 1e-6
+
+    def test_get_vectors(self, tmp_path):
+        db = ChromaVectorStore(path=str(tmp_path))
+
+        embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]
+        db.add(embeddings=embeddings, metadatas=[{"a": 1}, {"a": 2}], ids=["a", "b"])
+        vectors = db.get_vectors(["b", "missing"])
+        assert list(vectors) == ["b"]
+        assert np.allclose(vectors["b"], embeddings[1])
+
     def test_delete(self, tmp_path):
         db = ChromaVectorStore(path=str(tmp_path))
 
@@ -55,6 +90,15 @@ class TestChromaVectorStore:
         db.delete(ids=["c"])
         assert db._collection.count() == 0, "Expected 0 remaining entry"
 
+    def test_upsert(self, tmp_path):
+        db = ChromaVectorStore(path=str(tmp_path))
+        docs = [Document(text="", id_=id_) for id_ in ["a", "b"]]
+        db.add(EmbeddingBatch(docs, np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]])))
+
+        db.upsert(EmbeddingBatch(docs[1:], np.array([[0.7, 0.8, 0.9]])))
+        assert db._collection.count() == 2
+        assert np.allclose(db.get_vectors(["b"])["b"], [0.7, 0.8, 0.9])
+
     def test_query(self, tmp_path):
         db = ChromaVectorStore(path=str(tmp_path))
 
@@ -93,6 +137,53 @@ class TestChromaVectorStore:
         ), "delete collection function does not work correctly"
 
 
+@skip_when_lancedb_not_installed
+class TestLanceDBVectorStore:
+    def test_add_from_batch(self, tmp_path):
+        db = LanceDBVectorStore(path=str(tmp_path), collection_name="test")
+
+        batch = EmbeddingBatch(
+            [Document(text="first"), Document(text="second")],
+            np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]], dtype=np.float32),
+        )
+        output = db.add(
+            batch, metadatas=[{"file_id": "f1"}, {"file_id": "f2"}], ids=["1", "2"]
+        )
+        assert output == ["1", "2"]
+        # appended to the existing table
+        db.add(embeddings=[[0.7, 0.8, 0.9]], metadatas=[{"file_id": "f3"}], ids=["3"])
+        assert db._client._table.count_rows() == 3
+
+        _, _, out_ids = db.query(embedding=[0.4, 0.5, 0.6], top_k=1)
+        assert out_ids == ["2"]
+        filters = MetadataFilters(
+            filters=[
+                MetadataFilter(
+                    key="file_id", value=["f1", "f3"], operator=FilterOperator.IN
+                )
+            ]
+        )
+        _, _, out_ids = db.query(embedding=[0.4, 0.5, 0.6], top_k=2, filters=filters)
+        assert sorted(out_ids) == ["1", "3"]
+
+        vectors = db.get_vectors(["2", "missing"])
+        assert list(vectors) == ["2"]
+        assert vectors["2"].dtype == np.float32
+        assert np.allclose(vectors["2"], [0.4, 0.5, 0.6])
+
+    def test_upsert_delete(self, tmp_path):
+        db = LanceDBVectorStore(path=str(tmp_path), collection_name="test")
+        docs = [Document(text="", id_=id_) for id_ in ["a", "b"]]
+        db.add(EmbeddingBatch(docs, np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]])))
+
+        db.upsert(EmbeddingBatch(docs[1:], np.array([[0.7, 0.8, 0.9]])))
+        assert db._client._table.count_rows() == 2
+        assert np.allclose(db.get_vectors(["b"])["b"], [0.7, 0.8, 0.9])
+
+        db.delete(["a", "b"])
+        assert db._client._table.count_rows() == 0
+
+
 class TestInMemoryVectorStore:
     def test_add(self):
         """Test that add func adds correctly."""
@@ -105,6 +196,23 @@ class TestInMemoryVectorStore:
         output = db.add(embeddings=embeddings, metadatas=metadatas, ids=ids)
         assert output == ids, "Excepted output to be the same as ids"
 
+    def test_get_vectors(self):
+        db = InMemoryVectorStore()
+        embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]
+        db.add(embeddings=embeddings, ids=["a", "b"])
+        vectors = db.get_vectors(["a", "missing"])
+        assert list(vectors) == ["a"]
+        assert np.allclose(vectors["a"], embeddings[0])
+
+    def test_bulk_delete_upsert(self):
+        db = InMemoryVectorStore()
+        db.add(embeddings=[[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]], ids=["a", "b", "c"])
+        db.delete(["a", "c", "missing"])
+        assert list(db.get_vectors(["a", "b", "c"])) == ["b"]
+
+        db.upsert(embeddings=[[0.7, 0.8]], ids=["b"])
+        assert np.allclose(db.get_vectors(["b"])["b"], [0.7, 0.8])
+
     def test_save_load_delete(self, tmp_path):
         """Test that delete func deletes correctly."""
         embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]]
@@ -159,6 +267,75 @@ class TestSimpleFileVectorStore:
         os.remove(tmp_path / collection_name)
 
 
+class TestMemmapVectorStore:
+    def test_add_query_delete(self, tmp_path):
+        db = MemmapVectorStore(path=tmp_path, segment_size=2)
+        embeddings = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+        metadatas = [{"file_id": "f1"}, {"file_id": "f1"}, {"file_id": "f2"}]
+        assert db.add(embeddings, metadatas=metadatas, ids=["a", "b", "c"]) == [
+            "a",
+            "b",
+            "c",
+        ]
+        assert db.count() == 3
+
+        vectors, scores, ids = db.query(embedding=[0.0, 2.0, 1.0], top_k=2)
+        assert ids == ["b", "c"]
+        assert np.allclose(scores, [2 / 5**0.5, 1 / 5**0.5])
+        assert np.allclose(vectors[0], [0.0, 1.0, 0.0])
+
+        # the rows of the filtered files are searched
+        file_filter = MetadataFilters(
+            filters=[
+                MetadataFilter(key="file_id", value=["f1"], operator=FilterOperator.IN)
+            ]
+        )
+        _, _, ids = db.query(embedding=[0.0, 0.0, 1.0], top_k=3, filters=file_filter)
+        assert ids == ["a", "b"] or ids == ["b", "a"]
+        _, _, ids = db.query(embedding=[0.0, 0.0, 1.0], top_k=3, doc_ids=["a"])
+        assert ids == ["a"]
+
+        db.delete(["c"])
+        _, _, ids = db.query(embedding=[0.0, 0.0, 1.0], top_k=3)
+        assert "c" not in ids and len(ids) == 2
+
+        # adding an existing id replaces its vector
+        db.add([[0.0, 0.0, 1.0]], metadatas=[{"file_id": "f1"}], ids=["a"])
+        _, _, ids = db.query(embedding=[0.0, 0.0, 1.0], top_k=1)
+        assert ids == ["a"]
+        assert db.count() == 2
+
+    def test_persist_and_ivf(self, tmp_path):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 8)).astype(np.float32)
+        docs = [
+            Document(text=str(i), metadata={"file_id": str(i % 5)}) for i in range(500)
+        ]
+        db = MemmapVectorStore(path=tmp_path, collection_name="c", segment_size=64)
+        db.add(EmbeddingBatch(docs, vectors))
+        db.delete([docs[0].doc_id])
+
+        # reopened from the segment files
+        db2 = MemmapVectorStore(path=tmp_path, collection_name="c")
+        assert db2.count() == 499
+        assert np.allclose(
+            db2.get_vectors([docs[1].doc_id])[docs[1].doc_id],
+            vectors[1] / np.linalg.norm(vectors[1]),
+        )
+        _, _, exact_ids = db2.query(embedding=vectors[0].tolist(), top_k=5)
+        assert docs[0].doc_id not in exact_ids
+
+        db2.build_ivf(n_lists=4)
+        db2.add(EmbeddingBatch(docs[:1], vectors[:1]))
+        _, scores, ids = db2.query(embedding=vectors[0].tolist(), top_k=1)
+        assert ids == [docs[0].doc_id]
+        assert abs(scores[0] - 1.0) < 1e-5
+
+        db2.drop()
+        assert db2.count() == 0
+        assert not (tmp_path / "c").exists()
+
+
 class TestMilvusVectorStore:
     def test_add(self, tmp_path):
         """Test that the DB add correctly"""
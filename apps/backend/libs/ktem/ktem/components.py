@@ -9,6 +9,16 @@ from theflow.settings import settings
 from theflow.utils.modules import deserialize
 
 from kotaemon.base import BaseComponent
+from kotaemon.embeddings import (
+    BaseEmbeddingCache,
+    InMemoryEmbeddingCache,
+    SQLiteEmbeddingCache,
+)
+from kotaemon.rerankings import (
+    BaseRerankScoreCache,
+    InMemoryRerankScoreCache,
+    SQLiteRerankScoreCache,
+)
 from kotaemon.storages import BaseDocumentStore, BaseVectorStore
 
 logger = logging.getLogger(__name__)
@@ -36,6 +46,58 @@ def get_vectorstore(collection_name: str = "default") -> BaseVectorStore:
     return deserialize(vs_conf, safe=False)
 
 
+@cache
+def get_query_embedding_caches() -> list[BaseEmbeddingCache]:
+    """The process-wide cache tiers for query embeddings
+
+    Configured with `KH_QUERY_EMBEDDING_CACHE`: `maxsize` and `ttl` of the
+    in-memory tier, and an optional `path` for the SQLite tier.
+    """
+    conf = getattr(settings, "KH_QUERY_EMBEDDING_CACHE", None) or {}
+    caches: list[BaseEmbeddingCache] = [
+        InMemoryEmbeddingCache(
+            maxsize=conf.get("maxsize", 4096), ttl=conf.get("ttl", None)
+        )
+    ]
+    if conf.get("path"):
+        caches.append(SQLiteEmbeddingCache(conf["path"], ttl=conf.get("ttl", None)))
+    return caches
+
+
+@cache
+def get_chunk_embedding_caches() -> list[BaseEmbeddingCache]:
+    """The persistent cache tier for document chunk embeddings
+
+    Configured with `KH_CHUNK_EMBEDDING_CACHE`: the `path` of the SQLite file and
+    an optional `ttl`. Re-indexing a file only embeds the chunks whose text is
+    not in the cache yet. Returns no tier when no `path` is set.
+    """
+    conf = getattr(settings, "KH_CHUNK_EMBEDDING_CACHE", None) or {}
+    if not conf.get("path"):
+        return []
+    return [
+        SQLiteEmbeddingCache(conf["path"], ttl=conf.get("ttl", None), typecode="f")
+    ]
+
+
+@cache
+def get_rerank_score_caches() -> list[BaseRerankScoreCache]:
+    """The process-wide cache tiers for reranking scores
+
+    Configured with `KH_RERANK_SCORE_CACHE`: `maxsize` and `ttl` of the
+    in-memory tier, and an optional `path` for the SQLite tier.
+    """
+    conf = getattr(settings, "KH_RERANK_SCORE_CACHE", None) or {}
+    caches: list[BaseRerankScoreCache] = [
+        InMemoryRerankScoreCache(
+            maxsize=conf.get("maxsize", 65536), ttl=conf.get("ttl", None)
+        )
+    ]
+    if conf.get("path"):
+        caches.append(SQLiteRerankScoreCache(conf["path"], ttl=conf.get("ttl", None)))
+    return caches
+
+
 class ModelPool:
     """Represent a pool of models"""
 
@@ -1,3 +1,4 @@
+import asyncio
 from pathlib import Path
 from typing import Generator, Optional
 
@@ -32,6 +33,13 @@ class BaseFileIndexRetriever(BaseComponent):
     ) -> "BaseFileIndexRetriever":
         raise NotImplementedError
 
+    async def ainvoke(self, *args, **kwargs) -> list[Document]:  # type: ignore
+        """Async version of `__call__`
+
+        Retrievers without a native async path run in a worker thread.
+        """
+        return await asyncio.to_thread(self, *args, **kwargs)
+
 
 class BaseFileIndexIndexing(BaseComponent):
     """The pipeline to index information into the data store
@@ -56,6 +56,12 @@ class LightRAGIndex(GraphRAGIndex):
         pipeline.index_batch_size = striped_settings.get(
             "batch_size", pipeline.index_batch_size
         )
+        pipeline.max_concurrent_inserts = striped_settings.get(
+            "concurrent_inserts", pipeline.max_concurrent_inserts
+        )
+        pipeline.llm_requests_per_minute = striped_settings.get(
+            "requests_per_minute", pipeline.llm_requests_per_minute
+        )
         return pipeline
 
     def get_retriever_pipelines(
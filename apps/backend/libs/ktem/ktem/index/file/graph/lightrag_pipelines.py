@@ -1,10 +1,12 @@
 import asyncio
 import glob
+import hashlib
+import json
 import logging
 import os
 import re
 from pathlib import Path
-from typing import Generator
+from typing import Generator, Optional
 
 import numpy as np
 import pandas as pd
@@ -24,7 +26,13 @@ from kotaemon.base import Document, Param, RetrievedDocument
 from kotaemon.base.schema import AIMessage, HumanMessage, SystemMessage
 
 from ..pipelines import BaseFileIndexRetriever
-from .pipelines import GraphRAGIndexingPipeline
+from .pipelines import (
+    GraphRAGIndexingPipeline,
+    get_embedding_dim,
+    graph_instance_pool,
+    working_dir_version,
+)
+from .rate_limit import AdaptiveRateLimiter, is_rate_limit_error
 from .visualize import create_knowledge_graph, visualize_graph
 
 try:
@@ -55,9 +63,15 @@ filestorage_path = Path(settings.KH_FILESTORAGE_PATH) / "lightrag"
 filestorage_path.mkdir(parents=True, exist_ok=True)
 
 INDEX_BATCHSIZE = 4
+# batches inserted together, LightRAG extracts their entities concurrently
+MAX_CONCURRENT_INSERTS = getattr(settings, "KH_LIGHTRAG_MAX_CONCURRENT_INSERTS", 4)
+# initial LLM request budget while indexing, 0 to start unlimited
+LLM_REQUESTS_PER_MINUTE = getattr(settings, "KH_LIGHTRAG_LLM_REQUESTS_PER_MINUTE", 0)
+# hashes of the docs already inserted, to resume an interrupted indexing
+CHECKPOINT_FILENAME = "kh_index_checkpoint.json"
 
 
-def get_llm_func(model):
+def get_llm_func(model, limiter: Optional[AdaptiveRateLimiter] = None):
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -67,7 +81,18 @@ def get_llm_func(model):
         ),
     )
     async def _call_model(model, input_messages):
-        return (await model.ainvoke(input_messages)).text
+        if limiter is None:
+            return (await model.ainvoke(input_messages)).text
+
+        await limiter.acquire()
+        try:
+            output = (await model.ainvoke(input_messages)).text
+        except Exception as e:
+            if is_rate_limit_error(e):
+                limiter.on_rate_limit()
+            raise
+        limiter.on_success()
+        return output
 
     async def llm_func(
         prompt, system_prompt=None, history_messages=[], **kwargs
@@ -117,10 +142,10 @@ def get_embedding_func(model):
     return embedding_func
 
 
-def get_default_models_wrapper():
+def get_default_models_wrapper(limiter: Optional[AdaptiveRateLimiter] = None):
     # setup model functions
     default_embedding = embeddings.get_default()
-    default_embedding_dim = len(default_embedding(["Hi"])[0].embedding)
+    default_embedding_dim = get_embedding_dim(default_embedding)
     embedding_func = EmbeddingFunc(
         embedding_dim=default_embedding_dim,
         max_token_size=8192,
@@ -129,7 +154,7 @@ def get_default_models_wrapper():
     print("GraphRAG embedding dim", default_embedding_dim)
 
     default_llm = llms.get_default()
-    llm_func = get_llm_func(default_llm)
+    llm_func = get_llm_func(default_llm, limiter)
 
     return llm_func, embedding_func, default_llm, default_embedding
 
@@ -232,6 +257,30 @@ async def lightrag_build_local_query_context(
     return entities_df, relations_df, sources_df
 
 
+def doc_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load_checkpoint(working_dir: Path) -> set[str]:
+    checkpoint_path = working_dir / CHECKPOINT_FILENAME
+    if not checkpoint_path.exists():
+        return set()
+    with open(checkpoint_path) as f:
+        return set(json.load(f))
+
+
+def save_checkpoint(working_dir: Path, done: set[str]):
+    checkpoint_path = working_dir / CHECKPOINT_FILENAME
+    tmp_path = checkpoint_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(sorted(done), f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def clear_checkpoint(working_dir: Path):
+    (working_dir / CHECKPOINT_FILENAME).unlink(missing_ok=True)
+
+
 def build_graphrag(working_dir, llm_func, embedding_func):
     graphrag_func = LightRAG(
         working_dir=working_dir,
@@ -252,6 +301,8 @@ class LightRAGIndexingPipeline(GraphRAGIndexingPipeline):
     prompts: dict[str, str] = {}
     collection_graph_id: str
     index_batch_size: int = INDEX_BATCHSIZE
+    max_concurrent_inserts: int = MAX_CONCURRENT_INSERTS
+    llm_requests_per_minute: float = LLM_REQUESTS_PER_MINUTE
 
     def store_file_id_with_graph_id(self, file_ids: list[str | None]):
         if not settings.USE_GLOBAL_GRAPHRAG:
@@ -299,7 +350,20 @@ class LightRAGIndexingPipeline(GraphRAGIndexingPipeline):
                     ),
                     "value": INDEX_BATCHSIZE,
                     "component": "number",
-                }
+                },
+                "concurrent_inserts": {
+                    "name": "Number of batches indexed concurrently",
+                    "value": MAX_CONCURRENT_INSERTS,
+                    "component": "number",
+                },
+                "requests_per_minute": {
+                    "name": (
+                        "LLM requests per minute while indexing "
+                        "(0 to adapt to rate limit errors only)"
+                    ),
+                    "value": LLM_REQUESTS_PER_MINUTE,
+                    "component": "number",
+                },
             }
             settings_dict.update(
                 {
@@ -332,12 +396,17 @@ class LightRAGIndexingPipeline(GraphRAGIndexingPipeline):
         _, input_path = prepare_graph_index_path(graph_id)
         input_path.mkdir(parents=True, exist_ok=True)
 
+        limiter = AdaptiveRateLimiter(
+            rate=self.llm_requests_per_minute / 60
+            if self.llm_requests_per_minute
+            else None
+        )
         (
             llm_func,
             embedding_func,
             default_llm,
             default_embedding,
-        ) = get_default_models_wrapper()
+        ) = get_default_models_wrapper(limiter)
         print(
             f"Indexing GraphRAG with LLM {default_llm} "
             f"and Embedding {default_embedding}..."
@@ -358,20 +427,33 @@ class LightRAGIndexingPipeline(GraphRAGIndexingPipeline):
         graph_file = input_path / "graph_chunk_entity_relation.graphml"
         is_incremental = graph_file.exists()
 
-        # Only clear cache if it's a new graph
+        # The checkpoint resumes an interrupted indexing of this graph; without
+        # the graph file it is stale, and the cache of a new graph is cleared
+        done = load_checkpoint(input_path) if is_incremental else set()
         if not is_incremental:
             json_files = glob.glob(f"{input_path}/*.json")
             for json_file in json_files:
                 os.remove(json_file)
 
+        pending_docs = [doc for doc in all_docs if doc_hash(doc) not in done]
+        if len(pending_docs) < len(all_docs):
+            yield Document(
+                channel="debug",
+                text=(
+                    f"[GraphRAG] Skipping {len(all_docs) - len(pending_docs)} "
+                    "documents already in the graph."
+                ),
+            )
+
         # Initialize or load existing GraphRAG
+        graph_instance_pool.invalidate(graph_id)
         graphrag_func = build_graphrag(
             input_path,
             llm_func=llm_func,
             embedding_func=embedding_func,
         )
 
-        total_docs = len(all_docs)
+        total_docs = len(pending_docs)
         process_doc_count = 0
         yield Document(
             channel="debug",
@@ -381,20 +463,37 @@ class LightRAGIndexingPipeline(GraphRAGIndexingPipeline):
             ),
         )
 
-        for doc_id in range(0, len(all_docs), self.index_batch_size):
-            cur_docs = all_docs[doc_id : doc_id + self.index_batch_size]
-            combined_doc = "\n".join(cur_docs)
+        batches = [
+            pending_docs[doc_id : doc_id + self.index_batch_size]
+            for doc_id in range(0, len(pending_docs), self.index_batch_size)
+        ]
+        concurrency = max(int(self.max_concurrent_inserts), 1)
+        # newer LightRAG versions bound the docs processed at once themselves
+        if hasattr(graphrag_func, "max_parallel_insert"):
+            graphrag_func.max_parallel_insert = concurrency
 
-            # Use insert for incremental updates
-            graphrag_func.insert(combined_doc)
-            process_doc_count += len(cur_docs)
-            yield Document(
-                channel="debug",
-                text=(
-                    f"[GraphRAG] {'Updated' if is_incremental else 'Indexed'} "
-                    f"{process_doc_count} / {total_docs} documents."
-                ),
-            )
+        try:
+            for batch_id in range(0, len(batches), concurrency):
+                cur_batches = batches[batch_id : batch_id + concurrency]
+
+                # Use insert for incremental updates, the batches of one call
+                # are extracted concurrently
+                graphrag_func.insert(["\n".join(batch) for batch in cur_batches])
+                cur_docs = [doc for batch in cur_batches for doc in batch]
+                done.update(doc_hash(doc) for doc in cur_docs)
+                save_checkpoint(input_path, done)
+                process_doc_count += len(cur_docs)
+                yield Document(
+                    channel="debug",
+                    text=(
+                        f"[GraphRAG] {'Updated' if is_incremental else 'Indexed'} "
+                        f"{process_doc_count} / {total_docs} documents."
+                    ),
+                )
+        finally:
+            # pooled instances of this graph hold the previous stores
+            graph_instance_pool.invalidate(graph_id)
+        clear_checkpoint(input_path)
 
         yield Document(
             channel="debug",
@@ -449,11 +548,16 @@ class LightRAGRetrieverPipeline(BaseFileIndexRetriever):
         _, input_path = prepare_graph_index_path(graph_id)
         input_path.mkdir(parents=True, exist_ok=True)
 
-        llm_func, embedding_func, _, _ = get_default_models_wrapper()
-        graphrag_func = build_graphrag(
-            input_path,
-            llm_func=llm_func,
-            embedding_func=embedding_func,
+        llm_func, embedding_func, llm, embedding = get_default_models_wrapper()
+        # the pooled instance holds on to the models, so their ids stay unique
+        graphrag_func = graph_instance_pool.get(
+            (graph_id, "lightrag", id(llm), id(embedding)),
+            working_dir_version(input_path),
+            lambda: build_graphrag(
+                input_path,
+                llm_func=llm_func,
+                embedding_func=embedding_func,
+            ),
         )
         print("search_type", self.search_type)
         query_params = QueryParam(mode=self.search_type, only_need_context=True)
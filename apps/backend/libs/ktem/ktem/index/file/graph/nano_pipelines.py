@@ -24,7 +24,12 @@ from kotaemon.base import Document, Param, RetrievedDocument
 from kotaemon.base.schema import AIMessage, HumanMessage, SystemMessage
 
 from ..pipelines import BaseFileIndexRetriever
-from .pipelines import GraphRAGIndexingPipeline
+from .pipelines import (
+    GraphRAGIndexingPipeline,
+    get_embedding_dim,
+    graph_instance_pool,
+    working_dir_version,
+)
 from .visualize import create_knowledge_graph, visualize_graph
 
 try:
@@ -118,7 +123,7 @@ def get_embedding_func(model):
 def get_default_models_wrapper():
     # setup model functions
     default_embedding = embeddings.get_default()
-    default_embedding_dim = len(default_embedding(["Hi"])[0].embedding)
+    default_embedding_dim = get_embedding_dim(default_embedding)
     embedding_func = EmbeddingFunc(
         embedding_dim=default_embedding_dim,
         max_token_size=8192,
@@ -353,6 +358,7 @@ class NanoGraphRAGIndexingPipeline(GraphRAGIndexingPipeline):
                 os.remove(json_file)
 
         # Initialize or load existing GraphRAG
+        graph_instance_pool.invalidate(graph_id)
         graphrag_func = build_graphrag(
             input_path,
             llm_func=llm_func,
@@ -369,20 +375,24 @@ class NanoGraphRAGIndexingPipeline(GraphRAGIndexingPipeline):
             ),
         )
 
-        for doc_id in range(0, len(all_docs), self.index_batch_size):
-            cur_docs = all_docs[doc_id : doc_id + self.index_batch_size]
-            combined_doc = "\n".join(cur_docs)
-
-            # Use insert for incremental updates
-            graphrag_func.insert(combined_doc)
-            process_doc_count += len(cur_docs)
-            yield Document(
-                channel="debug",
-                text=(
-                    f"[GraphRAG] {'Updated' if is_incremental else 'Indexed'} "
-                    f"{process_doc_count} / {total_docs} documents."
-                ),
-            )
+        try:
+            for doc_id in range(0, len(all_docs), self.index_batch_size):
+                cur_docs = all_docs[doc_id : doc_id + self.index_batch_size]
+                combined_doc = "\n".join(cur_docs)
+
+                # Use insert for incremental updates
+                graphrag_func.insert(combined_doc)
+                process_doc_count += len(cur_docs)
+                yield Document(
+                    channel="debug",
+                    text=(
+                        f"[GraphRAG] {'Updated' if is_incremental else 'Indexed'} "
+                        f"{process_doc_count} / {total_docs} documents."
+                    ),
+                )
+        finally:
+            # pooled instances of this graph hold the previous stores
+            graph_instance_pool.invalidate(graph_id)
 
         yield Document(
             channel="debug",
@@ -437,11 +447,16 @@ class NanoGraphRAGRetrieverPipeline(BaseFileIndexRetriever):
         _, input_path = prepare_graph_index_path(graph_id)
         input_path.mkdir(parents=True, exist_ok=True)
 
-        llm_func, embedding_func, _, _ = get_default_models_wrapper()
-        graphrag_func = build_graphrag(
-            input_path,
-            llm_func=llm_func,
-            embedding_func=embedding_func,
+        llm_func, embedding_func, llm, embedding = get_default_models_wrapper()
+        # the pooled instance holds on to the models, so their ids stay unique
+        graphrag_func = graph_instance_pool.get(
+            (graph_id, "nano_graphrag", id(llm), id(embedding)),
+            working_dir_version(input_path),
+            lambda: build_graphrag(
+                input_path,
+                llm_func=llm_func,
+                embedding_func=embedding_func,
+            ),
         )
         print("search_type", self.search_type)
         query_params = QueryParam(mode=self.search_type, only_need_context=True)
@@ -1,13 +1,14 @@
+import hashlib
 import os
 import shutil
 import subprocess
+import threading
+from collections import OrderedDict, defaultdict
 from pathlib import Path
-from shutil import rmtree
-from typing import Generator
+from typing import Any, Callable, Generator
 from uuid import uuid4
 
 import pandas as pd
-import tiktoken
 import yaml
 from decouple import config
 from ktem.db.models import engine
@@ -15,6 +16,8 @@ from sqlalchemy.orm import Session
 from theflow.settings import settings
 
 from kotaemon.base import Document, Param, RetrievedDocument
+from kotaemon.base.tokens import get_encoding
+from kotaemon.embeddings.cache import embedding_model_id
 
 from ..pipelines import BaseFileIndexRetriever, IndexDocumentPipeline, IndexPipeline
 from .visualize import create_knowledge_graph, visualize_graph
@@ -63,6 +66,185 @@ def prepare_graph_index_path(graph_id: str):
     return root_path, input_path
 
 
+def read_output_table(output_path: Path, table: str) -> pd.DataFrame:
+    """Read a GraphRAG output table, memory-mapping the parquet file"""
+    return pd.read_parquet(
+        output_path / f"{table}.parquet", engine="pyarrow", memory_map=True
+    )
+
+
+ENTITY_DESCRIPTION_COLLECTION = "entity_description_embeddings"
+
+
+def build_entity_description_store(entities: list, lancedb_path: Path):
+    """Write the entity description embeddings into a LanceDB dir
+
+    The table is written in a temporary dir renamed to `lancedb_path` once
+    complete, so that a build that crashed halfway is never reused.
+    """
+    tmp_path = lancedb_path.with_name(f".{lancedb_path.name}.{uuid4().hex}.tmp")
+    try:
+        store = LanceDBVectorStore(collection_name=ENTITY_DESCRIPTION_COLLECTION)
+        store.connect(db_uri=str(tmp_path))
+        store_entity_semantic_embeddings(entities=entities, vectorstore=store)
+        try:
+            tmp_path.rename(lancedb_path)
+        except OSError:
+            # another process built the same version first
+            if not lancedb_path.is_dir():
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def remove_lancedb_dirs(output_path: Path, keep: str | None = None):
+    """Delete the entity embedding dirs of a graph output, but `keep`
+
+    Temporary dirs of builds in progress are left alone.
+    """
+    for path in output_path.glob("lancedb*"):
+        if path.name != keep and path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class GraphContextCache:
+    """Process-level LRU cache of the local search context builders of each graph
+
+    Loading the output tables and the entity embeddings of a graph is expensive,
+    so the context builder is kept between queries. Entries are keyed by graph id
+    and rebuilt when the version of the index output changes, or after
+    `invalidate` is called when the graph is re-indexed.
+    """
+
+    def __init__(self, maxsize: int = 8):
+        self.maxsize = maxsize
+        self._cache: OrderedDict[str, tuple[tuple, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        # one build at a time per graph, concurrent queries wait for it. A lock
+        # is dropped with its entry, so that only cached keys keep one
+        self._build_locks: defaultdict[str, threading.Lock] = defaultdict(
+            threading.Lock
+        )
+
+    def _lookup(self, graph_id: str, version: tuple) -> Any:
+        with self._lock:
+            entry = self._cache.get(graph_id)
+            if entry is not None and entry[0] == version:
+                self._cache.move_to_end(graph_id)
+                return entry[1]
+        return None
+
+    def get(self, graph_id: str, version: tuple, build: Callable[[], Any]) -> Any:
+        """Get the context builder of `graph_id`, calling `build` on a miss"""
+        value = self._lookup(graph_id, version)
+        if value is not None:
+            return value
+
+        with self._lock:
+            build_lock = self._build_locks[graph_id]
+        with build_lock:
+            value = self._lookup(graph_id, version)
+            if value is None:
+                try:
+                    value = build()
+                except Exception:
+                    with self._lock:
+                        if graph_id not in self._cache:
+                            self._build_locks.pop(graph_id, None)
+                    raise
+                with self._lock:
+                    self._cache[graph_id] = (version, value)
+                    self._cache.move_to_end(graph_id)
+                    self._evict()
+        return value
+
+    def _evict(self):
+        while len(self._cache) > self.maxsize:
+            graph_id, _ = self._cache.popitem(last=False)
+            self._build_locks.pop(graph_id, None)
+
+    def invalidate(self, graph_id: str):
+        with self._lock:
+            self._cache.pop(graph_id, None)
+            self._build_locks.pop(graph_id, None)
+
+
+graph_context_cache = GraphContextCache(
+    maxsize=config("KH_GRAPHRAG_CONTEXT_CACHE_SIZE", default=8, cast=int)
+)
+
+
+# written back by the instances themselves after queries, not by indexing
+INSTANCE_CACHE_FILES = {"kv_store_llm_response_cache.json"}
+
+
+def working_dir_version(working_dir: Path) -> tuple:
+    """The (name, mtime, size) of each indexed file of a graph working dir"""
+    if not working_dir.is_dir():
+        return ()
+    version = []
+    for path in sorted(working_dir.rglob("*")):
+        if path.is_file() and path.name not in INSTANCE_CACHE_FILES:
+            stat = path.stat()
+            version.append(
+                (str(path.relative_to(working_dir)), stat.st_mtime_ns, stat.st_size)
+            )
+    return tuple(version)
+
+
+class GraphInstancePool(GraphContextCache):
+    """Process-level pool of initialized LightRAG and NanoGraphRAG instances
+
+    Building an instance loads the graph, the key-value stores and the vector
+    database of its working dir, so instances are kept between queries. Entries
+    are keyed by `(graph_id, engine, llm, embedding)` and versioned with
+    `working_dir_version`. The least recently used instances are evicted once
+    the total size of their working dirs, a proxy for their memory footprint,
+    exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        super().__init__()
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def footprint(version: tuple) -> int:
+        return sum(size for _, _, size in version)
+
+    def _evict(self):
+        total = sum(self.footprint(version) for version, _ in self._cache.values())
+        # the most recent instance is kept even if it is over the budget alone
+        while total > self.max_bytes and len(self._cache) > 1:
+            key, (version, _) = self._cache.popitem(last=False)
+            self._build_locks.pop(key, None)
+            total -= self.footprint(version)
+
+    def invalidate(self, graph_id: str):
+        """Drop the instances of `graph_id`, for every engine and model"""
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == graph_id]:
+                del self._cache[key]
+            for key in [key for key in self._build_locks if key[0] == graph_id]:
+                del self._build_locks[key]
+
+
+graph_instance_pool = GraphInstancePool(
+    max_bytes=config("KH_GRAPHRAG_INSTANCE_POOL_MB", default=1024, cast=int)
+    * 1024
+    * 1024
+)
+
+_embedding_dims: dict[str, int] = {}
+
+
+def get_embedding_dim(embedding) -> int:
+    """The dimension of the vectors of `embedding`, probed once per model"""
+    model_id = embedding_model_id(embedding)
+    if model_id not in _embedding_dims:
+        _embedding_dims[model_id] = len(embedding(["Hi"])[0].embedding)
+    return _embedding_dims[model_id]
+
+
 class GraphRAGIndexingPipeline(IndexDocumentPipeline):
     """GraphRAG specific indexing pipeline"""
 
@@ -70,6 +252,9 @@ class GraphRAGIndexingPipeline(IndexDocumentPipeline):
         """Simply disable the splitter (chunking) for this pipeline"""
         pipeline = super().route(file_path)
         pipeline.splitter = None
+        # the graph is built from the returned docs, which a skipped file lacks
+        pipeline.skip_unchanged = False
+        pipeline.return_docs = True
 
         return pipeline
 
@@ -146,10 +331,18 @@ class GraphRAGIndexingPipeline(IndexDocumentPipeline):
                 print("failed to copy customized GraphRAG config file. ")
 
         # Run the command and stream stdout
-        with subprocess.Popen(command, stdout=subprocess.PIPE, text=True) as process:
-            if process.stdout:
-                for line in process.stdout:
-                    yield Document(channel="debug", text=line)
+        graph_context_cache.invalidate(graph_id)
+        try:
+            with subprocess.Popen(
+                command, stdout=subprocess.PIPE, text=True
+            ) as process:
+                if process.stdout:
+                    for line in process.stdout:
+                        yield Document(channel="debug", text=line)
+        finally:
+            # the output folder was rewritten
+            graph_context_cache.invalidate(graph_id)
+            remove_lancedb_dirs(Path(input_path) / "output")
 
     def stream(
         self, file_paths: str | Path | list[str | Path], reindex: bool = False, **kwargs
@@ -187,6 +380,11 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
         }
 
     def _build_graph_search(self):
+        """Get the local search context builder of the selected graph
+
+        The builder is loaded once per graph build and kept in
+        `graph_context_cache`.
+        """
         assert (
             len(self.file_ids) <= 1
         ), "GraphRAG retriever only supports one file_id at a time"
@@ -204,10 +402,42 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
             assert graph_id, f"GraphRAG index not found for file_id: {file_id}"
 
         root_path, _ = prepare_graph_index_path(graph_id)
+        version = self._graph_version(root_path)
+        return graph_context_cache.get(
+            graph_id,
+            version,
+            lambda: self._load_context_builder(root_path, version),
+        )
+
+    def _graph_version(self, root_path: Path) -> tuple:
+        """Identify the index output and the settings a context builder uses"""
+        output_path = root_path / "output"
+        files = sorted(output_path.glob("*.parquet"))
+        settings_yaml_path = root_path / "settings.yaml"
+        if settings_yaml_path.is_file():
+            files.append(settings_yaml_path)
+
+        version = tuple(
+            (path.name, path.stat().st_mtime_ns, path.stat().st_size)
+            for path in files
+        )
+        # only a digest of the API key, to keep the secret out of the cache keys
+        api_key = os.getenv("GRAPHRAG_API_KEY")
+        return version + (
+            os.getenv("GRAPHRAG_EMBEDDING_MODEL"),
+            hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else None,
+            config("USE_CUSTOMIZED_GRAPHRAG_SETTING", default="value").lower(),
+        )
+
+    def _load_context_builder(self, root_path: Path, version: tuple):
         output_path = root_path / "output"
 
         INPUT_DIR = output_path
-        LANCEDB_URI = str(INPUT_DIR / "lancedb")
+        # one LanceDB dir per version of the output: a rebuild, in this process
+        # or another, never rewrites the table a context builder reads. The dirs
+        # of the previous versions are deleted once this one is loaded
+        version_hash = hashlib.sha256(repr(version).encode()).hexdigest()[:16]
+        LANCEDB_URI = str(INPUT_DIR / f"lancedb_{version_hash}")
         COMMUNITY_REPORT_TABLE = "create_final_community_reports"
         ENTITY_TABLE = "create_final_nodes"
         ENTITY_EMBEDDING_TABLE = "create_final_entities"
@@ -216,37 +446,38 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
         COMMUNITY_LEVEL = 2
 
         # read nodes table to get community and degree data
-        entity_df = pd.read_parquet(f"{INPUT_DIR}/{ENTITY_TABLE}.parquet")
-        entity_embedding_df = pd.read_parquet(
-            f"{INPUT_DIR}/{ENTITY_EMBEDDING_TABLE}.parquet"
-        )
+        entity_df = read_output_table(INPUT_DIR, ENTITY_TABLE)
+        entity_embedding_df = read_output_table(INPUT_DIR, ENTITY_EMBEDDING_TABLE)
         entities = read_indexer_entities(
             entity_df, entity_embedding_df, COMMUNITY_LEVEL
         )
 
-        # load description embeddings to an in-memory lancedb vectorstore
-        # to connect to a remote db, specify url and port values.
+        lancedb_path = Path(LANCEDB_URI)
+        if not lancedb_path.is_dir():
+            build_entity_description_store(entities, lancedb_path)
         description_embedding_store = LanceDBVectorStore(
-            collection_name="entity_description_embeddings",
+            collection_name=ENTITY_DESCRIPTION_COLLECTION,
         )
         description_embedding_store.connect(db_uri=LANCEDB_URI)
-        if Path(LANCEDB_URI).is_dir():
-            rmtree(LANCEDB_URI)
-        _ = store_entity_semantic_embeddings(
-            entities=entities, vectorstore=description_embedding_store
+        description_embedding_store.document_collection = (
+            description_embedding_store.db_connection.open_table(
+                ENTITY_DESCRIPTION_COLLECTION
+            )
         )
+        # the tables of the previous versions of the graph are not used anymore
+        remove_lancedb_dirs(INPUT_DIR, keep=lancedb_path.name)
         print(f"Entity count: {len(entity_df)}")
 
         # Read relationships
-        relationship_df = pd.read_parquet(f"{INPUT_DIR}/{RELATIONSHIP_TABLE}.parquet")
+        relationship_df = read_output_table(INPUT_DIR, RELATIONSHIP_TABLE)
         relationships = read_indexer_relationships(relationship_df)
 
         # Read community reports
-        report_df = pd.read_parquet(f"{INPUT_DIR}/{COMMUNITY_REPORT_TABLE}.parquet")
+        report_df = read_output_table(INPUT_DIR, COMMUNITY_REPORT_TABLE)
         reports = read_indexer_reports(report_df, entity_df, COMMUNITY_LEVEL)
 
         # Read text units
-        text_unit_df = pd.read_parquet(f"{INPUT_DIR}/{TEXT_UNIT_TABLE}.parquet")
+        text_unit_df = read_output_table(INPUT_DIR, TEXT_UNIT_TABLE)
         text_units = read_indexer_text_units(text_unit_df)
 
         # initialize default settings
@@ -276,7 +507,7 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
             deployment_name=embedding_model,
             max_retries=20,
         )
-        token_encoder = tiktoken.get_encoding("cl100k_base")
+        token_encoder = get_encoding("cl100k_base")
 
         context_builder = LocalSearchMixedContext(
             community_reports=reports,
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether `error` is a 429 response from an LLM provider
+
+    Matches the status code of the error or of its response, or a
+    `RateLimitError` exception type as raised by the OpenAI and Anthropic SDKs.
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code == 429:
+        return True
+    return any(cls.__name__ == "RateLimitError" for cls in type(error).__mro__)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket for LLM requests that adapts its rate to 429 responses
+
+    The bucket refills at `rate` requests per second. A rate limit error halves
+    the rate, or when no rate is set yet, sets it to half the rate observed over
+    the last minute. Each successful request then raises it by `increase` until
+    `max_rate` is reached again. The limiter does not hold asyncio primitives,
+    so it can be shared by the event loops LightRAG creates.
+
+    Args:
+        rate: initial requests per second, None to start without a limit
+        burst: number of requests that can be made at once
+        min_rate: the rate is never lowered below this
+        increase: requests per second added after each successful request
+        cooldown: seconds during which further 429s do not lower the rate,
+            as requests already in flight will fail too
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: int = 1,
+        min_rate: float = 0.05,
+        increase: float = 1 / 60,
+        cooldown: float = 2.0,
+    ):
+        self.rate = rate
+        self.max_rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.increase = increase
+        self.cooldown = cooldown
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._last_backoff = float("-inf")
+        self._recent: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._recent.append(now)
+            while self._recent[0] < now - 60:
+                self._recent.popleft()
+
+            if self.rate is None:
+                return 0.0
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # a negative balance queues the request behind the earlier ones
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate is None:
+                return
+            self.rate += self.increase
+            if self.max_rate is not None:
+                self.rate = min(self.rate, self.max_rate)
+
+    def on_rate_limit(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_backoff < self.cooldown:
+                return
+            self._last_backoff = now
+
+            if self.rate is None:
+                window = max(now - self._recent[0], 1.0) if self._recent else 60.0
+                current = len(self._recent) / window
+            else:
+                current = self.rate
+            self.rate = max(self.min_rate, current / 2)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = now
@@ -5,7 +5,15 @@ from typing import Any, Optional, Type
 from ktem.components import filestorage_path, get_docstore, get_vectorstore
 from ktem.db.engine import engine
 from ktem.index.base import BaseIndex
-from sqlalchemy import JSON, Column, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    Integer,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy import Index as SQLIndex
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.mutable import MutableDict
 from theflow.settings import settings as flowsettings
@@ -117,6 +125,19 @@ class FileIndex(BaseIndex):
             (Base,),
             {
                 "__tablename__": f"index__{self.id}__index",
+                "__table_args__": (
+                    # chunk resolution and file deletion filter on source_id
+                    SQLIndex(
+                        f"ix_index__{self.id}__index_source_id_relation_type",
+                        "source_id",
+                        "relation_type",
+                    ),
+                    SQLIndex(
+                        f"ix_index__{self.id}__index_target_id_relation_type",
+                        "target_id",
+                        "relation_type",
+                    ),
+                ),
                 "id": Column(Integer, primary_key=True, autoincrement=True),
                 "source_id": Column(String),
                 "target_id": Column(String),
@@ -346,6 +367,10 @@ class FileIndex(BaseIndex):
     def on_start(self):
         """Setup the classes and hooks"""
         self._setup_resources()
+        if not getattr(flowsettings, "KH_ENABLE_ALEMBIC", False):
+            # tables created before the indexes were declared don't have them
+            for sql_index in self._resources["Index"].__table__.indexes:
+                sql_index.create(engine, checkfirst=True)
         self._setup_indexing_cls()
         self._setup_retriever_cls()
         self._setup_file_index_ui_cls()
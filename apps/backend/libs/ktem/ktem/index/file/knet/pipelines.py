@@ -6,9 +6,10 @@ from typing import Optional, Sequence
 
 import requests
 import yaml
+from ktem.components import get_rerank_score_caches
 
 from kotaemon.base import RetrievedDocument
-from kotaemon.indices.rankings import BaseReranking, LLMReranking, LLMTrulensScoring
+from kotaemon.indices.rankings import BaseReranking, LLMListwiseScoring, LLMReranking
 
 from ..pipelines import BaseFileIndexRetriever, IndexDocumentPipeline, IndexPipeline
 
@@ -153,7 +154,7 @@ class KnetRetrievalPipeline(BaseFileIndexRetriever):
         from ktem.llms.manager import llms
 
         retriever = cls(
-            rerankers=[LLMTrulensScoring()],
+            rerankers=[LLMListwiseScoring(caches=get_rerank_score_caches())],
         )
 
         # hacky way to input doc_ids to retriever.run() call (through theflow)
@@ -1,20 +1,29 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
+import multiprocessing
+import queue
 import shutil
 import threading
 import time
 import warnings
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from copy import deepcopy
-from functools import lru_cache
+from functools import lru_cache, partial
 from hashlib import sha256
+from itertools import islice
 from pathlib import Path
-from typing import Generator, Optional, Sequence
+from typing import Generator, Iterator, Optional, Sequence
 
-import tiktoken
 from decouple import config
+from ktem.components import (
+    get_chunk_embedding_caches,
+    get_query_embedding_caches,
+    get_rerank_score_caches,
+)
 from ktem.db.models import engine
 from ktem.embeddings.manager import embedding_models_manager
 from ktem.llms.manager import llms
@@ -28,13 +37,15 @@ from llama_index.core.vector_stores import (
     MetadataFilters,
 )
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
-from sqlalchemy import delete, select
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 from theflow.settings import settings
 from theflow.utils.modules import import_dotted_string
 
 from kotaemon.base import BaseComponent, Document, Node, Param, RetrievedDocument
-from kotaemon.embeddings import BaseEmbeddings
+from kotaemon.base.tokens import get_token_counter
+from kotaemon.embeddings import BaseEmbeddings, CachedEmbeddings
+from kotaemon.embeddings.cache import embedding_model_id
 from kotaemon.indices import VectorIndexing, VectorRetrieval
 from kotaemon.indices.ingests.files import (
     KH_DEFAULT_FILE_EXTRACTORS,
@@ -44,8 +55,14 @@ from kotaemon.indices.ingests.files import (
     unstructured,
     web_reader,
 )
-from kotaemon.indices.rankings import BaseReranking, LLMReranking, LLMTrulensScoring
+from kotaemon.indices.rankings import (
+    BaseReranking,
+    LLMListwiseScoring,
+    LLMReranking,
+)
 from kotaemon.indices.splitters import BaseSplitter, TokenSplitter
+from kotaemon.loaders import PDFThumbnailReader
+from kotaemon.rerankings import CachedReranking
 
 from .base import BaseFileIndexIndexing, BaseFileIndexRetriever
 
@@ -74,7 +91,74 @@ def dev_settings():
     return file_extractors, chunk_size, chunk_overlap
 
 
-_default_token_func = tiktoken.encoding_for_model("gpt-3.5-turbo").encode
+_default_token_counter = get_token_counter("gpt-3.5-turbo")
+_default_token_func = _default_token_counter.encode
+
+
+def _file_hash(file_path: Path) -> str:
+    file_hash = sha256()
+    with file_path.open("rb") as fi:
+        for block in iter(lambda: fi.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class ChunkIdCache:
+    """Process-level LRU cache of the docstore chunk ids of each indexed file
+
+    Entries are keyed by (Index table name, file id), and must be invalidated
+    whenever the document relations of a file change.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._cache: OrderedDict[tuple[str, str], tuple[str, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped on invalidation, so that loads racing with a write aren't cached
+        self._generation = 0
+
+    def resolve(self, Index, file_ids: list[str]) -> list[str]:
+        """Get the chunk ids of `file_ids`, querying the Index table on misses"""
+        table = Index.__tablename__
+        found: dict[str, tuple[str, ...]] = {}
+        with self._lock:
+            generation = self._generation
+            for file_id in file_ids:
+                key = (table, file_id)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[file_id] = self._cache[key]
+
+        missing = [file_id for file_id in file_ids if file_id not in found]
+        if missing:
+            loaded: dict[str, list[str]] = {file_id: [] for file_id in missing}
+            with Session(engine) as session:
+                stmt = select(Index.source_id, Index.target_id).where(
+                    Index.source_id.in_(missing),
+                    Index.relation_type == "document",
+                )
+                for source_id, target_id in session.execute(stmt):
+                    loaded[source_id].append(target_id)
+
+            with self._lock:
+                for file_id, chunk_ids in loaded.items():
+                    found[file_id] = tuple(chunk_ids)
+                    if generation == self._generation:
+                        self._cache[(table, file_id)] = found[file_id]
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+
+        return [chunk_id for file_id in file_ids for chunk_id in found[file_id]]
+
+    def invalidate(self, Index, file_id: str):
+        with self._lock:
+            self._generation += 1
+            self._cache.pop((Index.__tablename__, file_id), None)
+
+
+chunk_id_cache = ChunkIdCache(
+    maxsize=config("KH_CHUNK_ID_CACHE_SIZE", default=4096, cast=int)
+)
 
 
 class DocumentRetrievalPipeline(BaseFileIndexRetriever):
@@ -99,6 +183,9 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
     mmr: bool = False
     top_k: int = 5
     retrieval_mode: str = "hybrid"
+    selected_doc_ids: Optional[list[str]] = Param(
+        None, help="The selected doc ids, for the calls that don't pass doc_ids"
+    )
 
     @Node.auto(depends_on=["embedding", "VS", "DS"])
     def vector_retrieval(self) -> VectorRetrieval:
@@ -110,49 +197,28 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             rerankers=self.rerankers,
         )
 
-    def run(
-        self,
-        text: str,
-        doc_ids: Optional[list[str]] = None,
-        *args,
-        **kwargs,
-    ) -> list[RetrievedDocument]:
-        """Retrieve document excerpts similar to the text
-
-        Args:
-            text: the text to retrieve similar documents
-            doc_ids: list of document ids to constraint the retrieval
-        """
-        # flatten doc_ids in case of group of doc_ids are passed
-        if doc_ids:
-            flatten_doc_ids = []
-            for doc_id in doc_ids:
-                if doc_id is None:
-                    raise ValueError("No document is selected")
-
-                if doc_id.startswith("["):
-                    flatten_doc_ids.extend(json.loads(doc_id))
-                else:
-                    flatten_doc_ids.append(doc_id)
-            doc_ids = flatten_doc_ids
+    def flatten_doc_ids(self, doc_ids: Optional[list[str]]) -> list[str]:
+        """Flatten doc_ids in case of group of doc_ids are passed"""
+        flatten_doc_ids: list[str] = []
+        for doc_id in doc_ids or []:
+            if doc_id is None:
+                raise ValueError("No document is selected")
 
-        print("searching in doc_ids", doc_ids)
-        if not doc_ids:
-            logger.info(f"Skip retrieval because of no selected files: {self}")
-            return []
+            if doc_id.startswith("["):
+                flatten_doc_ids.extend(json.loads(doc_id))
+            else:
+                flatten_doc_ids.append(doc_id)
+        return flatten_doc_ids
 
+    def prepare_retrieval_kwargs(self, doc_ids: list[str]) -> dict:
+        """Build the vector retrieval kwargs that scope the search to `doc_ids`"""
         retrieval_kwargs: dict = {}
-        with Session(engine) as session:
-            stmt = select(self.Index).where(
-                self.Index.relation_type == "document",
-                self.Index.source_id.in_(doc_ids),
-            )
-            results = session.execute(stmt)
-            chunk_ids = [r[0].target_id for r in results.all()]
+        chunk_ids = chunk_id_cache.resolve(self.Index, doc_ids)
 
         # do first round top_k extension
         retrieval_kwargs["do_extend"] = True
         retrieval_kwargs["scope"] = chunk_ids
+        retrieval_kwargs["file_ids"] = doc_ids
         retrieval_kwargs["filters"] = MetadataFilters(
             filters=[
                 MetadataFilter(
@@ -169,16 +235,12 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             retrieval_kwargs["mode"] = VectorStoreQueryMode.MMR
             retrieval_kwargs["mmr_threshold"] = 0.5
 
-        # rerank
-        s_time = time.time()
-        print(f"retrieval_kwargs: {retrieval_kwargs.keys()}")
-        docs = self.vector_retrieval(text=text, top_k=self.top_k, **retrieval_kwargs)
-        print("retrieval step took", time.time() - s_time)
-
-        if not self.get_extra_table:
-            return docs
+        return retrieval_kwargs
 
-        # retrieve extra nodes relate to table
+    def add_extra_tables(
+        self, docs: list[RetrievedDocument]
+    ) -> list[RetrievedDocument]:
+        """Retrieve extra nodes relate to table on the same pages as `docs`"""
         table_pages = defaultdict(list)
         retrieved_id = set([doc.doc_id for doc in docs])
         for doc in docs:
@@ -210,6 +272,74 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
 
         return docs
 
+    def run(
+        self,
+        text: str,
+        doc_ids: Optional[list[str]] = None,
+        *args,
+        **kwargs,
+    ) -> list[RetrievedDocument]:
+        """Retrieve document excerpts similar to the text
+
+        Args:
+            text: the text to retrieve similar documents
+            doc_ids: list of document ids to constraint the retrieval
+        """
+        doc_ids = self.flatten_doc_ids(doc_ids)
+
+        print("searching in doc_ids", doc_ids)
+        if not doc_ids:
+            logger.info(f"Skip retrieval because of no selected files: {self}")
+            return []
+
+        retrieval_kwargs = self.prepare_retrieval_kwargs(doc_ids)
+
+        # rerank
+        s_time = time.time()
+        print(f"retrieval_kwargs: {retrieval_kwargs.keys()}")
+        docs = self.vector_retrieval(text=text, top_k=self.top_k, **retrieval_kwargs)
+        print("retrieval step took", time.time() - s_time)
+
+        if not self.get_extra_table:
+            return docs
+
+        return self.add_extra_tables(docs)
+
+    async def ainvoke(  # type: ignore
+        self,
+        text: str,
+        doc_ids: Optional[list[str]] = None,
+        *args,
+        **kwargs,
+    ) -> list[RetrievedDocument]:
+        """Async version of `run`
+
+        `__call__` gets the selected doc_ids bound with `set_run` in
+        `get_pipeline`, this path reads them from `selected_doc_ids` instead.
+        """
+        if doc_ids is None:
+            doc_ids = self.selected_doc_ids
+        doc_ids = self.flatten_doc_ids(doc_ids)
+
+        if not doc_ids:
+            logger.info(f"Skip retrieval because of no selected files: {self}")
+            return []
+
+        retrieval_kwargs = await asyncio.to_thread(
+            self.prepare_retrieval_kwargs, doc_ids
+        )
+
+        s_time = time.time()
+        docs = await self.vector_retrieval.ainvoke(
+            text=text, top_k=self.top_k, **retrieval_kwargs
+        )
+        print("retrieval step took", time.time() - s_time)
+
+        if not self.get_extra_table:
+            return docs
+
+        return await asyncio.to_thread(self.add_extra_tables, docs)
+
     def generate_relevant_scores(
         self, query: str, documents: list[RetrievedDocument]
     ) -> list[RetrievedDocument]:
@@ -220,6 +350,13 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
         )
         return docs
 
+    async def agenerate_relevant_scores(
+        self, query: str, documents: list[RetrievedDocument]
+    ) -> list[RetrievedDocument]:
+        if not self.llm_scorer:
+            return documents
+        return await self.llm_scorer.ainvoke(documents=documents, query=query)
+
     @classmethod
     def get_user_settings(cls) -> dict:
         from ktem.llms.manager import llms
@@ -291,19 +428,29 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             get_extra_table=user_settings["prioritize_table"],
             top_k=user_settings["num_retrieval"],
             mmr=user_settings["mmr"],
-            embedding=embedding_models_manager[
-                index_settings.get(
-                    "embedding", embedding_models_manager.get_default_name()
-                )
-            ],
-            retrieval_mode=user_settings["retrieval_mode"],
-            llm_scorer=(LLMTrulensScoring() if use_llm_reranking else None),
-            rerankers=[
-                reranking_models_manager[
+            embedding=CachedEmbeddings(
+                embedding=embedding_models_manager[
                     index_settings.get(
-                        "reranking", reranking_models_manager.get_default_name()
+                        "embedding", embedding_models_manager.get_default_name()
                     )
-                ]
+                ],
+                caches=get_query_embedding_caches(),
+            ),
+            retrieval_mode=user_settings["retrieval_mode"],
+            llm_scorer=(
+                LLMListwiseScoring(caches=get_rerank_score_caches())
+                if use_llm_reranking
+                else None
+            ),
+            rerankers=[
+                CachedReranking(
+                    reranker=reranking_models_manager[
+                        index_settings.get(
+                            "reranking", reranking_models_manager.get_default_name()
+                        )
+                    ],
+                    caches=get_rerank_score_caches(),
+                )
             ],
         )
         if not user_settings["use_reranking"]:
@@ -322,15 +469,84 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
 
         kwargs = {".doc_ids": selected}
         retriever.set_run(kwargs, temp=False)
+        retriever.selected_doc_ids = selected
         return retriever
 
 
+def delete_file_thumbnails(file_id: str):
+    """Delete the page thumbnails saved for a file by `PDFThumbnailReader`"""
+    thumbnail_dir = getattr(settings, "KH_THUMBNAIL_OUTPUT_DIR", None)
+    if thumbnail_dir and file_id:
+        shutil.rmtree(Path(thumbnail_dir) / file_id, ignore_errors=True)
+
+
+def split_docs(docs: list[Document], splitter: BaseSplitter | None) -> list[Document]:
+    """Split the text documents of a file, and link the chunks to their thumbnails
+
+    Returns:
+        the chunks, followed by the non-text documents and the thumbnails
+    """
+    text_docs = []
+    non_text_docs = []
+    thumbnail_docs = []
+
+    for doc in docs:
+        doc_type = doc.metadata.get("type", "text")
+        if doc_type == "text":
+            text_docs.append(doc)
+        elif doc_type == "thumbnail":
+            thumbnail_docs.append(doc)
+        else:
+            non_text_docs.append(doc)
+
+    print(f"Got {len(thumbnail_docs)} page thumbnails")
+    page_label_to_thumbnail = {
+        doc.metadata["page_label"]: doc.doc_id for doc in thumbnail_docs
+    }
+
+    if splitter:
+        all_chunks = splitter(text_docs)
+    else:
+        all_chunks = text_docs
+
+    # add the thumbnails doc_id to the chunks
+    for chunk in all_chunks:
+        page_label = chunk.metadata.get("page_label", None)
+        if page_label and page_label in page_label_to_thumbnail:
+            chunk.metadata["thumbnail_doc_id"] = page_label_to_thumbnail[page_label]
+
+    return all_chunks + non_text_docs + thumbnail_docs
+
+
+def load_and_split(
+    loader: BaseReader,
+    splitter: BaseSplitter | None,
+    file_path: str | Path,
+    extra_info: dict,
+    return_docs: bool = False,
+) -> tuple[list[Document], list[Document]]:
+    """Load and split a file, in a worker process of the parallel ingestion
+
+    Returns:
+        the loaded documents if `return_docs`, and the chunks to index
+    """
+    docs = loader.load_data(file_path, extra_info=extra_info)
+    return docs if return_docs else [], split_docs(docs, splitter)
+
+
 class IndexPipeline(BaseComponent):
     """Index a single file"""
 
     loader: BaseReader
     splitter: BaseSplitter | None
     chunk_batch_size: int = 200
+    page_batch_size: int = Param(
+        32,
+        help=(
+            "Number of pages split and indexed together, for loaders that parse "
+            "files page by page"
+        ),
+    )
 
     Source = Param(help="The SQLAlchemy Source table")
     Index = Param(help="The SQLAlchemy Index table")
@@ -341,7 +557,26 @@ class IndexPipeline(BaseComponent):
     collection_name: str = "default"
     private: bool = False
     run_embedding_in_thread: bool = False
+    skip_unchanged: bool = Param(
+        True,
+        help=(
+            "When reindexing, keep the existing records of a file whose content "
+            "and index settings have not changed"
+        ),
+    )
     embedding: BaseEmbeddings
+    return_docs: bool = Param(
+        False,
+        help=(
+            "Return the loaded documents from `stream`, for the pipelines built "
+            "on them. Otherwise only a few pages of a file are held in memory"
+        ),
+    )
+
+    chunk_tokens: dict = Param(
+        default_callback=lambda _: {},
+        help="Number of tokens of the chunks of each file being indexed, for `finish`",
+    )
 
     @Node.auto(depends_on=["Source", "Index", "embedding"])
     def vector_indexing(self) -> VectorIndexing:
@@ -351,36 +586,19 @@ class IndexPipeline(BaseComponent):
 
     def handle_docs(self, docs, file_id, file_name) -> Generator[Document, None, int]:
         s_time = time.time()
-        text_docs = []
-        non_text_docs = []
-        thumbnail_docs = []
-
-        for doc in docs:
-            doc_type = doc.metadata.get("type", "text")
-            if doc_type == "text":
-                text_docs.append(doc)
-            elif doc_type == "thumbnail":
-                thumbnail_docs.append(doc)
-            else:
-                non_text_docs.append(doc)
-
-        print(f"Got {len(thumbnail_docs)} page thumbnails")
-        page_label_to_thumbnail = {
-            doc.metadata["page_label"]: doc.doc_id for doc in thumbnail_docs
-        }
-
-        if self.splitter:
-            all_chunks = self.splitter(text_docs)
-        else:
-            all_chunks = text_docs
-
-        # add the thumbnails doc_id to the chunks
-        for chunk in all_chunks:
-            page_label = chunk.metadata.get("page_label", None)
-            if page_label and page_label in page_label_to_thumbnail:
-                chunk.metadata["thumbnail_doc_id"] = page_label_to_thumbnail[page_label]
+        to_index_chunks = split_docs(docs, self.splitter)
+        n_chunks = yield from self.index_chunks(to_index_chunks, file_id, file_name)
+        print("indexing step took", time.time() - s_time)
+        return n_chunks
 
-        to_index_chunks = all_chunks + non_text_docs + thumbnail_docs
+    def index_chunks(
+        self, to_index_chunks: list[Document], file_id: str, file_name: str
+    ) -> Generator[Document, None, int]:
+        """Write the chunks of a file to the doc store and the vector store"""
+        n_tokens = self.count_tokens(to_index_chunks)
+        if n_tokens is not None and to_index_chunks:
+            # files loaded page by page are indexed in several calls
+            self.chunk_tokens[file_id] = self.chunk_tokens.get(file_id, 0) + n_tokens
 
         # add to doc store
         chunks = []
@@ -396,18 +614,13 @@ class IndexPipeline(BaseComponent):
             )
 
         def insert_chunks_to_vectorstore():
-            chunks = []
             n_chunks = 0
-            chunk_size = self.chunk_batch_size
-            for start_idx in range(0, len(to_index_chunks), chunk_size):
-                chunks = to_index_chunks[start_idx : start_idx + chunk_size]
-                self.handle_chunks_vectorstore(chunks, file_id)
+            for chunks in self.handle_chunks_vectorstore(to_index_chunks, file_id):
                 n_chunks += len(chunks)
-                if self.VS:
-                    yield Document(
-                        f" => [{file_name}] Created embedding for {n_chunks} chunks",
-                        channel="debug",
-                    )
+                yield Document(
+                    f" => [{file_name}] Created embedding for {n_chunks} chunks",
+                    channel="debug",
+                )
 
         # run vector indexing in thread if specified
         if self.run_embedding_in_thread:
@@ -418,7 +631,6 @@ class IndexPipeline(BaseComponent):
         else:
             yield from insert_chunks_to_vectorstore()
 
-        print("indexing step took", time.time() - s_time)
         return n_chunks
 
     def handle_chunks_docstore(self, chunks, file_id):
@@ -427,39 +639,46 @@ class IndexPipeline(BaseComponent):
         self.vector_indexing.add_to_docstore(chunks)
 
         # record in the index
+        self.record_chunks(chunks, file_id, relation_type="document")
+
+    def record_chunks(self, chunks, file_id: str, relation_type: str):
+        """Record the file -> chunk relations with a single bulk insert"""
+        if not chunks:
+            return
+
         with Session(engine) as session:
-            nodes = []
-            for chunk in chunks:
-                nodes.append(
-                    self.Index(
-                        source_id=file_id,
-                        target_id=chunk.doc_id,
-                        relation_type="document",
-                    )
-                )
-            session.add_all(nodes)
+            session.execute(
+                insert(self.Index),
+                [
+                    {
+                        "source_id": file_id,
+                        "target_id": chunk.doc_id,
+                        "relation_type": relation_type,
+                    }
+                    for chunk in chunks
+                ],
+            )
             session.commit()
+        chunk_id_cache.invalidate(self.Index, file_id)
 
-    def handle_chunks_vectorstore(self, chunks, file_id):
-        """Run chunks"""
-        # run embedding, add to both vector store and doc store
-        self.vector_indexing.add_to_vectorstore(chunks)
-        self.vector_indexing.write_chunk_to_file(chunks)
+    def handle_chunks_vectorstore(
+        self, chunks, file_id
+    ) -> Generator[list[Document], None, None]:
+        """Embed the chunks into the vector store, yielding each stored batch
+
+        The embedding requests are packed by token count and overlapped with the
+        vector store writes, see `VectorIndexing.stream_to_vectorstore`.
+        """
+        if not self.VS:
+            if chunks:
+                self.vector_indexing.write_chunk_to_file(chunks)
+            return
 
-        if self.VS:
+        for batch in self.vector_indexing.stream_to_vectorstore(chunks):
+            self.vector_indexing.write_chunk_to_file(batch)
             # record in the index
-            with Session(engine) as session:
-                nodes = []
-                for chunk in chunks:
-                    nodes.append(
-                        self.Index(
-                            source_id=file_id,
-                            target_id=chunk.doc_id,
-                            relation_type="vector",
-                        )
-                    )
-                session.add_all(nodes)
-                session.commit()
+            self.record_chunks(batch, file_id, relation_type="vector")
+            yield batch
 
     def get_id_if_exists(self, file_path: str | Path) -> Optional[str]:
         """Check if the file is already indexed
@@ -487,6 +706,41 @@ class IndexPipeline(BaseComponent):
 
         return None
 
+    def index_fingerprint(self) -> str:
+        """Hash of the settings that determine the indexed chunks of a file"""
+        index_settings = {
+            "loader": self.get_from_path("loader").__class__.__name__,
+            "splitter": (
+                [
+                    self.splitter.__class__.__name__,
+                    getattr(self.splitter, "_kwargs", {}),
+                ]
+                if self.splitter
+                else None
+            ),
+            "embedding": embedding_model_id(self.embedding),
+            "vectorstore": bool(self.VS),
+        }
+        return sha256(
+            json.dumps(index_settings, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def is_unchanged(self, file_id: str, file_path: Path) -> bool:
+        """Check if the indexed file has the same content and index settings
+
+        Files indexed before the content hash and settings were recorded are
+        always considered changed.
+        """
+        with Session(engine) as session:
+            item = session.get(self.Source, file_id)
+            note = dict(item.note or {}) if item else {}
+
+        if not note.get("file_hash") or not note.get("index_fingerprint"):
+            return False
+        if note["index_fingerprint"] != self.index_fingerprint():
+            return False
+        return note["file_hash"] == _file_hash(file_path)
+
     def store_url(self, url: str) -> str:
         """Store URL into the database and storage, return the file id
 
@@ -519,8 +773,7 @@ class IndexPipeline(BaseComponent):
         Returns:
             the file id
         """
-        with file_path.open("rb") as fi:
-            file_hash = sha256(fi.read()).hexdigest()
+        file_hash = _file_hash(file_path)
 
         final_path = self.FSPath / file_hash
         shutil.copy(file_path, final_path)
@@ -529,6 +782,7 @@ class IndexPipeline(BaseComponent):
             path=str(final_path),
             size=file_path.stat().st_size,
             user=self.user_id,  # type: ignore
+            note={"file_hash": file_hash},
         )
         with Session(engine) as session:
             session.add(source)
@@ -547,19 +801,22 @@ class IndexPipeline(BaseComponent):
 
             item = result[0]
 
-            # populate the number of tokens
-            doc_ids_stmt = select(self.Index.target_id).where(
-                self.Index.source_id == file_id,
-                self.Index.relation_type == "document",
-            )
-            doc_ids = [_[0] for _ in session.execute(doc_ids_stmt)]
-            token_func = self.get_token_func()
-            if doc_ids and token_func:
-                docs = self.DS.get(doc_ids)
-                item.note["tokens"] = sum([len(token_func(doc.text)) for doc in docs])
+            # populate the number of tokens, counted when the chunks were indexed
+            n_tokens = self.chunk_tokens.pop(file_id, None)
+            if n_tokens is None:
+                doc_ids_stmt = select(self.Index.target_id).where(
+                    self.Index.source_id == file_id,
+                    self.Index.relation_type == "document",
+                )
+                doc_ids = [_[0] for _ in session.execute(doc_ids_stmt)]
+                if doc_ids:
+                    n_tokens = self.count_tokens(self.DS.get(doc_ids))
+            if n_tokens is not None:
+                item.note["tokens"] = n_tokens
 
             # populate the note
             item.note["loader"] = self.get_from_path("loader").__class__.__name__
+            item.note["index_fingerprint"] = self.index_fingerprint()
 
             session.add(item)
             session.commit()
@@ -570,6 +827,17 @@ class IndexPipeline(BaseComponent):
         """Get the token function for calculating the number of tokens"""
         return _default_token_func
 
+    def count_tokens(self, docs: list[Document]) -> Optional[int]:
+        """Total number of tokens of `docs`, None without a token function"""
+        token_func = self.get_token_func()
+        if not token_func:
+            return None
+        texts = [doc.text for doc in docs]
+        if token_func == _default_token_func:
+            # memoized batch counting of the shared counter
+            return sum(_default_token_counter.count_many(texts))
+        return sum(len(token_func(text)) for text in texts)
+
     def delete_file(self, file_id: str):
         """Delete a file from the db, including its chunks in docstore and vectorstore
 
@@ -580,33 +848,39 @@ class IndexPipeline(BaseComponent):
             session.execute(delete(self.Source).where(self.Source.id == file_id))
             vs_ids, ds_ids = [], []
             index = session.execute(
-                select(self.Index).where(self.Index.source_id == file_id)
+                select(self.Index.target_id, self.Index.relation_type).where(
+                    self.Index.source_id == file_id
+                )
             ).all()
-            for each in index:
-                if each[0].relation_type == "vector":
-                    vs_ids.append(each[0].target_id)
-                elif each[0].relation_type == "document":
-                    ds_ids.append(each[0].target_id)
-                session.delete(each[0])
+            for target_id, relation_type in index:
+                if relation_type == "vector":
+                    vs_ids.append(target_id)
+                elif relation_type == "document":
+                    ds_ids.append(target_id)
+            session.execute(delete(self.Index).where(self.Index.source_id == file_id))
             session.commit()
+        chunk_id_cache.invalidate(self.Index, file_id)
 
         if vs_ids and self.VS:
             self.VS.delete(vs_ids)
         if ds_ids:
             self.DS.delete(ds_ids)
+        delete_file_thumbnails(file_id)
 
     def run(
         self, file_path: str | Path, reindex: bool, **kwargs
     ) -> tuple[str, list[Document]]:
         raise NotImplementedError
 
-    def stream(
-        self, file_path: str | Path, reindex: bool, **kwargs
-    ) -> Generator[Document, None, tuple[str, list[Document]]]:
-        # check if the file is already indexed
-        if isinstance(file_path, Path):
-            file_path = file_path.resolve()
+    def prepare(
+        self, file_path: str | Path, reindex: bool
+    ) -> Generator[Document, None, tuple[str, bool]]:
+        """Record the file in the db before loading it
 
+        Returns:
+            the file id, and whether the file is unchanged and already indexed
+        """
+        # check if the file is already indexed
         file_id = self.get_id_if_exists(file_path)
 
         if isinstance(file_path, Path):
@@ -616,6 +890,13 @@ class IndexPipeline(BaseComponent):
                         f"File {file_path.name} already indexed. Please rerun with "
                         "reindex=True to force reindexing."
                     )
+                elif self.skip_unchanged and self.is_unchanged(file_id, file_path):
+                    yield Document(
+                        f" => {file_path.name} is unchanged, keeping the existing "
+                        "index",
+                        channel="debug",
+                    )
+                    return file_id, True
                 else:
                     # remove the existing records
                     yield Document(
@@ -633,21 +914,53 @@ class IndexPipeline(BaseComponent):
                 # add record to db
                 file_id = self.store_url(file_path)
 
-        # extract the file
+        return file_id, False
+
+    def get_extra_info(self, file_path: str | Path, file_id: str) -> dict:
+        """The metadata attached to every document loaded from the file"""
         if isinstance(file_path, Path):
             extra_info = default_file_metadata_func(str(file_path))
-            file_name = file_path.name
         else:
             extra_info = {"file_name": file_path}
-            file_name = file_path
 
         extra_info["file_id"] = file_id
         extra_info["collection_name"] = self.collection_name
+        return extra_info
+
+    def load_batches(
+        self, file_path: str | Path, extra_info: dict
+    ) -> Iterator[list[Document]]:
+        """Load the file in batches of `page_batch_size` pages when the loader
+        parses it page by page, otherwise in a single batch"""
+        if isinstance(self.loader, PDFThumbnailReader):
+            pages = self.loader.iter_pages(file_path, extra_info=extra_info)
+            while batch := list(islice(pages, self.page_batch_size)):
+                yield [doc for page_docs in batch for doc in page_docs]
+        else:
+            yield self.loader.load_data(file_path, extra_info=extra_info)
+
+    def stream(
+        self, file_path: str | Path, reindex: bool, **kwargs
+    ) -> Generator[Document, None, tuple[str, list[Document]]]:
+        if isinstance(file_path, Path):
+            file_path = file_path.resolve()
+
+        file_id, unchanged = yield from self.prepare(file_path, reindex)
+        if unchanged:
+            return file_id, []
+
+        # extract the file
+        extra_info = self.get_extra_info(file_path, file_id)
+        file_name = file_path.name if isinstance(file_path, Path) else file_path
 
         yield Document(f" => Converting {file_name} to text", channel="debug")
-        docs = self.loader.load_data(file_path, extra_info=extra_info)
+        docs = []
+        for batch in self.load_batches(file_path, extra_info):
+            # each batch is split and indexed before the next pages are parsed
+            if self.return_docs:
+                docs.extend(batch)
+            yield from self.handle_docs(batch, file_id, file_name)
         yield Document(f" => Converted {file_name} to text", channel="debug")
-        yield from self.handle_docs(docs, file_id, file_name)
 
         self.finish(file_id, file_path)
 
@@ -670,6 +983,25 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
     reader_mode: str = Param("default", help="The reader mode")
     embedding: BaseEmbeddings
     run_embedding_in_thread: bool = False
+    ingestion_workers: int = Param(
+        default_callback=lambda _: getattr(settings, "KH_INGESTION_WORKERS", 1),
+        help=(
+            "Number of processes loading and splitting files in parallel, "
+            "1 to index the files one at a time"
+        ),
+    )
+    embedding_workers: int = Param(
+        default_callback=lambda _: getattr(
+            settings, "KH_INGESTION_EMBEDDING_WORKERS", 4
+        ),
+        help="Number of threads embedding and storing the chunks of loaded files",
+    )
+    max_files_in_flight: int = Param(
+        default_callback=lambda _: getattr(
+            settings, "KH_INGESTION_MAX_FILES_IN_FLIGHT", 16
+        ),
+        help="Maximum number of files loaded but not yet fully indexed",
+    )
 
     @Param.auto(depends_on="reader_mode")
     def readers(self):
@@ -769,11 +1101,23 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
             FSPath=self.FSPath,
             user_id=self.user_id,
             private=self.private,
-            embedding=self.embedding,
+            embedding=self.cached_embedding,
         )
 
         return pipeline
 
+    @Param.auto(depends_on="embedding")
+    def cached_embedding(self) -> BaseEmbeddings:
+        """The embedding model, behind the persistent chunk embedding cache
+
+        Chunks are keyed on their text, so re-indexing an edited file only embeds
+        the chunks that changed.
+        """
+        caches = get_chunk_embedding_caches()
+        if not caches:
+            return self.embedding
+        return CachedEmbeddings(embedding=self.embedding, caches=caches)
+
     def run(
         self, file_paths: str | Path | list[str | Path], *args, **kwargs
     ) -> tuple[list[str | None], list[str | None]]:
@@ -788,6 +1132,11 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
         if not isinstance(file_paths, list):
             file_paths = [file_paths]
 
+        if self.ingestion_workers > 1 and len(file_paths) > 1:
+            return (
+                yield from self.stream_parallel(file_paths, reindex=reindex, **kwargs)
+            )
+
         file_ids: list[str | None] = []
         errors: list[str | None] = []
         all_docs = []
@@ -835,4 +1184,156 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
                     channel="index",
                 )
 
+        self.refresh_doc_store()
+        return file_ids, errors, all_docs
+
+    def refresh_doc_store(self):
+        """Make the new chunks full-text searchable once the files are indexed,
+        rather than when the deferred refresh of the doc store fires"""
+        try:
+            self.DS.refresh_indices()
+        except Exception as e:
+            logger.exception(e)
+
+    def stream_parallel(
+        self, file_paths: list[str | Path], reindex: bool = False, **kwargs
+    ) -> Generator[
+        Document, None, tuple[list[str | None], list[str | None], list[Document]]
+    ]:
+        """Index the files concurrently, with the same output as `stream`
+
+        Files are recorded in the db one at a time, loaded and split in a process
+        pool, then embedded and stored in a thread pool. Progress is yielded as it
+        happens, so messages of different files are interleaved.
+        """
+        n_files = len(file_paths)
+        file_ids: list[str | None] = [None] * n_files
+        errors: list[str | None] = [None] * n_files
+        file_docs: list[list[Document]] = [[] for _ in range(n_files)]
+        events: queue.Queue = queue.Queue()
+
+        def index_file(idx, pipeline, file_id, file_path, file_name, loaded):
+            try:
+                docs, chunks = loaded.result()
+                events.put(
+                    Document(f" => Converted {file_name} to text", channel="debug")
+                )
+                for progress in pipeline.index_chunks(chunks, file_id, file_name):
+                    events.put(progress)
+                pipeline.finish(file_id, file_path)
+                events.put(
+                    Document(f" => Finished indexing {file_name}", channel="debug")
+                )
+                events.put((idx, file_id, docs, None))
+            except Exception as e:
+                logger.exception(e)
+                events.put((idx, None, [], e))
+
+        def schedule_index(idx, pipeline, file_id, file_path, file_name, loaded):
+            if loaded.cancelled():
+                return
+            try:
+                index_pool.submit(
+                    index_file, idx, pipeline, file_id, file_path, file_name, loaded
+                )
+            except RuntimeError:
+                # the generator was closed and the pools are shutting down
+                logger.warning(f"Indexing of {file_name} was cancelled")
+
+        def index_status(idx, file_id, docs, error):
+            file_path = file_paths[idx]
+            file_name = file_path if self.is_url(file_path) else Path(file_path).name
+            if error is None:
+                file_ids[idx] = file_id
+                file_docs[idx] = docs
+                return Document(
+                    content={
+                        "file_path": file_path,
+                        "file_name": file_name,
+                        "status": "success",
+                    },
+                    channel="index",
+                )
+
+            errors[idx] = str(error)
+            return Document(
+                content={
+                    "file_path": file_path,
+                    "file_name": file_name,
+                    "status": "failed",
+                    "message": str(error),
+                },
+                channel="index",
+            )
+
+        in_flight = 0
+
+        def drain(until: int):
+            """Yield progress until at most `until` files are in flight"""
+            nonlocal in_flight
+            while in_flight > until:
+                event = events.get()
+                if isinstance(event, Document):
+                    yield event
+                else:
+                    in_flight -= 1
+                    yield index_status(*event)
+
+        # spawn, not fork: the server process has running threads, whose locks
+        # could be inherited in a held state by the forked workers
+        load_pool = ProcessPoolExecutor(
+            max_workers=self.ingestion_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        index_pool = ThreadPoolExecutor(max_workers=self.embedding_workers)
+        try:
+            for idx, file_path in enumerate(file_paths):
+                if not self.is_url(file_path):
+                    file_path = Path(file_path).resolve()
+                file_name = file_path.name if isinstance(file_path, Path) else file_path
+                yield Document(
+                    content=f"Indexing [{idx + 1}/{n_files}]: {file_name}",
+                    channel="debug",
+                )
+
+                try:
+                    pipeline = self.route(file_path)
+                    file_id, unchanged = yield from pipeline.prepare(file_path, reindex)
+                    if not unchanged:
+                        extra_info = pipeline.get_extra_info(file_path, file_id)
+                        loaded = load_pool.submit(
+                            load_and_split,
+                            pipeline.loader,
+                            pipeline.splitter,
+                            file_path,
+                            extra_info,
+                            pipeline.return_docs,
+                        )
+                except Exception as e:
+                    logger.exception(e)
+                    yield index_status(idx, None, [], e)
+                    continue
+
+                if unchanged:
+                    yield index_status(idx, file_id, [], None)
+                    continue
+
+                yield Document(f" => Converting {file_name} to text", channel="debug")
+                in_flight += 1
+                loaded.add_done_callback(
+                    partial(
+                        schedule_index, idx, pipeline, file_id, file_path, file_name
+                    )
+                )
+                yield from drain(until=self.max_files_in_flight - 1)
+
+            yield from drain(until=0)
+        finally:
+            # on early close, drop the pending loads before stopping the index
+            # pool, so that no load completes into a pool already shut down
+            load_pool.shutdown(wait=True, cancel_futures=True)
+            index_pool.shutdown(wait=True)
+
+        self.refresh_doc_store()
+        all_docs = [doc for docs in file_docs for doc in docs]
         return file_ids, errors, all_docs
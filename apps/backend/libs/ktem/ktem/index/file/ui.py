@@ -15,12 +15,13 @@ from gradio.utils import NamedString
 from ktem.app import BasePage
 from ktem.db.engine import engine
 from ktem.utils.render import Render
-from sqlalchemy import select
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
 from theflow.settings import settings as flowsettings
 
 from ...utils.commands import WEB_SEARCH_COMMAND
 from ...utils.rate_limit import check_rate_limit
+from .pipelines import chunk_id_cache, delete_file_thumbnails
 from .utils import download_arxiv_pdf, is_arxiv_url
 
 KH_DEMO_MODE = getattr(flowsettings, "KH_DEMO_MODE", False)
@@ -456,23 +457,26 @@ class FileIndexPage(BasePage):
                 file_name = source[0].name
                 session.delete(source[0])
 
+            Index = self._index._resources["Index"]
             vs_ids, ds_ids = [], []
             index = session.execute(
-                select(self._index._resources["Index"]).where(
-                    self._index._resources["Index"].source_id == file_id
+                select(Index.target_id, Index.relation_type).where(
+                    Index.source_id == file_id
                 )
             ).all()
-            for each in index:
-                if each[0].relation_type == "vector":
-                    vs_ids.append(each[0].target_id)
-                elif each[0].relation_type == "document":
-                    ds_ids.append(each[0].target_id)
-                session.delete(each[0])
+            for target_id, relation_type in index:
+                if relation_type == "vector":
+                    vs_ids.append(target_id)
+                elif relation_type == "document":
+                    ds_ids.append(target_id)
+            session.execute(delete(Index).where(Index.source_id == file_id))
             session.commit()
+        chunk_id_cache.invalidate(Index, file_id)
 
         if vs_ids:
             self._index._vs.delete(vs_ids)
         self._index._docstore.delete(ds_ids)
+        delete_file_thumbnails(file_id)
 
         gr.Info(f"File {file_name} has been deleted")
 
@@ -48,6 +48,14 @@ class BaseReasoning(BaseComponent):
         """
         return cls()
 
+    @classmethod
+    def supports_astream(cls) -> bool:
+        """Whether the pipeline implements a native `astream`
+
+        Pipelines that don't are driven through `stream` in a worker thread.
+        """
+        return False
+
     def run(self, message: str, conv_id: str, history: list, **kwargs):  # type: ignore
         """Execute the reasoning pipeline"""
         raise NotImplementedError
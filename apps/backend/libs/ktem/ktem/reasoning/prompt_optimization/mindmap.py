@@ -77,21 +77,36 @@ Use the template like this:
 
         return text
 
-    def run(self, question: str, context: str) -> Document:  # type: ignore
+    def prepare_messages(self, question: str, context: str) -> list:
         prompt_template = PromptTemplate(self.prompt_template)
         prompt = prompt_template.populate(
             question=question,
             context=context,
         )
 
-        messages = [
+        return [
             SystemMessage(content=self.SYSTEM_PROMPT),
             HumanMessage(content=prompt),
         ]
 
+    def run(self, question: str, context: str) -> Document:  # type: ignore
+        messages = self.prepare_messages(question, context)
+
         uml_text = self.llm(messages).text
         markdown_text = self.convert_uml_to_markdown(uml_text)
 
         return Document(
             text=markdown_text,
         )
+
+    async def ainvoke(  # type: ignore
+        self, question: str, context: str
+    ) -> Document:
+        messages = self.prepare_messages(question, context)
+
+        uml_text = (await self.llm.ainvoke(messages)).text
+        markdown_text = self.convert_uml_to_markdown(uml_text)
+
+        return Document(
+            text=markdown_text,
+        )
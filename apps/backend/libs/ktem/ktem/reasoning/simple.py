@@ -1,10 +1,14 @@
+import asyncio
 import logging
+import queue
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from textwrap import dedent
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 from decouple import config
 from ktem.embeddings.manager import embedding_models_manager as embeddings
+from ktem.index.file.base import BaseFileIndexRetriever
 from ktem.llms.manager import llms
 from ktem.reasoning.prompt_optimization import (
     DecomposeQuestionPipeline,
@@ -124,13 +128,41 @@ class FullQAPipeline(BaseReasoning):
             # like "Hello", "I need help"...
             query = message
 
-        docs, doc_ids = [], []
-        plot_docs = []
-
+        results = []
         for idx, retriever in enumerate(self.retrievers):
             retriever_node = self._prepare_child(retriever, f"retriever_{idx}")
-            retriever_docs = retriever_node(text=query)
+            results.append(retriever_node(text=query))
+
+        return self.merge_retrieved(results)
+
+    async def aretrieve(
+        self, message: str, history: list
+    ) -> tuple[list[RetrievedDocument], list[Document]]:
+        """Async version of `retrieve`, querying all retrievers concurrently"""
+        query = message
+
+        async def _retrieve(idx, retriever):
+            retriever_node = self._prepare_child(retriever, f"retriever_{idx}")
+            if isinstance(retriever_node, BaseFileIndexRetriever):
+                return await retriever_node.ainvoke(text=query)
+            return await asyncio.to_thread(retriever_node, text=query)
+
+        results = await asyncio.gather(
+            *[
+                _retrieve(idx, retriever)
+                for idx, retriever in enumerate(self.retrievers)
+            ]
+        )
+        return self.merge_retrieved(results)
 
+    def merge_retrieved(
+        self, results: list[list[RetrievedDocument]]
+    ) -> tuple[list[RetrievedDocument], list[Document]]:
+        """Merge the per-retriever results into de-duplicated text and plot docs"""
+        docs, doc_ids = [], []
+        plot_docs = []
+
+        for retriever_docs in results:
             retriever_docs_text = []
             retriever_docs_plot = []
 
@@ -190,13 +222,12 @@ class FullQAPipeline(BaseReasoning):
         return mindmap_content
 
     def prepare_citation_viz(self, answer, question, docs) -> Document | None:
-        doc_texts = [doc.text for doc in docs]
         citation_plot = None
         plot_content = None
 
         if answer.metadata["citation_viz"] and len(docs) > 1:
             try:
-                citation_plot = self.create_citation_viz_pipeline(doc_texts, question)
+                citation_plot = self.create_citation_viz_pipeline(docs, question)
             except Exception as e:
                 print("Failed to create citation plot:", e)
 
@@ -260,10 +291,90 @@ class FullQAPipeline(BaseReasoning):
             if without_citation:
                 yield from without_citation
 
+    @classmethod
+    def supports_astream(cls) -> bool:
+        return True
+
     async def ainvoke(  # type: ignore
         self, message: str, conv_id: str, history: list, **kwargs  # type: ignore
     ) -> Document:  # type: ignore
-        raise NotImplementedError
+        answer = Document(text="")
+        async for response in self.astream(message, conv_id, history, **kwargs):
+            if response.channel is None:
+                answer = response
+        return answer
+
+    async def astream(  # type: ignore
+        self, message: str, conv_id: str, history: list, **kwargs  # type: ignore
+    ) -> AsyncGenerator[Document, None]:
+        """Async version of `stream`
+
+        As async generators cannot return a value, the final answer is yielded
+        last as a Document without channel.
+        """
+        if self.use_rewrite and self.rewrite_pipeline:
+            print("Chosen rewrite pipeline", self.rewrite_pipeline)
+            message = (
+                await asyncio.to_thread(self.rewrite_pipeline, question=message)
+            ).text
+            print("Rewrite result", message)
+
+        docs, plot_docs = await self.aretrieve(message, history)
+        print(f"Got {len(docs)} retrieved documents")
+
+        for doc in plot_docs:
+            yield Document(channel="plot", content=doc.metadata.get("data", ""))
+
+        evidence_mode, evidence, images = (
+            await asyncio.to_thread(self.evidence_pipeline, docs)
+        ).content
+
+        # generate relevant score concurrently with the answer
+        if evidence and self.retrievers:
+            scoring_task = asyncio.create_task(
+                self.retrievers[0].agenerate_relevant_scores(message, docs)
+            )
+        else:
+            scoring_task = None
+
+        answer = Document(text="")
+        try:
+            async for response in self.answering_pipeline.astream(
+                question=message,
+                history=history,
+                evidence=evidence,
+                evidence_mode=evidence_mode,
+                images=images,
+                conv_id=conv_id,
+                **kwargs,
+            ):
+                if response.channel is None:
+                    answer = response
+                else:
+                    yield response
+        except BaseException:
+            if scoring_task:
+                scoring_task.cancel()
+            raise
+
+        # check <think> tag from reasoning models
+        processed_answer = replace_think_tag_with_details(answer.text)
+        if processed_answer != answer.text:
+            # clear the chat message and render again
+            yield Document(channel="chat", content=None)
+            yield Document(channel="chat", content=processed_answer)
+
+        if scoring_task:
+            docs = await scoring_task
+
+        # citation viz embeds the documents, keep it off the event loop
+        addons = await asyncio.to_thread(
+            lambda: list(self.show_citations_and_addons(answer, docs, message))
+        )
+        for addon in addons:
+            yield addon
+
+        yield answer
 
     def stream(  # type: ignore
         self, message: str, conv_id: str, history: list, **kwargs  # type: ignore
@@ -369,6 +480,16 @@ class FullQAPipeline(BaseReasoning):
         )
         answer_pipeline.enable_mindmap = settings[f"{prefix}.create_mindmap"]
         answer_pipeline.enable_citation_viz = settings[f"{prefix}.create_citation_viz"]
+        if answer_pipeline.enable_citation_viz:
+            # plot the stored vectors of the first index, with its embedding model
+            for retriever in retrievers:
+                vector_store = getattr(retriever, "VS", None)
+                embedding = getattr(retriever, "embedding", None)
+                if vector_store is not None and embedding is not None:
+                    citation_viz_pipeline = pipeline.create_citation_viz_pipeline
+                    citation_viz_pipeline.vector_store = vector_store
+                    citation_viz_pipeline.embedding = embedding
+                    break
         answer_pipeline.use_multimodal = settings[f"{prefix}.use_multimodal"]
         answer_pipeline.system_prompt = settings[f"{prefix}.system_prompt"]
         answer_pipeline.qa_template = settings[f"{prefix}.qa_prompt"]
@@ -481,9 +602,84 @@ class FullQAPipeline(BaseReasoning):
 
 
 class FullDecomposeQAPipeline(FullQAPipeline):
+    # number of sub-questions answered concurrently, by default 1 to answer them in
+    # turn. The workers share the retrievers, evidence and answering pipelines,
+    # so raise it only with components that are safe to call from several threads
+    sub_question_workers: int = config("KH_SUB_QUESTION_WORKERS", default=1, cast=int)
+
+    @classmethod
+    def supports_astream(cls) -> bool:
+        return False
+
+    def shared_retrieve(self, history: list):
+        """Make a `retrieve` that runs once for sub-questions with the same text"""
+        results: dict[str, Future] = {}
+        lock = threading.Lock()
+
+        def retrieve(message: str) -> tuple[list[RetrievedDocument], list[Document]]:
+            key = " ".join(message.lower().split())
+            with lock:
+                result = results.get(key)
+                is_owner = result is None
+                if is_owner:
+                    result = results[key] = Future()
+
+            if is_owner:
+                try:
+                    result.set_result(self.retrieve(message, history))
+                except Exception as e:
+                    result.set_exception(e)
+            return result.result()
+
+        return retrieve
+
+    def answer_sub_question(
+        self,
+        message: str,
+        conv_id: str,
+        history: list,
+        retrieve,
+        output: queue.Queue,
+        **kwargs,
+    ) -> Document:
+        """Answer a sub-question, putting the streamed Documents in `output`
+
+        `None` is put in `output` once the answer is complete, or has failed.
+        """
+        try:
+            docs, infos = retrieve(message)
+            print(f"Got {len(docs)} retrieved documents")
+            for info in infos:
+                output.put(info)
+
+            evidence_mode, evidence, images = self.evidence_pipeline(docs).content
+            stream = self.answering_pipeline.stream(
+                question=message,
+                history=history,
+                evidence=evidence,
+                evidence_mode=evidence_mode,
+                images=images,
+                conv_id=conv_id,
+                **kwargs,
+            )
+            while True:
+                try:
+                    output.put(next(stream))
+                except StopIteration as e:
+                    return e.value
+        finally:
+            output.put(None)
+
     def answer_sub_questions(
         self, messages: list, conv_id: str, history: list, **kwargs
     ):
+        if self.sub_question_workers > 1 and len(messages) > 1:
+            return (
+                yield from self.answer_sub_questions_concurrently(
+                    messages, conv_id, history, **kwargs
+                )
+            )
+
         output_str = ""
         for idx, message in enumerate(messages):
             yield Document(
@@ -514,6 +710,57 @@ class FullDecomposeQAPipeline(FullQAPipeline):
 
         return output_str
 
+    def answer_sub_questions_concurrently(
+        self, messages: list, conv_id: str, history: list, **kwargs
+    ):
+        """Answer the sub-questions on a bounded pool
+
+        The output of each sub-question is buffered, and streamed once all the
+        sub-questions before it are done, so that it reads in order.
+        """
+        retrieve = self.shared_retrieve(history)
+        outputs: list[queue.Queue] = [queue.Queue() for _ in messages]
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.sub_question_workers, len(messages)),
+            thread_name_prefix="sub-question",
+        )
+        try:
+            futures = [
+                executor.submit(
+                    self.answer_sub_question,
+                    message,
+                    conv_id,
+                    history,
+                    retrieve,
+                    output,
+                    **kwargs,
+                )
+                for message, output in zip(messages, outputs)
+            ]
+
+            output_str = ""
+            for idx, (message, output, future) in enumerate(
+                zip(messages, outputs, futures)
+            ):
+                yield Document(
+                    channel="chat",
+                    content=f"<br><b>Sub-question {idx + 1}</b>"
+                    f"<br>{message}<br><b>Answer</b><br>",
+                )
+                while (response := output.get()) is not None:
+                    yield response
+
+                answer = future.result()
+                output_str += (
+                    f"Sub-question {idx + 1}-th: '{message}'\n"
+                    f"Answer: '{answer.text}'\n\n"
+                )
+        finally:
+            # the answer was cancelled or failed, drop the queued sub-questions
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return output_str
+
     def stream(  # type: ignore
         self, message: str, conv_id: str, history: list, **kwargs  # type: ignore
     ) -> Generator[Document, None, Document]:
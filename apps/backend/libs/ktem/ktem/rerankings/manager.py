@@ -54,11 +54,17 @@ class RerankingManager:
     def load_vendors(self):
         from kotaemon.rerankings import (
             CohereReranking,
+            FastEmbedReranking,
             TeiFastReranking,
             VoyageAIReranking,
         )
 
-        self._vendors = [TeiFastReranking, CohereReranking, VoyageAIReranking]
+        self._vendors = [
+            TeiFastReranking,
+            CohereReranking,
+            VoyageAIReranking,
+            FastEmbedReranking,
+        ]
 
     def __getitem__(self, key: str) -> BaseReranking:
         """Get model by name"""
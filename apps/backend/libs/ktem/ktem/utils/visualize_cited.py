@@ -6,15 +6,22 @@ Refs:
 1. [RAGxplorer](https://github.com/gabrielchua/RAGxplorer)
 2. [RAGVizExpander](https://github.com/KKenny0/RAGVizExpander)
 """
-from typing import List, Tuple
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
 import umap
 
-from kotaemon.base import BaseComponent
+from kotaemon.base import BaseComponent, Document
 from kotaemon.embeddings import BaseEmbeddings
+from kotaemon.embeddings.cache import embedding_model_id
+from kotaemon.storages import BaseVectorStore
+
+logger = logging.getLogger(__name__)
 
 VISUALIZATION_SETTINGS = {
     "Original Query": {"color": "red", "opacity": 1, "symbol": "cross", "size": 15},
@@ -24,27 +31,78 @@ VISUALIZATION_SETTINGS = {
 }
 
 
-class CreateCitationVizPipeline(BaseComponent):
-    """Creating PlotData for visualizing query results"""
+# UMAP projectors fitted for a selection of files, reused by the next questions
+PROJECTOR_CACHE_SIZE = 16
+_projectors: OrderedDict[tuple, umap.UMAP] = OrderedDict()
+_projectors_lock = threading.Lock()
 
-    embedding: BaseEmbeddings
-    projector: umap.UMAP = None
 
-    def _set_up_umap(self, embeddings: np.ndarray):
-        umap_transform = umap.UMAP().fit(embeddings)
-        return umap_transform
+class PCAProjector:
+    """Project vectors on the two main axes of the fitted ones"""
+
+    def fit(self, embeddings: np.ndarray) -> "PCAProjector":
+        self.mean_ = embeddings.mean(axis=0)
+        _, _, components = np.linalg.svd(embeddings - self.mean_, full_matrices=False)
+        self.components_ = components[:2]
+        return self
 
-    def _project_embeddings(self, embeddings, umap_transform) -> np.ndarray:
-        umap_embeddings = np.empty((len(embeddings), 2))
-        for i, embedding in enumerate(embeddings):
-            umap_embeddings[i] = umap_transform.transform([embedding])
-        return umap_embeddings
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        projections = np.zeros((len(embeddings), 2))
+        n_components = len(self.components_)
+        projections[:, :n_components] = (embeddings - self.mean_) @ self.components_.T
+        return projections
+
+
+class CreateCitationVizPipeline(BaseComponent):
+    """Creating PlotData for visualizing query results
 
-    def _get_projections(self, embeddings, umap_transform):
-        projections = self._project_embeddings(embeddings, umap_transform)
-        x = projections[:, 0]
-        y = projections[:, 1]
-        return x, y
+    The vectors of retrieved chunks are read from `vector_store` when set, which
+    must then hold vectors of the `embedding` model, and only the other texts
+    are embedded. Fewer than `umap_min_points` vectors are projected with PCA,
+    larger sets with UMAP, fitted once per selection of files.
+    """
+
+    embedding: BaseEmbeddings
+    vector_store: Optional[BaseVectorStore] = None
+    umap_min_points: int = 50
+
+    def _get_vectors(self, docs: list[Document]) -> np.ndarray:
+        """The vectors of `docs`, from the vector store when they are stored"""
+        vectors: dict[str, np.ndarray] = {}
+        if self.vector_store is not None:
+            try:
+                vectors = self.vector_store.get_vectors([doc.doc_id for doc in docs])
+            except Exception as e:
+                logger.warning(f"Cannot read the stored vectors: {e}")
+
+        missing = [doc for doc in docs if doc.doc_id not in vectors]
+        if missing:
+            embedded = self.get_from_path("embedding").embed_batch(missing)
+            vectors.update(zip([doc.doc_id for doc in missing], embedded.vectors))
+
+        return np.stack([vectors[doc.doc_id] for doc in docs]).astype(np.float32)
+
+    def _get_projector(self, docs: list[Document], embeddings: np.ndarray):
+        if len(embeddings) < self.umap_min_points:
+            return PCAProjector().fit(embeddings)
+
+        file_ids = {doc.metadata.get("file_id") for doc in docs}
+        if None in file_ids:
+            return umap.UMAP().fit(embeddings)
+
+        key = (embedding_model_id(self.embedding), tuple(sorted(file_ids)))
+        with _projectors_lock:
+            projector = _projectors.get(key)
+            if projector is not None:
+                _projectors.move_to_end(key)
+                return projector
+
+        projector = umap.UMAP().fit(embeddings)
+        with _projectors_lock:
+            _projectors[key] = projector
+            while len(_projectors) > PROJECTOR_CACHE_SIZE:
+                _projectors.popitem(last=False)
+        return projector
 
     def _prepare_projection_df(
         self,
@@ -110,31 +168,33 @@ class CreateCitationVizPipeline(BaseComponent):
         )
         return fig
 
-    def run(self, context: List[str], question: str):
-        embed_contexts = self.embedding(context)
-        context_embeddings = np.array([d.embedding for d in embed_contexts])
-
-        self.projector = self._set_up_umap(embeddings=context_embeddings)
-
-        embed_query = self.embedding(question)
-        query_projection = self._get_projections(
-            embeddings=[embed_query[0].embedding], umap_transform=self.projector
+    def run(self, context: List[str] | List[Document], question: str):
+        docs = [
+            doc if isinstance(doc, Document) else Document(text=doc)
+            for doc in context
+        ]
+        context_embeddings = self._get_vectors(docs)
+        query_embedding = self.get_from_path("embedding").embed_batch([question])
+
+        projector = self._get_projector(docs, context_embeddings)
+        # the chunks and the query are projected in a single call
+        projections = projector.transform(
+            np.concatenate([context_embeddings, query_embedding.vectors])
         )
+
         viz_query_df = pd.DataFrame(
             {
-                "x": [query_projection[0][0]],
-                "y": [query_projection[1][0]],
+                "x": [projections[-1, 0]],
+                "y": [projections[-1, 1]],
                 "document_cleaned": question,
                 "category": "Original Query",
                 "size": 5,
             }
         )
 
-        context_projections = self._get_projections(
-            embeddings=context_embeddings, umap_transform=self.projector
-        )
         viz_base_df = self._prepare_projection_df(
-            document_projections=context_projections, document_text=context
+            document_projections=(projections[:-1, 0], projections[:-1, 1]),
+            document_text=[doc.text for doc in docs],
         )
 
         visualization_df = pd.concat([viz_base_df, viz_query_df], axis=0)
@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from ktem.index.file.graph import rate_limit
+from ktem.index.file.graph.rate_limit import AdaptiveRateLimiter, is_rate_limit_error
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class APIError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(APIError("Too many requests", status_code=429))
+    error = Exception("Too many requests")
+    error.response = SimpleNamespace(status_code=429)  # type: ignore
+    assert is_rate_limit_error(error)
+    assert is_rate_limit_error(RateLimitError("slow down"))
+
+    assert not is_rate_limit_error(APIError("context of 4290 tokens", 400))
+    assert not is_rate_limit_error(ValueError("request id req_429abc failed"))
+
+
+def test_reserve_waits_once_the_burst_is_spent(clock):
+    limiter = AdaptiveRateLimiter(rate=2.0, burst=2)
+    assert limiter._reserve() == 0.0
+    assert limiter._reserve() == 0.0
+    assert limiter._reserve() == pytest.approx(0.5)
+    assert limiter._reserve() == pytest.approx(1.0)
+
+    clock.now += 10
+    assert limiter._reserve() == 0.0
+
+
+def test_no_limit_until_rate_limited(clock):
+    limiter = AdaptiveRateLimiter()
+    for _ in range(10):
+        assert limiter._reserve() == 0.0
+        clock.now += 1
+
+    # 10 requests over the last 10 seconds
+    limiter.on_rate_limit()
+    assert limiter.rate == pytest.approx(0.5)
+    assert limiter._reserve() > 0
+
+
+def test_backoff_and_recovery(clock):
+    limiter = AdaptiveRateLimiter(rate=4.0, increase=0.5, cooldown=2.0)
+
+    limiter.on_rate_limit()
+    assert limiter.rate == pytest.approx(2.0)
+
+    # the requests in flight fail too, within the cooldown
+    clock.now += 1
+    limiter.on_rate_limit()
+    assert limiter.rate == pytest.approx(2.0)
+
+    clock.now += 2
+    limiter.on_rate_limit()
+    assert limiter.rate == pytest.approx(1.0)
+
+    for _ in range(3):
+        limiter.on_success()
+    assert limiter.rate == pytest.approx(2.5)
+
+    # never above the initial rate
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.rate == pytest.approx(4.0)
+
+
+def test_backoff_stops_at_min_rate(clock):
+    limiter = AdaptiveRateLimiter(rate=0.1, min_rate=0.08, cooldown=0)
+    for _ in range(5):
+        limiter.on_rate_limit()
+        clock.now += 1
+    assert limiter.rate == pytest.approx(0.08)
+
+
+def test_acquire_sleeps_for_the_reserved_delay(clock, monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(rate_limit, "asyncio", SimpleNamespace(sleep=fake_sleep))
+    limiter = AdaptiveRateLimiter(rate=1.0, burst=1)
+
+    async def acquire_twice():
+        await limiter.acquire()
+        await limiter.acquire()
+
+    asyncio.run(acquire_twice())
+    assert delays == [pytest.approx(1.0)]
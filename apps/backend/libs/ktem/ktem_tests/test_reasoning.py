@@ -0,0 +1,75 @@
+import re
+import threading
+
+from ktem.reasoning.simple import FullDecomposeQAPipeline
+
+from kotaemon.base import BaseComponent, Document, LLMInterface, RetrievedDocument
+from kotaemon.indices.qa.citation_qa import AnswerWithContextPipeline
+from kotaemon.llms import ChatLLM
+
+
+class FactRetriever(BaseComponent):
+    def run(self, text: str) -> list[RetrievedDocument]:
+        return [
+            RetrievedDocument(
+                text=f"fact about {text}",
+                id_=text,
+                metadata={"file_name": "facts.txt"},
+            )
+        ]
+
+
+class EchoFactLLM(ChatLLM):
+    """Answers with the fact of its prompt, once `barrier` lets it through"""
+
+    barrier: threading.Barrier
+
+    def run(self, messages, **kwargs) -> LLMInterface:
+        text = "".join(chunk.text for chunk in self.stream(messages))
+        return LLMInterface(content=text)
+
+    def stream(self, messages, **kwargs):
+        # wait until every sub-question is being answered at the same time
+        self.barrier.wait()
+        prompt = messages[-1].content
+        yield LLMInterface(content=re.search(r"fact about \w+", prompt).group())
+
+
+def test_answer_sub_questions_concurrently():
+    llm = EchoFactLLM(barrier=threading.Barrier(2, timeout=10))
+    answering_pipeline = AnswerWithContextPipeline(
+        llm=llm,
+        enable_citation=False,
+        enable_mindmap=False,
+        enable_citation_viz=False,
+    )
+    pipeline = FullDecomposeQAPipeline(
+        retrievers=[FactRetriever()],
+        answering_pipeline=answering_pipeline,
+        sub_question_workers=2,
+    )
+
+    output = pipeline.answer_sub_questions(
+        ["rent", "deposit"], conv_id="", history=[]
+    )
+    chat = []
+    while True:
+        try:
+            doc = next(output)
+        except StopIteration as e:
+            summary = e.value
+            break
+        if isinstance(doc, Document) and doc.channel == "chat":
+            chat.append(doc.text)
+
+    # streamed in the order of the sub-questions, each with its own answer
+    assert chat == [
+        "<br><b>Sub-question 1</b><br>rent<br><b>Answer</b><br>",
+        "fact about rent",
+        "<br><b>Sub-question 2</b><br>deposit<br><b>Answer</b><br>",
+        "fact about deposit",
+    ]
+    assert summary == (
+        "Sub-question 1-th: 'rent'\nAnswer: 'fact about rent'\n\n"
+        "Sub-question 2-th: 'deposit'\nAnswer: 'fact about deposit'\n\n"
+    )
@@ -0,0 +1,52 @@
+"""add indexes to the file index relation tables
+
+Revision ID: e8bfb6b58fdc
+Revises:
+Create Date: 2026-10-18 02:30:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e8bfb6b58fdc"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# each file index owns a `index__{id}__index` table, created at runtime
+INDEX_TABLE_PATTERN = re.compile(r"^index__\d+__index$")
+INDEX_COLUMNS = {
+    "source_id_relation_type": ["source_id", "relation_type"],
+    "target_id_relation_type": ["target_id", "relation_type"],
+}
+
+
+def _index_tables() -> list[str]:
+    inspector = sa.inspect(op.get_bind())
+    return [
+        name for name in inspector.get_table_names() if INDEX_TABLE_PATTERN.match(name)
+    ]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table in _index_tables():
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        for suffix, columns in INDEX_COLUMNS.items():
+            name = f"ix_{table}_{suffix}"
+            if name not in existing:
+                op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table in _index_tables():
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        for suffix in INDEX_COLUMNS:
+            name = f"ix_{table}_{suffix}"
+            if name in existing:
+                op.drop_index(name, table_name=table)
@@ -1,7 +1,12 @@
 import asyncio
+import concurrent.futures
 import os
+import shutil
+import threading
+import time
+import uuid
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
 from copy import deepcopy
 import json
 import re
@@ -22,6 +27,219 @@ from ktem.utils.lang import SUPPORTED_LANGUAGE_MAP
 app_state = {}
 models_ready = asyncio.Event()
 
+# --- Chat streaming workers ---
+# Reasoning pipelines are synchronous generators (retrieval, embedding calls and
+# LLM token reads all block), so they are driven on a bounded pool of worker
+# threads and hand their chunks to the event loop through a bounded queue.
+CHAT_WORKERS = config("KH_CHAT_WORKERS", default=8, cast=int)
+CHAT_QUEUE_SIZE = config("KH_CHAT_QUEUE_SIZE", default=64, cast=int)
+chat_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=CHAT_WORKERS, thread_name_prefix="chat-worker"
+)
+
+_STREAM_END = object()
+
+
+class _StreamError:
+    """Carries an exception raised by the worker over to the event loop"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def stream_in_executor(
+    make_stream: Callable[[], Iterator[Any]],
+    executor: concurrent.futures.Executor,
+    maxsize: int = CHAT_QUEUE_SIZE,
+    poll_interval: float = 0.5,
+) -> AsyncIterator[Any]:
+    """Drive a blocking generator on `executor` and yield its items asynchronously
+
+    The worker blocks while the queue is full, so a slow client applies
+    backpressure to the pipeline instead of buffering the whole answer. When the
+    consumer stops iterating (e.g. the client disconnects and the response is
+    cancelled), the worker stops pulling from the generator and closes it.
+
+    Args:
+        make_stream: callable returning the generator, invoked inside the worker
+        executor: the pool that runs the generator
+        maxsize: maximum number of chunks buffered between worker and event loop
+        poll_interval: how often a blocked worker re-checks for cancellation
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+    cancelled = threading.Event()
+
+    def put(item) -> bool:
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=poll_interval)
+                return True
+            except concurrent.futures.TimeoutError:
+                if cancelled.is_set():
+                    future.cancel()
+                    return False
+
+    def produce():
+        if cancelled.is_set():
+            # the client went away while this job was waiting for a worker
+            return
+        stream = None
+        try:
+            stream = make_stream()
+            for item in stream:
+                if cancelled.is_set() or not put(item):
+                    break
+        except Exception as e:
+            put(_StreamError(e))
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            if not cancelled.is_set():
+                put(_STREAM_END)
+
+    loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, _StreamError):
+                raise item.error
+            yield item
+    finally:
+        cancelled.set()
+
+
+# --- Indexing jobs ---
+# Batch uploads are written to disk, then indexed by a background worker. The
+# progress of each job is recorded so that it can be streamed to the uploader
+# and polled later, even after the uploading client went away.
+INDEXING_JOB_WORKERS = config("KH_INDEXING_JOB_WORKERS", default=1, cast=int)
+INDEXING_JOB_HISTORY = config("KH_INDEXING_JOB_HISTORY", default=100, cast=int)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+indexing_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=INDEXING_JOB_WORKERS, thread_name_prefix="indexing-worker"
+)
+indexing_jobs: "dict[str, IndexingJob]" = {}
+
+
+class IndexingJob:
+    """Progress of the indexing of a batch of uploaded files
+
+    Events are appended by the indexing worker thread and read by any number of
+    followers on the event loop.
+    """
+
+    def __init__(self, job_id: str, user_id: str, file_names: List[str]):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.files = [
+            {"file_name": name, "status": "queued", "file_id": None, "error": None}
+            for name in file_names
+        ]
+        self.events: List[dict] = []
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def publish(self, event_type: str, data: Any):
+        """Record an event, called from the indexing worker"""
+        self.events.append({"type": event_type, "data": data})
+        try:
+            self._loop.call_soon_threadsafe(self._notify)
+        except RuntimeError:
+            # the event loop is closed, nobody is following anymore
+            pass
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, start: int = 0) -> AsyncIterator[dict]:
+        """Yield the events from `start`, until the job is finished"""
+        cursor = start
+        while True:
+            changed = self._changed
+            while cursor < len(self.events):
+                yield self.events[cursor]
+                cursor += 1
+            if self.finished:
+                return
+            await changed.wait()
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "n_events": len(self.events),
+            "files": [dict(file) for file in self.files],
+        }
+
+
+def run_indexing_job(job: IndexingJob, pipeline, paths: List[Path], job_dir: Path):
+    """Index the files of a job, in an indexing worker thread"""
+    job.status = "running"
+    job.publish("job", job.summary())
+    names = [file["file_name"] for file in job.files]
+    try:
+        stream = pipeline.stream([str(path) for path in paths], reindex=True)
+        while True:
+            try:
+                response = next(stream)
+            except StopIteration as e:
+                file_ids, errors, _ = e.value
+                break
+            if response is None or not response.content:
+                continue
+            if response.channel == "index":
+                # Path objects in the content aren't JSON serializable
+                content = {
+                    key: value
+                    for key, value in response.content.items()
+                    if key != "file_path"
+                }
+                if content.get("file_name") in names:
+                    job.files[names.index(content["file_name"])]["status"] = content[
+                        "status"
+                    ]
+                job.publish("index", content)
+            elif response.channel == "debug":
+                job.publish("debug", str(response.content))
+
+        for file, file_id, error in zip(job.files, file_ids, errors):
+            file["file_id"] = file_id
+            file["error"] = error
+            file["status"] = "failed" if error else "success"
+        job.status = "completed"
+    except Exception as e:
+        print(f"Error in indexing job {job.job_id}: {e}")
+        for file in job.files:
+            if file["status"] in ("queued", "running"):
+                file["status"] = "failed"
+                file["error"] = str(e)
+        job.status = "failed"
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        job.finished_at = time.time()
+        job.publish("done", job.summary())
+
+
+def prune_indexing_jobs():
+    """Forget the oldest finished jobs beyond `KH_INDEXING_JOB_HISTORY`"""
+    finished = [job for job in indexing_jobs.values() if job.finished]
+    for job in finished[: max(len(finished) - INDEXING_JOB_HISTORY, 0)]:
+        indexing_jobs.pop(job.job_id, None)
+
 
 class Settings:
     """A simple class to hold our application settings."""
@@ -114,7 +332,39 @@ class Settings:
         self.KH_DOCSTORE = {
             "__type__": "kotaemon.storages.LanceDBDocumentStore",
             "path": str(self.KH_USER_DATA_DIR / "docstore"),
+            "fts_refresh_delay": config(
+                "KH_DOCSTORE_FTS_REFRESH_DELAY", default=5.0, cast=float
+            ),
+        }
+        self.KH_QUERY_EMBEDDING_CACHE = {
+            "maxsize": config("KH_QUERY_EMBEDDING_CACHE_SIZE", default=4096, cast=int),
+            "ttl": config("KH_QUERY_EMBEDDING_CACHE_TTL", default=0, cast=float) or None,
+            "path": config(
+                "KH_QUERY_EMBEDDING_CACHE_PATH",
+                default=str(self.KH_APP_DATA_DIR / "cache" / "query_embeddings.db"),
+            ),
         }
+        # parallel loading is opt-in, see flowsettings.py
+        self.KH_INGESTION_WORKERS = config("KH_INGESTION_WORKERS", default=1, cast=int)
+        self.KH_INGESTION_EMBEDDING_WORKERS = config(
+            "KH_INGESTION_EMBEDDING_WORKERS", default=4, cast=int
+        )
+        self.KH_INGESTION_MAX_FILES_IN_FLIGHT = config(
+            "KH_INGESTION_MAX_FILES_IN_FLIGHT", default=16, cast=int
+        )
+        self.KH_CHUNK_EMBEDDING_CACHE = {
+            "path": config(
+                "KH_CHUNK_EMBEDDING_CACHE_PATH",
+                default=str(self.KH_APP_DATA_DIR / "cache" / "chunk_embeddings.db"),
+            ),
+            "ttl": config("KH_CHUNK_EMBEDDING_CACHE_TTL", default=0, cast=float) or None,
+        }
+        self.KH_LIGHTRAG_MAX_CONCURRENT_INSERTS = config(
+            "KH_LIGHTRAG_MAX_CONCURRENT_INSERTS", default=4, cast=int
+        )
+        self.KH_LIGHTRAG_LLM_REQUESTS_PER_MINUTE = config(
+            "KH_LIGHTRAG_LLM_REQUESTS_PER_MINUTE", default=0, cast=float
+        )
         self.KH_VECTORSTORE = {
             "__type__": "kotaemon.storages.ChromaVectorStore",
             "path": str(self.KH_USER_DATA_DIR / "vectorstore"),
@@ -312,6 +562,20 @@ def healthz():
     return {"status": "ok"}
 
 
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit/miss counters of the query embedding cache tiers."""
+    await models_ready.wait()
+    from ktem.components import get_query_embedding_caches
+
+    return {
+        "query_embeddings": [
+            {"tier": cache.__class__.__name__, **cache.cache_info()}
+            for cache in get_query_embedding_caches()
+        ]
+    }
+
+
 @app.on_event("startup")
 async def startup_event():
     """Starts the server immediately and kicks off background loading."""
@@ -399,11 +663,21 @@ async def chat(request: ChatRequest):
 
         pipeline = reasoning_cls.get_pipeline(request_settings, {}, retrievers)
 
+        if reasoning_cls.supports_astream():
+            responses = pipeline.astream(
+                request.message, request.conversation_id, request.history
+            )
+        else:
+            responses = stream_in_executor(
+                lambda: pipeline.stream(
+                    request.message, request.conversation_id, request.history
+                ),
+                chat_executor,
+            )
+
         async def stream_generator():
             try:
-                for response in pipeline.stream(
-                    request.message, request.conversation_id, request.history
-                ):
+                async for response in responses:
                     if response.channel and response.content:
                         yield json.dumps({"type": response.channel, "data": response.content}) + "\n"
             except Exception as e:
@@ -416,26 +690,31 @@ async def chat(request: ChatRequest):
         print(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_file_indexing_pipeline(user_id: str):
+    """Build the indexing pipeline of the 'File Collection' index"""
+    index_manager = app_state["index_manager"]
+    # Find and use the 'File Collection' index specifically
+    file_collection_index = next((idx for idx in index_manager.indices if idx.name == "File Collection"), None)
+    if not file_collection_index:
+        raise HTTPException(status_code=500, detail="'File Collection' index not found.")
+
+    settings = app_state["settings"]
+
+    # --- FINAL FIX: Make a copy and force OpenAI embeddings for indexing ---
+    request_settings = deepcopy(settings)
+    index_id_str = str(file_collection_index.id)
+    request_settings[f"index.options.{index_id_str}.embedding_model"] = "openai"
+    print(f"--- FINAL FIX APPLIED: Forcing openai embedding for indexing on index {index_id_str} ---")
+    # ---
+
+    return file_collection_index.get_indexing_pipeline(request_settings, user_id)
+
+
 @app.post("/upload")
 async def upload(file: UploadFile = File(...), user_id: str = "default"):
     await models_ready.wait()
     try:
-        index_manager = app_state["index_manager"]
-        # Find and use the 'File Collection' index specifically
-        file_collection_index = next((idx for idx in index_manager.indices if idx.name == "File Collection"), None)
-        if not file_collection_index:
-            raise HTTPException(status_code=500, detail="'File Collection' index not found.")
-        
-        settings = app_state["settings"]
-
-        # --- FINAL FIX: Make a copy and force OpenAI embeddings for indexing ---
-        request_settings = deepcopy(settings)
-        index_id_str = str(file_collection_index.id)
-        request_settings[f"index.options.{index_id_str}.embedding_model"] = "openai"
-        print(f"--- FINAL FIX APPLIED: Forcing openai embedding for indexing on index {index_id_str} ---")
-        # ---
-
-        indexing_pipeline = file_collection_index.get_indexing_pipeline(request_settings, user_id)
+        indexing_pipeline = get_file_indexing_pipeline(user_id)
         
         # Save the file temporarily
         settings_obj = Settings()
@@ -483,6 +762,81 @@ async def upload(file: UploadFile = File(...), user_id: str = "default"):
         print(f"Error in upload endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...), user_id: str = "default", stream: bool = True
+):
+    """
+    Upload several files and index them in a background job.
+    The uploads are copied to disk in chunks. With `stream`, the job progress is
+    returned as NDJSON; otherwise the job id is returned right away and the
+    progress can be read from `/upload/jobs/{job_id}`.
+    """
+    await models_ready.wait()
+    from theflow.settings import settings as flowsettings
+
+    indexing_pipeline = get_file_indexing_pipeline(user_id)
+
+    # files are indexed under their upload name, so each job gets its own folder
+    job_id = uuid.uuid4().hex
+    job_dir = Path(flowsettings.KH_APP_DATA_DIR) / "uploads" / job_id
+    job_dir.mkdir(parents=True, exist_ok=True)
+
+    paths: List[Path] = []
+    try:
+        for file in files:
+            path = job_dir / Path(file.filename or "upload").name
+            if path in paths:
+                raise HTTPException(
+                    status_code=400, detail=f"Duplicate file name: {path.name}"
+                )
+            with open(path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(buffer.write, chunk)
+            paths.append(path)
+    except BaseException:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    job = IndexingJob(job_id, user_id, [path.name for path in paths])
+    indexing_jobs[job_id] = job
+    prune_indexing_jobs()
+    job.publish("job", job.summary())
+    indexing_executor.submit(run_indexing_job, job, indexing_pipeline, paths, job_dir)
+
+    if not stream:
+        return job.summary()
+
+    async def stream_generator():
+        # the job keeps running if the client disconnects
+        async for event in job.follow():
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(stream_generator(), media_type="application/x-ndjson")
+
+
+@app.get("/upload/jobs/{job_id}")
+async def upload_job_status(
+    job_id: str, user_id: str = "default", follow: bool = False, since: int = 0
+):
+    """
+    Status of an indexing job of `user_id`. With `follow`, stream its events as
+    NDJSON starting from the `since`-th event, until the job is finished.
+    """
+    job = indexing_jobs.get(job_id)
+    # the jobs of other users are reported as unknown, not as forbidden
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if not follow:
+        return job.summary()
+
+    async def stream_generator():
+        async for event in job.follow(start=since):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(stream_generator(), media_type="application/x-ndjson")
+
+
 @app.get("/files")
 async def list_files(user_id: str = "default"):
     await models_ready.wait()